@@ -0,0 +1,417 @@
+"""
+Risk analytics: hourly rollups of login and OTP outcomes, counted in memory and
+flushed by a background thread, plus a history backfill. See docs/design-notes.md.
+"""
+import argparse
+import atexit
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import JSONResponse
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+from app.config import ANALYTICS_ENABLED, ANALYTICS_FLUSH_INTERVAL_SECONDS, ANALYTICS_MAX_RANGE_DAYS
+from app.database import SessionLocal, dialect_insert, dispose_inherited_connections, get_db
+from app.models import LoginAttempt, RiskRollup
+from app.profiles import as_utc
+from app.replay import ReplayConfig, replay_attempts, score, shard_ranges, signal_results
+from app.risk_engine import RISK_THRESHOLD, RiskContext, RiskEvent, evaluate_signals
+
+router = APIRouter(prefix="/analytics", tags=["Analytics"])
+
+ALL = "*"
+KEY_COLUMNS = ["hour", "event", "risk_level", "signal", "outcome"]
+BACKFILL_BATCH_SIZE = 5000
+_CURRENT = ReplayConfig(name="current")
+
+
+def hour_of(moment: datetime) -> datetime:
+    return as_utc(moment).replace(minute=0, second=0, microsecond=0)
+
+
+def flagged_signals(risk_result: dict) -> list[str]:
+    """Signals that added points in an assess_risk result; skipped ones report flagged None."""
+    return [name for name, result in risk_result["signals"].items() if result["flagged"]]
+
+
+def upsert_counts(db: Session, counts: dict):
+    """Add {(hour, event, risk_level, signal, outcome): [count, risk_score_total]} to the rollups."""
+    if not counts:
+        return
+    rows = [dict(zip(KEY_COLUMNS, key), count=count, risk_score_total=total)
+            for key, (count, total) in counts.items()]
+    statement = dialect_insert(db.get_bind(), RiskRollup)
+    statement = statement.on_conflict_do_update(
+        index_elements=KEY_COLUMNS,
+        set_={
+            "count": RiskRollup.count + statement.excluded["count"],
+            "risk_score_total": RiskRollup.risk_score_total + statement.excluded["risk_score_total"],
+        },
+    )
+    for start in range(0, len(rows), BACKFILL_BATCH_SIZE):
+        db.execute(statement, rows[start:start + BACKFILL_BATCH_SIZE])
+
+
+def _add(counts: dict, hour: datetime, event: str, outcome: str, risk_level: str,
+         signals: list[str], risk_score: int):
+    for signal in (ALL, *signals):
+        entry = counts[(hour, event, risk_level, signal, outcome)]
+        entry[0] += 1
+        entry[1] += risk_score
+
+
+class RollupRecorder:
+    """Counts outcomes in memory and upserts them into risk_rollups on a daemon thread."""
+
+    def __init__(self, enabled: bool = ANALYTICS_ENABLED, interval: float = ANALYTICS_FLUSH_INTERVAL_SECONDS,
+                 session_factory=SessionLocal):
+        self.enabled = enabled
+        self.interval = interval
+        self.session_factory = session_factory
+        self._counts = defaultdict(lambda: [0, 0])
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+        self.recorded = 0
+        self.flushes = 0
+        self.rows_upserted = 0
+        self.last_error: str | None = None
+
+    def record(self, event: str, outcome: str, risk_level: str, signals: list[str] = (), risk_score: int = 0,
+               at: datetime | None = None):
+        if not self.enabled:
+            return
+        hour = hour_of(at or datetime.now(timezone.utc))
+        with self._lock:
+            _add(self._counts, hour, event, outcome, risk_level, signals, risk_score)
+            self.recorded += 1
+
+    def flush(self):
+        """Upsert everything counted so far; on failure the counts are kept for the next flush."""
+        with self._flush_lock:
+            with self._lock:
+                counts, self._counts = self._counts, defaultdict(lambda: [0, 0])
+            if not counts:
+                return
+            db = self.session_factory()
+            try:
+                upsert_counts(db, counts)
+                db.commit()
+                self.flushes += 1
+                self.rows_upserted += len(counts)
+                self.last_error = None
+            except Exception as exc:
+                db.rollback()
+                self.last_error = f"{type(exc).__name__}: {exc}"
+                print(f"[analytics] flush failed, keeping {len(counts)} rollup rows: {self.last_error}")
+                with self._lock:
+                    _merge(self._counts, counts)
+            finally:
+                db.close()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def start(self):
+        if self.enabled and self._thread is None and self.interval > 0:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="analytics-rollups", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the flusher and write what is still counted."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=30)
+            self._thread = None
+        self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "interval_seconds": self.interval,
+            "recorded": self.recorded,
+            "pending_rows": len(self._counts),
+            "flushes": self.flushes,
+            "rows_upserted": self.rows_upserted,
+            "last_error": self.last_error,
+        }
+
+
+recorder = RollupRecorder()
+
+# Last-chance flush for processes that exit without running the app lifespan
+atexit.register(recorder.stop)
+
+
+def record(event: str, outcome: str, risk_level: str, signals: list[str] = (), risk_score: int = 0):
+    recorder.record(event, outcome, risk_level, signals, risk_score)
+
+
+# --- Queries ---
+
+def _parse_time(value: str | None, default: datetime) -> datetime:
+    if not value:
+        return default
+    try:
+        return as_utc(datetime.fromisoformat(value.replace("Z", "+00:00")))
+    except ValueError:
+        raise HTTPException(status_code=422, detail=f"invalid time {value!r}; expected ISO 8601")
+
+
+def _time_range(start: str | None, end: str | None) -> tuple[datetime, datetime]:
+    end_at = _parse_time(end, hour_of(datetime.now(timezone.utc)) + timedelta(hours=1))
+    start_at = _parse_time(start, end_at - timedelta(hours=24))
+    if start_at >= end_at:
+        raise HTTPException(status_code=422, detail="start must be before end")
+    if end_at - start_at > timedelta(days=ANALYTICS_MAX_RANGE_DAYS):
+        raise HTTPException(status_code=422, detail=f"range is limited to {ANALYTICS_MAX_RANGE_DAYS} days")
+    return start_at, end_at
+
+
+def _rows(db: Session, start: datetime, end: datetime, by_hour: bool):
+    group = [RiskRollup.event, RiskRollup.risk_level, RiskRollup.signal, RiskRollup.outcome]
+    if by_hour:
+        group.insert(0, RiskRollup.hour)
+    return db.execute(
+        select(*group, func.sum(RiskRollup.count), func.sum(RiskRollup.risk_score_total))
+        .where(RiskRollup.hour >= hour_of(start), RiskRollup.hour < end)
+        .group_by(*group)
+    ).all()
+
+
+def _empty_totals() -> dict:
+    return {"logins": 0, "by_risk_level": {}, "by_outcome": {}, "signals_fired": {},
+            "otp": {"challenges": 0, "verifications": {}}, "_assessed": 0, "_score": 0}
+
+
+def _fold(totals: dict, event: str, risk_level: str, signal: str, outcome: str, count: int, score: int):
+    if event == "login" and signal != ALL:
+        totals["signals_fired"][signal] = totals["signals_fired"].get(signal, 0) + count
+    elif event == "login":
+        totals["logins"] += count
+        totals["by_risk_level"][risk_level] = totals["by_risk_level"].get(risk_level, 0) + count
+        totals["by_outcome"][outcome] = totals["by_outcome"].get(outcome, 0) + count
+        if outcome == "otp_required":
+            totals["otp"]["challenges"] += count
+        if risk_level != "none":
+            totals["_assessed"] += count
+            totals["_score"] += score
+    elif event == "otp":
+        verifications = totals["otp"]["verifications"]
+        verifications[outcome] = verifications.get(outcome, 0) + count
+
+
+def _finish(totals: dict) -> dict:
+    assessed, score = totals.pop("_assessed"), totals.pop("_score")
+    totals["average_risk_score"] = round(score / assessed, 1) if assessed else None
+    otp = totals["otp"]
+    passed = otp["verifications"].get("success", 0)
+    otp["passed"] = passed
+    otp["pass_rate"] = round(passed / otp["challenges"], 4) if otp["challenges"] else None
+    return totals
+
+
+@router.get("/summary")
+def analytics_summary(start: str | None = None, end: str | None = None, db: Session = Depends(get_db)):
+    """
+    Totals between start and end (ISO 8601, default the last 24 hours):
+    logins by risk level and outcome, how often each signal flagged, and the
+    OTP pass rate (successful verifications per challenge). Whole hours only.
+    """
+    start_at, end_at = _time_range(start, end)
+    totals = _empty_totals()
+    for event, risk_level, signal, outcome, count, score in _rows(db, start_at, end_at, by_hour=False):
+        _fold(totals, event, risk_level, signal, outcome, count, score)
+    return {"start": hour_of(start_at), "end": end_at, "threshold": RISK_THRESHOLD, **_finish(totals)}
+
+
+@router.get("/timeseries")
+def analytics_timeseries(start: str | None = None, end: str | None = None, bucket: str = "hour",
+                         db: Session = Depends(get_db)):
+    """The same totals as /analytics/summary per hour or day; empty buckets are left out."""
+    if bucket not in ("hour", "day"):
+        raise HTTPException(status_code=422, detail='bucket must be "hour" or "day"')
+    start_at, end_at = _time_range(start, end)
+    buckets = {}
+    for hour, event, risk_level, signal, outcome, count, score in _rows(db, start_at, end_at, by_hour=True):
+        key = hour if bucket == "hour" else hour.replace(hour=0)
+        totals = buckets.get(key)
+        if totals is None:
+            totals = buckets[key] = _empty_totals()
+        _fold(totals, event, risk_level, signal, outcome, count, score)
+    # Plain JSON of plain types: thousands of buckets through jsonable_encoder cost more than the query
+    return JSONResponse({
+        "start": hour_of(start_at).isoformat(),
+        "end": end_at.isoformat(),
+        "bucket": bucket,
+        "series": [{"start": as_utc(key).isoformat(), **_finish(totals)} for key, totals in sorted(buckets.items())],
+    })
+
+
+# --- Backfill from login_attempts ---
+
+def _as_assessed(results: dict) -> tuple[int, list[str]]:
+    """Score and flagged signals as assess_risk would report them, stopping early the same way."""
+    _, points = score(results, _CURRENT)
+    evaluated = evaluate_signals(lambda signal: points[signal.name])
+    return sum(evaluated.values()), [name for name, value in evaluated.items() if value]
+
+
+def _add_history(counts: dict, row, results: dict | None):
+    """The rollup entries a historical attempt stands for."""
+    hour = hour_of(row.timestamp)
+    if row.failure_reason == "throttled":
+        _add(counts, hour, "login", "throttled", "none", [], 0)
+        return
+    if row.failure_reason == "otp_throttled":
+        _add(counts, hour, "otp", "throttled", "high", [], 0)
+        return
+
+    risk_score, flagged = _as_assessed(results) if results is not None else (row.risk_score or 0, [])
+    if not row.success:
+        _add(counts, hour, "login", row.failure_reason or "invalid_credentials", row.risk_level,
+             flagged, risk_score)
+    elif row.risk_level == "high":
+        # Only completed challenges reach history: the login that raised it and the passed OTP
+        _add(counts, hour, "login", "otp_required", "high", flagged, risk_score)
+        _add(counts, hour, "otp", "success", "high", [], 0)
+    else:
+        _add(counts, hour, "login", "success", "low", flagged, risk_score)
+
+
+def backfill_shard(first_user: int, last_user: int, since: datetime | None, until: datetime) -> dict:
+    """Rollup counts for attempts by user ids in [first_user, last_user) within [since, until)."""
+    counts = defaultdict(lambda: [0, 0])
+    db = SessionLocal()
+    try:
+        # Earlier attempts are still replayed, to build up each user's state
+        for row, results in replay_attempts(db, first_user, last_user):
+            timestamp = as_utc(row.timestamp)
+            if (since is None or timestamp >= since) and timestamp < until:
+                _add_history(counts, row, results)
+    finally:
+        db.close()
+    return dict(counts)
+
+
+def backfill_unknown_users(since: datetime | None, until: datetime) -> dict:
+    """Rollup counts for attempts against usernames that don't exist, assessed with no user state."""
+    counts = defaultdict(lambda: [0, 0])
+    columns = (LoginAttempt.id, LoginAttempt.timestamp, LoginAttempt.ip_address, LoginAttempt.device_fingerprint,
+               LoginAttempt.location_lat, LoginAttempt.location_lon, LoginAttempt.risk_score,
+               LoginAttempt.risk_level, LoginAttempt.success, LoginAttempt.failure_reason)
+    db = SessionLocal()
+    try:
+        last_id = 0
+        while True:
+            query = select(*columns).where(LoginAttempt.user_id.is_(None), LoginAttempt.id > last_id,
+                                           LoginAttempt.timestamp < until)
+            if since is not None:
+                query = query.where(LoginAttempt.timestamp >= since)
+            rows = db.execute(query.order_by(LoginAttempt.id).limit(BACKFILL_BATCH_SIZE)).all()
+            if not rows:
+                break
+            for row in rows:
+                results = None
+                if row.failure_reason not in ("throttled", "otp_throttled"):
+                    event = RiskEvent(ip_address=row.ip_address, device_fingerprint=row.device_fingerprint,
+                                      location_lat=row.location_lat, location_lon=row.location_lon)
+                    results = signal_results(event, RiskContext(user=None, now=as_utc(row.timestamp)))
+                _add_history(counts, row, results)
+            last_id = rows[-1].id
+    finally:
+        db.close()
+    return dict(counts)
+
+
+def _merge(total: dict, counts: dict):
+    for key, (count, score) in counts.items():
+        entry = total[key]
+        entry[0] += count
+        entry[1] += score
+
+
+def backfill(since: datetime | None = None, rebuild: bool = False, workers: int = 1) -> dict:
+    """
+    Fill risk_rollups from login_attempts. By default only hours before the
+    earliest existing rollup are filled, so live counts are never replaced.
+    With rebuild, every hour from since up to the current one is deleted and
+    recomputed; live-only counts in those hours (unfinished OTP challenges)
+    are lost.
+    """
+    started = time.perf_counter()
+    current_hour = hour_of(datetime.now(timezone.utc))
+    db = SessionLocal()
+    try:
+        if rebuild:
+            until = current_hour
+            query = delete(RiskRollup).where(RiskRollup.hour < until)
+            if since is not None:
+                query = query.where(RiskRollup.hour >= hour_of(since))
+            db.execute(query)
+            db.commit()
+        else:
+            first = db.execute(select(func.min(RiskRollup.hour))).scalar()
+            until = min(as_utc(first), current_hour) if first is not None else current_hour
+        ranges = shard_ranges(db, workers * 4)
+    finally:
+        db.close()
+    since = hour_of(since) if since is not None else None
+
+    counts = defaultdict(lambda: [0, 0])
+    if workers <= 1:
+        for first_user, last_user in ranges:
+            _merge(counts, backfill_shard(first_user, last_user, since, until))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=dispose_inherited_connections) as pool:
+            futures = [pool.submit(backfill_shard, first_user, last_user, since, until)
+                       for first_user, last_user in ranges]
+            for future in futures:
+                _merge(counts, future.result())
+    _merge(counts, backfill_unknown_users(since, until))
+
+    db = SessionLocal()
+    try:
+        upsert_counts(db, counts)
+        db.commit()
+    finally:
+        db.close()
+    return {
+        "since": since.isoformat() if since else None,
+        "until": until.isoformat(),
+        "rollup_rows": len(counts),
+        "events": sum(count for (_, _, _, signal, _), (count, _) in counts.items() if signal == ALL),
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the risk analytics rollups")
+    commands = parser.add_subparsers(dest="command", required=True)
+    fill = commands.add_parser("backfill", help="Fill rollups from login_attempts history")
+    fill.add_argument("--since", type=lambda value: as_utc(datetime.fromisoformat(value)),
+                      help="ISO date or datetime, UTC unless an offset is given")
+    fill.add_argument("--rebuild", action="store_true",
+                      help="Replace existing rollups from --since up to the current hour")
+    fill.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    from app.migrate import upgrade_database
+    upgrade_database()
+
+    print(json.dumps(backfill(args.since, rebuild=args.rebuild, workers=args.workers)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,546 @@
+"""
+Learned per-user anomaly scoring, the alternative to the weighted rules, trained
+offline into a memory-mapped model file. Design notes are in docs/design-notes.md.
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from math import cos, radians, sin
+from typing import Iterator
+
+import numpy as np
+from sqlalchemy import func, select
+
+from app.batch_scoring import haversine_many
+from app.config import (
+    ANOMALY_CHALLENGE_NEW_DEVICES, ANOMALY_HALF_LIFE_DAYS, ANOMALY_HISTORY_DAYS, ANOMALY_MODEL_PATH, ANOMALY_POINTS_PER_BIT,
+    ANOMALY_RELOAD_SECONDS, LOGIN_ATTEMPT_RETENTION_DAYS, MAINTENANCE_ENABLED,
+)
+from app.database import engine
+from app.ip_reputation import ip_severity
+from app.models import LoginAttempt
+from app.profiles import as_utc
+from app.risk_engine import (
+    MAX_TRAVEL_SPEED_KMH, RISK_THRESHOLD, RiskContext, RiskEvent, haversine, register_scorer,
+)
+
+MAGIC = b"AAAM"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("=4sHHIId40x")  # 64 bytes: magic, version, reserved, record size, users, trained at
+
+HOURS_PER_WEEK = 168
+MAX_DEVICES = 8
+MAX_LOCATIONS = 4
+LOCATION_CELL_DEGREES = 1.0  # Logins are grouped into clusters on a grid of this size
+LOCATION_RADIUS_KM = 150  # A login this close to a cluster's centre belongs to it
+_COS_RADIUS = float(np.cos(LOCATION_RADIUS_KM / 6371))
+PRIOR_LOGINS = 5  # Weight of the global model in a user's hour and velocity estimates
+TRAIN_CHUNK_USERS = 5000
+
+# Most points each component can add; IP reputation keeps its rule weight
+COMPONENT_CAPS = {"hour_of_week": 45, "device": 105, "location": 90, "velocity": 150}
+
+RECORD = np.dtype([
+    ("user_id", "<i8"),
+    ("hour_bits", "<f2", HOURS_PER_WEEK),
+    ("hour_expected", "<f4"),
+    ("device_hash", "<u8", MAX_DEVICES),
+    ("device_bits", "<f4", MAX_DEVICES),
+    ("device_novel_bits", "<f4"),
+    ("device_expected", "<f4"),
+    ("location_xyz", "<f4", (MAX_LOCATIONS, 3)),  # Cluster centres as unit vectors; zero when empty
+    ("location_bits", "<f4", MAX_LOCATIONS),
+    ("location_novel_bits", "<f4"),
+    ("location_expected", "<f4"),
+    ("velocity_mean", "<f4"),
+    ("velocity_std", "<f4"),
+], align=True)
+
+
+class ModelFormatError(Exception):
+    """Raised when a model file is missing, truncated or from another version."""
+
+
+def device_hash(device_fingerprint: str) -> int:
+    # 0 marks an empty device slot
+    digest = hashlib.blake2b(device_fingerprint.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") or 1
+
+
+def unit_vector(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """Points on the unit sphere; the dot product of two is the cosine of the angle between them."""
+    lat, lon = np.radians(lat), np.radians(lon)
+    return np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+def hour_of_week(moment: datetime) -> int:
+    moment = as_utc(moment)
+    return moment.weekday() * 24 + moment.hour
+
+
+# --- Training ---
+
+def _read_chunks(since: datetime, chunk_users: int = TRAIN_CHUNK_USERS) -> Iterator[dict]:
+    """Successful logins as arrays, a range of user ids at a time, ordered by user and time."""
+    with engine.connect() as conn:
+        low, high = conn.execute(select(func.min(LoginAttempt.user_id), func.max(LoginAttempt.user_id))).one()
+    if low is None:
+        return
+
+    for first in range(low, high + 1, chunk_users):
+        with engine.connect() as conn:
+            rows = conn.execute(select(
+                LoginAttempt.user_id, LoginAttempt.timestamp, LoginAttempt.device_fingerprint,
+                LoginAttempt.location_lat, LoginAttempt.location_lon,
+            ).where(
+                LoginAttempt.user_id.between(first, first + chunk_users - 1),
+                LoginAttempt.success == True,
+                LoginAttempt.timestamp >= since,
+            ).order_by(LoginAttempt.user_id, LoginAttempt.timestamp, LoginAttempt.id)).all()
+        if not rows:
+            continue
+        yield {
+            "user_id": np.array([row.user_id for row in rows], dtype=np.int64),
+            "ts": np.array([as_utc(row.timestamp).timestamp() for row in rows], dtype=np.float64),
+            "device": np.array([device_hash(row.device_fingerprint) if row.device_fingerprint else 0
+                                for row in rows], dtype=np.uint64),
+            "lat": np.array([np.nan if row.location_lat is None else row.location_lat for row in rows]),
+            "lon": np.array([np.nan if row.location_lon is None else row.location_lon for row in rows]),
+        }
+
+
+class _Chunk:
+    """Per-login arrays for one chunk, with each login's user as an index into `users`."""
+
+    def __init__(self, arrays: dict, now: float, half_life_days: float):
+        self.users, self.owner = np.unique(arrays["user_id"], return_inverse=True)
+        self.count = len(self.users)
+        self.ts = arrays["ts"]
+        self.device = arrays["device"]
+        self.lat, self.lon = arrays["lat"], arrays["lon"]
+        self.weight = 0.5 ** (np.maximum(now - self.ts, 0) / 86400 / half_life_days)
+        # 1970-01-01 was a Thursday, weekday 3
+        days = np.floor(self.ts / 86400).astype(np.int64)
+        self.hour_of_week = (days + 3) % 7 * 24 + np.floor(self.ts / 3600).astype(np.int64) % 24
+        self.located = ~(np.isnan(self.lat) | np.isnan(self.lon))
+
+    def hour_counts(self) -> np.ndarray:
+        counts = np.zeros((self.count, HOURS_PER_WEEK))
+        np.add.at(counts, (self.owner, self.hour_of_week), self.weight)
+        return counts
+
+    def speeds(self) -> tuple[np.ndarray, np.ndarray]:
+        """log(1 + km/h) between consecutive located logins of the same user, and whose they are."""
+        index = np.flatnonzero(self.located)
+        same = self.owner[index[1:]] == self.owner[index[:-1]]
+        before, after = index[:-1][same], index[1:][same]
+        hours = np.maximum((self.ts[after] - self.ts[before]) / 3600, 1 / 60)
+        distance = haversine_many(self.lat[before], self.lon[before], self.lat[after], self.lon[after])
+        return np.log1p(distance / hours), self.owner[after]
+
+
+def _smoothed_hours(counts: np.ndarray) -> np.ndarray:
+    """Spread each login over its neighbouring hours, and half of it over the same hour every day."""
+    spread = 0.5 * counts + 0.25 * (np.roll(counts, 1, axis=-1) + np.roll(counts, -1, axis=-1))
+    daily = spread.reshape(*spread.shape[:-1], 7, 24).sum(axis=-2)
+    return 0.5 * spread + 0.5 * np.tile(daily, 7) / 7
+
+
+def _grouped_top(owner: np.ndarray, key: np.ndarray, weight: np.ndarray, users: int, k: int):
+    """
+    Group logins by (user, key) and keep each user's k heaviest groups.
+    Returns every group's user, key and weight, the number of groups per
+    user with a single login, which group each login is in, and the kept
+    groups' (user, slot, group index).
+    """
+    pairs, group = np.unique(np.stack([owner.astype(np.uint64), key.astype(np.uint64)], axis=1),
+                             axis=0, return_inverse=True)
+    group = group.ravel()
+    group_user = pairs[:, 0].astype(np.int64)
+    group_weight = np.bincount(group, weights=weight, minlength=len(pairs))
+    order = np.lexsort((-group_weight, group_user))
+    sorted_users = group_user[order]
+    rank = np.arange(len(order)) - np.searchsorted(sorted_users, sorted_users, side="left")
+    kept = order[rank < k]
+    singletons = np.bincount(group_user[np.bincount(group, minlength=len(pairs)) == 1], minlength=users)
+    return group_user, pairs[:, 1], group_weight, singletons, group, (group_user[kept], rank[rank < k], kept)
+
+
+def _frequency_bits(group_user, weights, logins, singletons, users: int):
+    """
+    Novel-value rate and per-group surprise for a device or location
+    histogram. The chance of a value never seen before is estimated, as in
+    Good-Turing, by the share of logins whose value was seen only once
+    (Laplace-smoothed), so a user's first login on each of their regular
+    devices doesn't count as novelty.
+    """
+    total = np.bincount(group_user, weights=weights, minlength=users)
+    novel_rate = (singletons + 1) / (logins + 2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        share = weights / total[group_user]
+    bits = -np.log2((1 - novel_rate[group_user]) * share)
+    return novel_rate, share, bits
+
+
+class _GlobalModel:
+    """Aggregates over every user, from the first training pass."""
+
+    def __init__(self):
+        self.hours = np.zeros(HOURS_PER_WEEK)
+        self.logins = 0
+        self.singletons = 0
+        self.velocity = np.zeros(3)  # n, sum, sum of squares
+
+    def add(self, chunk: _Chunk):
+        np.add.at(self.hours, chunk.hour_of_week, chunk.weight)
+        with_device = chunk.device != 0
+        self.logins += int(with_device.sum())
+        _, counts = np.unique(np.stack([chunk.owner[with_device].astype(np.uint64), chunk.device[with_device]],
+                                       axis=1), axis=0, return_counts=True)
+        self.singletons += int((counts == 1).sum())
+        speeds, _ = chunk.speeds()
+        self.velocity += (len(speeds), speeds.sum(), (speeds ** 2).sum())
+
+    def finish(self):
+        smoothed = _smoothed_hours(self.hours)
+        total = smoothed.sum()
+        # Keep a floor under every hour so nothing is impossible
+        self.hour_p = 0.9 * smoothed / total + 0.1 / HOURS_PER_WEEK if total else np.full(
+            HOURS_PER_WEEK, 1 / HOURS_PER_WEEK)
+        n, total_speed, total_square = self.velocity
+        self.velocity_mean = total_speed / n if n else 0.0
+        self.velocity_var = max(total_square / n - self.velocity_mean ** 2, 0.25) if n else 1.0
+
+    def record(self) -> np.ndarray:
+        record = np.zeros(1, dtype=RECORD)
+        bits = -np.log2(self.hour_p * HOURS_PER_WEEK)
+        record["user_id"] = -1
+        record["hour_bits"] = bits
+        record["hour_expected"] = (self.hours * bits).sum() / self.hours.sum() if self.hours.sum() else 0.0
+        novel_rate = (self.singletons + 1) / (self.logins + 2)
+        record["device_novel_bits"] = -np.log2(novel_rate)
+        record["device_expected"] = -np.log2(1 - novel_rate) if novel_rate < 1 else 0.0
+        record["velocity_mean"] = self.velocity_mean
+        record["velocity_std"] = np.sqrt(self.velocity_var)
+        return record
+
+
+def build_records(chunk: _Chunk, prior: _GlobalModel) -> np.ndarray:
+    """One model record per user in the chunk."""
+    users = chunk.count
+    records = np.zeros(users, dtype=RECORD)
+    records["user_id"] = chunk.users
+
+    # Hour of week, shrunk towards the global density
+    counts = chunk.hour_counts()
+    n = counts.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        personal = np.where(n[:, None] > 0, _smoothed_hours(counts) / n[:, None], 0.0)
+    p = (n[:, None] * personal + PRIOR_LOGINS * prior.hour_p) / (n + PRIOR_LOGINS)[:, None]
+    bits = -np.log2(p * HOURS_PER_WEEK)
+    records["hour_bits"] = bits
+    with np.errstate(divide="ignore", invalid="ignore"):
+        records["hour_expected"] = np.where(n > 0, (counts * bits).sum(axis=1) / n, 0.0)
+
+    # Devices
+    with_device = chunk.device != 0
+    owner = chunk.owner[with_device]
+    group_user, keys, weights, singletons, _, (kept_user, kept_slot, kept) = _grouped_top(
+        owner, chunk.device[with_device], chunk.weight[with_device], users, MAX_DEVICES)
+    logins = np.bincount(owner, minlength=users)
+    novel_rate, share, group_bits = _frequency_bits(group_user, weights, logins, singletons, users)
+    novel_bits = -np.log2(novel_rate)
+    records["device_hash"][kept_user, kept_slot] = keys[kept]
+    records["device_bits"][kept_user, kept_slot] = group_bits[kept]
+    records["device_novel_bits"] = novel_bits
+    kept_share = np.bincount(kept_user, weights=share[kept], minlength=users)
+    records["device_expected"] = (np.bincount(kept_user, weights=share[kept] * group_bits[kept], minlength=users)
+                                  + (1 - kept_share) * novel_bits)
+
+    # Locations, clustered on a grid; each cluster's centre is its logins' weighted mean
+    located = chunk.located
+    owner = chunk.owner[located]
+    lat, lon, weight = chunk.lat[located], chunk.lon[located], chunk.weight[located]
+    cell = ((np.floor(lat / LOCATION_CELL_DEGREES) + 90) * 1000 + np.floor(lon / LOCATION_CELL_DEGREES) + 180)
+    group_user, _, weights, singletons, group, (kept_user, kept_slot, kept) = _grouped_top(
+        owner, cell.astype(np.int64), weight, users, MAX_LOCATIONS)
+    logins = np.bincount(owner, minlength=users)
+    novel_rate, share, group_bits = _frequency_bits(group_user, weights, logins, singletons, users)
+    novel_bits = np.where(logins > 0, -np.log2(novel_rate), 0.0)  # No history, no information
+    with np.errstate(divide="ignore", invalid="ignore"):
+        centre_lat = np.bincount(group, weights=weight * lat, minlength=len(weights)) / weights
+        centre_lon = np.bincount(group, weights=weight * lon, minlength=len(weights)) / weights
+    records["location_xyz"][kept_user, kept_slot] = unit_vector(centre_lat[kept], centre_lon[kept])
+    records["location_bits"][kept_user, kept_slot] = group_bits[kept]
+    records["location_novel_bits"] = novel_bits
+    kept_share = np.bincount(kept_user, weights=share[kept], minlength=users)
+    records["location_expected"] = np.where(logins > 0, np.bincount(
+        kept_user, weights=share[kept] * group_bits[kept], minlength=users) + (1 - kept_share) * novel_bits, 0.0)
+
+    # Velocity, shrunk towards the global distribution
+    speeds, speed_owner = chunk.speeds()
+    n = np.bincount(speed_owner, minlength=users)
+    total = np.bincount(speed_owner, weights=speeds, minlength=users)
+    square = np.bincount(speed_owner, weights=speeds ** 2, minlength=users)
+    mean = (total + PRIOR_LOGINS * prior.velocity_mean) / (n + PRIOR_LOGINS)
+    second = (square + PRIOR_LOGINS * (prior.velocity_var + prior.velocity_mean ** 2)) / (n + PRIOR_LOGINS)
+    records["velocity_mean"] = mean
+    records["velocity_std"] = np.sqrt(np.maximum(second - mean ** 2, 0.25))
+    return records
+
+
+def train(path: str = ANOMALY_MODEL_PATH, days: int = ANOMALY_HISTORY_DAYS,
+          half_life_days: float = ANOMALY_HALF_LIFE_DAYS, chunk_users: int = TRAIN_CHUNK_USERS) -> dict:
+    """
+    Fit every user's model from the last `days` of successful logins and
+    write the model file. Two passes: global aggregates, then users a chunk
+    at a time, written as they are built so memory stays at one chunk.
+    """
+    if MAINTENANCE_ENABLED and days > LOGIN_ATTEMPT_RETENTION_DAYS:
+        print(f"[anomaly] warning: training on {days} days, but login_attempts are purged after "
+              f"{LOGIN_ATTEMPT_RETENTION_DAYS} (LOGIN_ATTEMPT_RETENTION_DAYS); only that much history is learned")
+    started = time.perf_counter()
+    now = datetime.now(timezone.utc)
+    since = now - timedelta(days=days)
+
+    prior = _GlobalModel()
+    for arrays in _read_chunks(since, chunk_users):
+        prior.add(_Chunk(arrays, now.timestamp(), half_life_days))
+    prior.finish()
+
+    users = 0
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(bytes(_HEADER.size))
+        f.write(prior.record().tobytes())
+        for arrays in _read_chunks(since, chunk_users):
+            records = build_records(_Chunk(arrays, now.timestamp(), half_life_days), prior)
+            f.write(records.tobytes())
+            users += len(records)
+        f.seek(0)
+        f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, 0, RECORD.itemsize, users, now.timestamp()))
+    os.replace(temp_path, path)
+
+    return {
+        "path": path,
+        "days": days,
+        "users": users,
+        "logins": prior.logins,
+        "bytes": os.path.getsize(path),
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+
+
+# --- Serving ---
+
+class ModelFile:
+    """A model file, memory-mapped read-only."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < _HEADER.size:
+                raise ModelFormatError(f"{path} is too small to be a model")
+            self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, _, record_size, users, trained_at = _HEADER.unpack_from(self._buffer, 0)
+        if magic != MAGIC or version != FORMAT_VERSION or record_size != RECORD.itemsize:
+            raise ModelFormatError(f"{path} is not a version {FORMAT_VERSION} model")
+        if _HEADER.size + record_size * (users + 1) > size:
+            raise ModelFormatError(f"{path} is truncated")
+
+        records = np.frombuffer(self._buffer, dtype=RECORD, count=users + 1, offset=_HEADER.size)
+        self.prior = records[0]
+        self.records = records[1:]
+        self.user_ids = self.records["user_id"]
+        self.users = users
+        self.trained_at = datetime.fromtimestamp(trained_at, timezone.utc)
+
+    def lookup(self, user_id: int):
+        """The user's record, or the global one for a user trained without history."""
+        position = np.searchsorted(self.user_ids, user_id)
+        if position < self.users and self.user_ids[position] == user_id:
+            return self.records[position]
+        return self.prior
+
+
+def _surprise(bits: float, expected: float, component: str) -> dict:
+    excess = max(float(bits) - float(expected), 0.0)
+    points = min(int(excess * ANOMALY_POINTS_PER_BIT + 0.5), COMPONENT_CAPS[component])
+    return {"flagged": points > 0, "points": points, "surprise_bits": round(excess, 2)}
+
+
+def _capped(component: str) -> dict:
+    return {"flagged": True, "points": COMPONENT_CAPS[component], "surprise_bits": None}
+
+
+def score_components(record, event: RiskEvent, context: RiskContext) -> dict:
+    """Per-component results for one login against one user's record."""
+    hour = hour_of_week(context.now)
+    results = {"hour_of_week": _surprise(record["hour_bits"][hour], record["hour_expected"], "hour_of_week")}
+
+    # Device: a device trusted since the last training run counts as a usual one
+    fingerprint = event.device_fingerprint
+    slots = np.flatnonzero(record["device_hash"] == device_hash(fingerprint)) if fingerprint else ()
+    if ANOMALY_CHALLENGE_NEW_DEVICES and not context.device_trusted:
+        results["device"] = _capped("device")  # As under the rules, trusting a device takes an OTP
+    else:
+        if len(slots):
+            bits = record["device_bits"][slots[0]]
+        elif fingerprint and context.device_trusted:
+            bits = record["device_expected"]
+        else:
+            bits = record["device_novel_bits"]
+        results["device"] = _surprise(bits, record["device_expected"], "device")
+
+    if event.location_lat is None or event.location_lon is None:
+        results["location"] = results["velocity"] = {"flagged": False, "points": 0, "surprise_bits": 0.0}
+        return results
+
+    lat, lon = radians(event.location_lat), radians(event.location_lon)
+    closeness = record["location_xyz"] @ np.array([cos(lat) * cos(lon), cos(lat) * sin(lon), sin(lat)],
+                                                  dtype=np.float32)
+    nearest = closeness.argmax()
+    if closeness[nearest] >= _COS_RADIUS:
+        bits = record["location_bits"][nearest]
+    else:
+        bits = record["location_novel_bits"]
+    results["location"] = _surprise(bits, record["location_expected"], "location")
+
+    if context.last_location is None:
+        results["velocity"] = {"flagged": False, "points": 0, "surprise_bits": 0.0}
+        return results
+    last_lat, last_lon, last_time = context.last_location
+    km = haversine(last_lat, last_lon, event.location_lat, event.location_lon)
+    hours = (context.now - as_utc(last_time)).total_seconds() / 3600
+    if (km > 50 if hours <= 0 else km / hours > MAX_TRAVEL_SPEED_KMH):
+        results["velocity"] = _capped("velocity")  # Physically impossible, whatever the history
+        return results
+    speed = np.log1p(km / max(hours, 1 / 60))
+    z = max((speed - record["velocity_mean"]) / record["velocity_std"], 0.0)
+    results["velocity"] = _surprise(z * z / (2 * np.log(2)), 0.0, "velocity")
+    return results
+
+
+class AnomalyModel:
+    """
+    The model file currently in use, re-mapped whenever training replaces it.
+    Scoring keeps using the previous map until a new one has loaded.
+    """
+
+    def __init__(self, path: str, check_interval: float):
+        self.path = path
+        self.check_interval = check_interval
+        self.reloads = 0
+        self.scored = 0
+        self.last_error: str | None = None
+        self._model: ModelFile | None = None
+        self._signature = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher: threading.Thread | None = None
+        self._initialized = False
+
+    def refresh(self):
+        with self._lock:
+            self._initialized = True
+            try:
+                stat = os.stat(self.path)
+                signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+                if signature != self._signature:
+                    self._model = ModelFile(self.path)
+                    self._signature = signature
+                    self.reloads += 1
+                self.last_error = None
+            except FileNotFoundError:
+                self.last_error = f"no model at {self.path}; run python -m app.anomaly train"
+            except (OSError, ValueError, ModelFormatError) as exc:
+                self.last_error = f"{type(exc).__name__}: {exc}"
+                print(f"[anomaly] reload failed: {self.last_error}")
+
+    def get(self) -> ModelFile | None:
+        if not self._initialized:
+            self.refresh()
+        return self._model
+
+    def _watch(self):
+        while not self._stop.wait(self.check_interval):
+            self.refresh()
+
+    def start(self):
+        self.refresh()
+        if self._watcher is None and self.check_interval > 0:
+            self._stop.clear()
+            self._watcher = threading.Thread(target=self._watch, name="anomaly-model-watcher", daemon=True)
+            self._watcher.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=self.check_interval + 1)
+            self._watcher = None
+
+    def stats(self) -> dict:
+        model = self._model
+        return {
+            "path": self.path,
+            "users": model.users if model is not None else 0,
+            "trained_at": model.trained_at.isoformat() if model is not None else None,
+            "record_bytes": RECORD.itemsize,
+            "reloads": self.reloads,
+            "scored": self.scored,
+            "last_error": self.last_error,
+        }
+
+
+model = AnomalyModel(ANOMALY_MODEL_PATH, ANOMALY_RELOAD_SECONDS)
+
+
+@register_scorer("anomaly")
+def assess_anomaly(event: RiskEvent, context: RiskContext, full: bool = False) -> dict | None:
+    """assess_risk's result for the learned model, or None while no model is loaded."""
+    current = model.get()
+    if current is None:
+        return None
+    model.scored += 1
+
+    severity = ip_severity(event.ip_address)
+    signals = {"ip_reputation": {"flagged": severity > 0, "points": severity}}
+    if context.user is None:
+        # Unknown usernames score like an unrecognised device under the rules
+        signals["device"] = _capped("device")
+    else:
+        signals.update(score_components(current.lookup(context.user.id), event, context))
+
+    risk_score = sum(result["points"] for result in signals.values())
+    return {
+        "risk_score": risk_score,
+        "risk_level": "high" if risk_score >= RISK_THRESHOLD else "low",
+        "signals": signals,
+        "scorer": "anomaly",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the per-user anomaly scoring model")
+    commands = parser.add_subparsers(dest="command", required=True)
+    fit = commands.add_parser("train", help="fit every user's model from login_attempts")
+    fit.add_argument("--days", type=int, default=ANOMALY_HISTORY_DAYS, help="history to learn from")
+    fit.add_argument("--half-life-days", type=float, default=ANOMALY_HALF_LIFE_DAYS)
+    fit.add_argument("--output", default=ANOMALY_MODEL_PATH)
+    args = parser.parse_args()
+
+    from app.migrate import upgrade_database
+    upgrade_database()
+
+    print(json.dumps(train(args.output, args.days, args.half_life_days), indent=2))
+
+
+if __name__ == "__main__":
+    main()
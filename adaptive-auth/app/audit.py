@@ -0,0 +1,261 @@
+"""
+LoginAttempt audit trail with optional write-behind.
+
+In "sync" mode (the default) attempts are added to the request's own session
+and committed with it. In "async" mode they go into a bounded in-memory queue
+and a background thread bulk-inserts them, committing every AUDIT_BATCH_SIZE
+rows or AUDIT_FLUSH_INTERVAL_SECONDS, whichever comes first. A failed login
+then costs no commit at all.
+
+Async mode trades durability for latency: attempts still in the queue are
+lost if the process dies without shutting down cleanly. The risk signals
+don't read login_attempts (they read user_profiles and trusted_devices,
+which are always written synchronously), so deferring the audit rows never
+changes the next assessment for the same user.
+
+app.export stops at flushed_through(), so it never passes a row this
+process still has queued. Rows written more than EXPORT_SETTLE_SECONDS after
+their timestamp are counted as late: another worker's export may have passed
+them.
+
+When the queue is full, AUDIT_OVERFLOW decides what happens: "sync" writes
+the attempt in the request's transaction, "block" waits for room and "drop"
+discards it (counted in stats()).
+"""
+import atexit
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.config import (
+    AUDIT_MODE, AUDIT_QUEUE_SIZE, AUDIT_BATCH_SIZE, AUDIT_FLUSH_INTERVAL_SECONDS, AUDIT_OVERFLOW,
+    EXPORT_SETTLE_SECONDS,
+)
+from app.database import SessionLocal
+from app.models import LoginAttempt
+from app.profiles import as_utc
+
+# Every queued row carries every column so executemany batches stay uniform
+_WAKE = None  # Queued by stop() so the writer doesn't sit out its flush interval
+
+_ATTEMPT_DEFAULTS = {
+    "user_id": None,
+    "ip_address": "unknown",
+    "device_fingerprint": None,
+    "location_lat": None,
+    "location_lon": None,
+    "risk_score": 0,
+    "risk_level": "low",
+    "success": False,
+    "failure_reason": None,
+}
+
+
+class AuditSink:
+    def __init__(self, mode: str, queue_size: int, batch_size: int,
+                 flush_interval: float, overflow: str, session_factory=SessionLocal):
+        self.mode = mode
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.session_factory = session_factory
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._writer: threading.Thread | None = None
+        self._start_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+        self._flushed_through = datetime.now(timezone.utc)
+
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+        self.overflowed = 0
+        self.errors = 0
+        self.late = 0  # Rows written more than EXPORT_SETTLE_SECONDS after their timestamp
+
+    def record(self, db: Session, **fields) -> bool:
+        """
+        Record a login attempt. Returns True if it was added to db, in which
+        case the caller must commit; False if it was queued or dropped.
+        """
+        row = {**_ATTEMPT_DEFAULTS, **fields}
+        if row.get("timestamp") is None:
+            row["timestamp"] = datetime.now(timezone.utc)
+
+        if self.mode != "async":
+            db.add(LoginAttempt(**row))
+            return True
+
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(row)
+            return False
+        except queue.Full:
+            self.overflowed += 1
+
+        if self.overflow == "block":
+            self._queue.put(row)
+            return False
+        if self.overflow == "drop":
+            self.dropped += 1
+            return False
+        db.add(LoginAttempt(**row))
+        return True
+
+    def _ensure_started(self):
+        if self._writer is None:
+            with self._start_lock:
+                if self._writer is None:
+                    self.start()
+
+    def start(self):
+        if self.mode != "async" or self._writer is not None:
+            return
+        self._stop.clear()
+        self._writer = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._writer.start()
+
+    def stop(self):
+        """Stop the writer and flush everything still queued."""
+        self._stop.set()
+        if self._writer is not None:
+            try:
+                self._queue.put_nowait(_WAKE)
+            except queue.Full:
+                pass  # The writer is busy draining and will see the stop flag
+            self._writer.join()
+            self._writer = None
+        self.flush()
+
+    def _collect(self) -> list[dict]:
+        """Gather up to batch_size rows, waiting at most flush_interval after the first."""
+        try:
+            first = self._queue.get(timeout=self.flush_interval)
+        except queue.Empty:
+            return []
+        if first is _WAKE:
+            self._queue.task_done()
+            return []
+
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                row = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if row is _WAKE:
+                self._queue.task_done()
+                break
+            batch.append(row)
+        return batch
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._collect()
+            if batch:
+                self._write(batch)
+
+    def flush(self):
+        """Write everything currently queued, in batches, from the calling thread."""
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    row = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if row is _WAKE:
+                    self._queue.task_done()
+                else:
+                    batch.append(row)
+            if not batch:
+                if self._queue.empty():
+                    return
+                continue
+            self._write(batch)
+
+    def _write(self, batch: list[dict]):
+        with self._write_lock:
+            try:
+                self._insert(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+                # FIFO with one writer: everything queued before this batch's last row is written
+                if self._queue.unfinished_tasks == 0:
+                    self._flushed_through = datetime.now(timezone.utc)
+                else:
+                    self._flushed_through = max(self._flushed_through, as_utc(batch[-1]["timestamp"]))
+
+    def _insert(self, batch: list[dict]):
+        for attempt in range(2):
+            db = self.session_factory()
+            try:
+                db.execute(insert(LoginAttempt), batch)
+                db.commit()
+                self.written += len(batch)
+                self.batches += 1
+                committed = datetime.now(timezone.utc)
+                late = sum((committed - as_utc(row["timestamp"])).total_seconds() > EXPORT_SETTLE_SECONDS
+                           for row in batch)
+                if late:
+                    self.late += late
+                    print(f"[audit] {late} login attempts written more than EXPORT_SETTLE_SECONDS late; "
+                          "another worker's export may have passed them")
+                return
+            except Exception as exc:
+                db.rollback()
+                if attempt == 1:
+                    self.errors += 1
+                    self.dropped += len(batch)
+                    print(f"[audit] dropped {len(batch)} login attempts: {exc}")
+            finally:
+                db.close()
+
+    def flushed_through(self) -> datetime:
+        """
+        A time before which every attempt this process queued has been
+        written, give or take the instant between stamping a row and queueing it.
+        """
+        if self._queue.unfinished_tasks == 0:
+            return datetime.now(timezone.utc)
+        return self._flushed_through
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "batches": self.batches,
+            "overflowed": self.overflowed,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "late": self.late,
+        }
+
+
+sink = AuditSink(
+    mode=AUDIT_MODE,
+    queue_size=AUDIT_QUEUE_SIZE,
+    batch_size=AUDIT_BATCH_SIZE,
+    flush_interval=AUDIT_FLUSH_INTERVAL_SECONDS,
+    overflow=AUDIT_OVERFLOW,
+)
+
+# Last-chance flush for processes that exit without running the app lifespan
+atexit.register(sink.stop)
+
+
+def record_attempt(db: Session, **fields) -> bool:
+    """Record a login attempt through the configured sink. True means the caller must commit."""
+    return sink.record(db, **fields)
@@ -1,24 +1,28 @@
 from fastapi import APIRouter, Depends, Request
+from sqlalchemy import update
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from datetime import datetime, timedelta, timezone
-import bcrypt
 import secrets
 import hashlib
 
+from app import analytics, audit, cache, maintenance, metrics, otp_delivery, throttle, tokens
+from app.config import DEMO_MODE, RISK_SCORER
 from app.database import get_db
-from app.models import User, LoginAttempt, TrustedDevice, PendingAuth
-from app.schemas import LoginRequest, LoginResponse, OTPVerifyRequest, AuthResponse, RegisterRequest
-from app.risk_engine import assess_risk
+from app.models import User, PendingAuth
+from app.schemas import (
+    LoginRequest, LoginResponse, OTPVerifyRequest, AuthResponse, RegisterRequest,
+    IntrospectRequest, IntrospectResponse,
+)
+from app.risk_engine import RISK_THRESHOLD, assess_risk, load_risk_context
+from app.profiles import as_utc, record_successful_login, trust_device
+from app.hashing import hash_password_async, verify_password_async
+from app.client_ip import client_ip
+from app.geoip import resolve_location
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 
-
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
-
-
-def verify_password(password: str, password_hash: str) -> bool:
-    return bcrypt.checkpw(password.encode("utf-8"), password_hash.encode("utf-8"))
+OTP_ATTEMPT_LIMIT = 3  # Wrong codes allowed per pending session
 
 
 def generate_otp() -> str:
@@ -31,60 +35,136 @@ def hash_otp(code: str) -> str:
 
 # --- Register ---
 
+# Endpoints that run bcrypt are async: database work goes to Starlette's
+# threadpool and hashing goes to the dedicated pool in app.hashing, so a
+# threadpool slot is never held for the length of a hash.
+
 @router.post("/register")
-def register(data: RegisterRequest, db: Session = Depends(get_db)):
-    # Check if user exists
-    existing = db.query(User).filter(
-        (User.username == data.username) | (User.email == data.email)
-    ).first()
-    if existing:
+async def register(data: RegisterRequest, db: Session = Depends(get_db)):
+    if await run_in_threadpool(_user_exists, db, data.username, data.email):
         return {"success": False, "message": "Username or email already exists"}
 
+    password_hash = await hash_password_async(data.password)
+    created = await run_in_threadpool(_create_user, db, data, password_hash)
+    if not created:
+        return {"success": False, "message": "Username or email already exists"}
+    return {"success": True, "message": "User registered successfully"}
+
+
+def _user_exists(db: Session, username: str, email: str) -> bool:
+    existing = db.query(User.id).filter(
+        (User.username == username) | (User.email == email)
+    ).first()
+    return existing is not None
+
+
+def _create_user(db: Session, data: RegisterRequest, password_hash: str) -> bool:
+    # Re-check: another request may have taken the name while we were hashing
+    if _user_exists(db, data.username, data.email):
+        return False
+
     user = User(
         username=data.username,
         email=data.email,
-        password_hash=hash_password(data.password),
+        password_hash=password_hash,
     )
     db.add(user)
     db.commit()
-    return {"success": True, "message": "User registered successfully"}
+    # The username may be cached as "doesn't exist"
+    cache.users.invalidate(data.username)
+    return True
 
 
 # --- Login ---
 
 @router.post("/login", response_model=LoginResponse)
-def login(data: LoginRequest, request: Request, db: Session = Depends(get_db)):
-    # Get IP from request
-    ip_address = request.client.host if request.client else "unknown"
+@metrics.instrumented("login")
+async def login(data: LoginRequest, request: Request, db: Session = Depends(get_db)):
+    ip_address = client_ip(request)
+    location = resolve_location(ip_address) or (None, None)
+
+    # Refuse brute forcing before spending anything on risk or bcrypt
+    limits = throttle.login_limits(ip_address, data.username)
+    # In the threadpool: the file backend may wait on its SQLite lock
+    retry_after = await run_in_threadpool(throttle.logins.hit, limits)
+    if retry_after is not None:
+        metrics.throttled.inc("login")
+        analytics.record("login", "throttled", "none")
+        await run_in_threadpool(_record_throttled, db, data, ip_address, location)
+        raise throttle.Throttled(retry_after)
 
     # Assess risk BEFORE verifying credentials
-    risk_result = assess_risk(
-        db=db,
-        username=data.username,
+    context, risk_result = await run_in_threadpool(_assess_login, db, data, ip_address, location)
+
+    # Verify user exists and password is correct
+    user = context.user
+    with metrics.stage("password_verify"):
+        password_ok = bool(user) and await verify_password_async(data.password, user.password_hash)
+    if password_ok:
+        await run_in_threadpool(throttle.logins.refund, list(limits))
+
+    return await run_in_threadpool(
+        _complete_login, db, data, ip_address, location, user, risk_result, password_ok,
+    )
+
+
+def _assess_login(db: Session, data: LoginRequest, ip_address: str, location: tuple):
+    with metrics.stage("risk_context"):
+        context = load_risk_context(db, data.username, data.device_fingerprint)
+    with metrics.stage("risk_assessment"):
+        risk_result = assess_risk(
+            db=db,
+            username=data.username,
+            ip_address=ip_address,
+            device_fingerprint=data.device_fingerprint,
+            location_lat=location[0],
+            location_lon=location[1],
+            context=context,
+        )
+    metrics.risk_levels.inc(risk_result["risk_level"])
+    return context, risk_result
+
+
+def _record_throttled(db: Session, data: LoginRequest, ip_address: str, location: tuple):
+    # Only use a cached user id; a throttled request shouldn't cost a query
+    user = cache.users.get(data.username)
+    if audit.record_attempt(
+        db,
+        user_id=user.id if user is not cache.MISSING and user is not None else None,
         ip_address=ip_address,
         device_fingerprint=data.device_fingerprint,
-        location_lat=None,  # We'll add GeoIP later
-        location_lon=None,
-    )
+        location_lat=location[0],
+        location_lon=location[1],
+        success=False,
+        failure_reason="throttled",
+    ):
+        db.commit()
+
 
+def _complete_login(db: Session, data: LoginRequest, ip_address: str, location: tuple,
+                    user, risk_result: dict, password_ok: bool) -> LoginResponse:
     risk_level = risk_result["risk_level"]
     risk_score = risk_result["risk_score"]
+    location_lat, location_lon = location
 
-    # Verify user exists and password is correct
-    user = db.query(User).filter(User.username == data.username).first()
-    if not user or not verify_password(data.password, user.password_hash):
+    if not password_ok:
         # Log failed attempt
-        attempt = LoginAttempt(
+        if audit.record_attempt(
+            db,
             user_id=user.id if user else None,
             ip_address=ip_address,
             device_fingerprint=data.device_fingerprint,
+            location_lat=location_lat,
+            location_lon=location_lon,
             risk_score=risk_score,
             risk_level=risk_level,
             success=False,
             failure_reason="invalid_credentials",
-        )
-        db.add(attempt)
-        db.commit()
+        ):
+            db.commit()
+        metrics.logins.inc("invalid_credentials")
+        analytics.record("login", "invalid_credentials", risk_level,
+                         analytics.flagged_signals(risk_result), risk_score)
         return LoginResponse(
             success=False, message="Invalid credentials", risk_level=risk_level
         )
@@ -92,20 +172,29 @@ def login(data: LoginRequest, request: Request, db: Session = Depends(get_db)):
     # --- LOW RISK PATH ---
     if risk_level == "low":
         # Log successful attempt
-        attempt = LoginAttempt(
+        now = datetime.now(timezone.utc)
+        audit.record_attempt(
+            db,
             user_id=user.id,
+            timestamp=now,
             ip_address=ip_address,
             device_fingerprint=data.device_fingerprint,
+            location_lat=location_lat,
+            location_lon=location_lon,
             risk_score=risk_score,
             risk_level="low",
             success=True,
         )
-        db.add(attempt)
-        user.last_login = datetime.now(timezone.utc)
+        db.query(User).filter(User.id == user.id).update({User.last_login: now})
+        record_successful_login(db, user.id, now, location_lat, location_lon)
         db.commit()
+        cache.profiles.invalidate(user.id)
 
+        metrics.logins.inc("success")
+        analytics.record("login", "success", "low", analytics.flagged_signals(risk_result), risk_score)
         return LoginResponse(
-            success=True, message="Login successful", risk_level="low", risk_score=risk_score
+            success=True, message="Login successful", risk_level="low", risk_score=risk_score,
+            access_token=tokens.issue_access_token(user.id, user.username, "low", mfa=False),
         )
 
     # --- HIGH RISK PATH ---
@@ -118,12 +207,13 @@ def login(data: LoginRequest, request: Request, db: Session = Depends(get_db)):
         device_fingerprint=data.device_fingerprint,
     )
     db.add(pending)
+    # Delivered by the outbox dispatcher, so no send happens on this request
+    otp_delivery.enqueue_otp(db, pending, user, otp_code)
     db.commit()
+    otp_delivery.dispatcher.notify()
 
-    # In production: send OTP via email/SMS
-    # For demo: we'll return it in the response (remove in production!)
-    print(f"[DEMO] OTP for {data.username}: {otp_code}")
-
+    metrics.logins.inc("otp_required")
+    analytics.record("login", "otp_required", "high", analytics.flagged_signals(risk_result), risk_score)
     return LoginResponse(
         success=True,
         message="Additional verification required. OTP has been sent.",
@@ -131,98 +221,213 @@ def login(data: LoginRequest, request: Request, db: Session = Depends(get_db)):
         risk_score=risk_score,
         require_otp=True,
         pending_auth_id=pending.id,
-        otp_code=otp_code,
+        otp_code=otp_code if DEMO_MODE else None,  # Only the demo echoes the code back
     )
 
 
 # --- Verify OTP ---
 
 @router.post("/verify-otp", response_model=AuthResponse)
-def verify_otp(data: OTPVerifyRequest, db: Session = Depends(get_db)):
-    pending = db.query(PendingAuth).filter(
-        PendingAuth.id == data.pending_auth_id,
-        PendingAuth.is_used == False,
+@metrics.instrumented("verify_otp")
+def verify_otp(data: OTPVerifyRequest, request: Request, db: Session = Depends(get_db)):
+    ip_address = client_ip(request)
+    now = datetime.now(timezone.utc)
+
+    # Use up one attempt and, if the code matches, consume the session, in one
+    # conditional statement. The row stays locked until commit or rollback, so
+    # concurrent submissions can't both log in or go past the attempt limit.
+    claimed = db.execute(
+        update(PendingAuth).where(
+            PendingAuth.id == data.pending_auth_id,
+            PendingAuth.is_used == False,
+            PendingAuth.attempts < OTP_ATTEMPT_LIMIT,
+            PendingAuth.expires_at > now,
+        ).values(
+            attempts=PendingAuth.attempts + 1,
+            is_used=PendingAuth.otp_hash == hash_otp(data.otp_code),
+        ).returning(
+            PendingAuth.user_id, PendingAuth.is_used, PendingAuth.attempts,
+            PendingAuth.ip_address, PendingAuth.device_fingerprint,
+        ).execution_options(synchronize_session=False)
     ).first()
 
-    if not pending:
-        return AuthResponse(success=False, message="Invalid or expired session")
-
-     # Check expiration
-    expires = pending.expires_at
-    if expires.tzinfo is None:
-        expires = expires.replace(tzinfo=timezone.utc)
-    if datetime.now(timezone.utc) > expires:
-        return AuthResponse(success=False, message="OTP expired")
-
-    # Check attempts
-    if pending.attempts >= 3:
+    if claimed is None:
+        # Nothing was claimable; read the session only to report why
+        pending = db.query(
+            PendingAuth.user_id, PendingAuth.device_fingerprint, PendingAuth.is_used,
+            PendingAuth.attempts, PendingAuth.expires_at,
+        ).filter(PendingAuth.id == data.pending_auth_id).first()
+        _check_otp_throttle(db, ip_address, pending)
+
+        if pending is None or pending.is_used:
+            metrics.otp_verifications.inc("invalid_session")
+            analytics.record("otp", "invalid_session", "high")
+            return AuthResponse(success=False, message="Invalid or expired session")
+        if as_utc(pending.expires_at) <= now:
+            metrics.otp_verifications.inc("expired")
+            analytics.record("otp", "expired", "high")
+            return AuthResponse(success=False, message="OTP expired")
+        metrics.otp_verifications.inc("too_many_attempts")
+        analytics.record("otp", "too_many_attempts", "high")
         return AuthResponse(success=False, message="Too many attempts")
 
-    # Verify OTP
-    if hash_otp(data.otp_code) != pending.otp_hash:
-        pending.attempts += 1
+    limits = _check_otp_throttle(db, ip_address, claimed)
+
+    if not claimed.is_used:
         db.commit()
+        metrics.otp_verifications.inc("invalid_code")
+        analytics.record("otp", "invalid_code", "high")
         return AuthResponse(
             success=False,
-            message=f"Invalid OTP. {3 - pending.attempts} attempts remaining",
+            message=f"Invalid OTP. {OTP_ATTEMPT_LIMIT - claimed.attempts} attempts remaining",
         )
 
     # OTP valid — complete login
-    pending.is_used = True
-    user = db.query(User).filter(User.id == pending.user_id).first()
-    user.last_login = datetime.now(timezone.utc)
+    user_id = claimed.user_id
+    username = db.execute(
+        update(User).where(User.id == user_id).values(last_login=now).returning(User.username)
+        .execution_options(synchronize_session=False)
+    ).scalar_one()
 
     # Trust this device for future logins
-    if pending.device_fingerprint:
-        existing_device = db.query(TrustedDevice).filter(
-            TrustedDevice.user_id == user.id,
-            TrustedDevice.device_fingerprint == pending.device_fingerprint,
-        ).first()
-
-        if not existing_device:
-            trusted = TrustedDevice(
-                user_id=user.id,
-                device_fingerprint=pending.device_fingerprint,
-            )
-            db.add(trusted)
+    if claimed.device_fingerprint:
+        trust_device(db, user_id, claimed.device_fingerprint, now)
 
     # Log successful attempt
-    attempt = LoginAttempt(
-        user_id=user.id,
-        ip_address=pending.ip_address,
-        device_fingerprint=pending.device_fingerprint,
+    location_lat, location_lon = resolve_location(claimed.ip_address or "") or (None, None)
+    audit.record_attempt(
+        db,
+        user_id=user_id,
+        timestamp=now,
+        ip_address=claimed.ip_address,
+        device_fingerprint=claimed.device_fingerprint,
+        location_lat=location_lat,
+        location_lon=location_lon,
         risk_score=0,
         risk_level="high",
         success=True,
     )
-    db.add(attempt)
+    record_successful_login(db, user_id, now, location_lat, location_lon)
     db.commit()
+    cache.invalidate_user_state(user_id)
+    throttle.otp.refund(limits)
+
+    metrics.otp_verifications.inc("success")
+    analytics.record("otp", "success", "high")
+    return AuthResponse(
+        success=True,
+        message="Login successful",
+        access_token=tokens.issue_access_token(user_id, username, "high", mfa=True),
+    )
+
+
+def _check_otp_throttle(db: Session, ip_address: str, pending) -> list[str]:
+    """Count this submission against the OTP limiter; returns its keys, or raises Throttled."""
+    # The per-session attempt limit doesn't stop guessing across many sessions
+    limits = throttle.otp_limits(ip_address, pending.user_id if pending else None)
+    retry_after = throttle.otp.hit(limits)
+    if retry_after is not None:
+        metrics.throttled.inc("otp")
+        analytics.record("otp", "throttled", "high")
+        db.rollback()  # A throttled submission doesn't use up the session's attempt
+        if audit.record_attempt(
+            db,
+            user_id=pending.user_id if pending else None,
+            ip_address=ip_address,
+            device_fingerprint=pending.device_fingerprint if pending else None,
+            risk_level="high",
+            success=False,
+            failure_reason="otp_throttled",
+        ):
+            db.commit()
+        raise throttle.Throttled(retry_after)
+    return list(limits)
 
-    return AuthResponse(success=True, message="Login successful")
+
+# --- Token Introspection ---
+
+@router.post("/introspect", response_model=IntrospectResponse, response_model_exclude_none=True)
+def introspect(data: IntrospectRequest):
+    # Verified locally from the token and its signing key, without touching the database
+    try:
+        claims = tokens.verify_access_token(data.token)
+    except tokens.InvalidToken:
+        return IntrospectResponse(active=False)
+    return IntrospectResponse(active=True, **claims)
 
 
 
 # --- Risk Assessment Debug (Demo Only) ---
 
 @router.post("/debug/risk-assessment")
-def debug_risk(data: LoginRequest, request: Request, db: Session = Depends(get_db)):
-    ip_address = request.client.host if request.client else "unknown"
-
-    risk_result = assess_risk(
-        db=db,
-        username=data.username,
-        ip_address=ip_address,
-        device_fingerprint=data.device_fingerprint,
-        location_lat=None,
-        location_lon=None,
-    )
+def debug_risk(data: LoginRequest, request: Request, timings: bool = False, db: Session = Depends(get_db)):
+    # ?timings=true adds a per-signal, per-stage and database breakdown of this request
+    breakdown = metrics.start_request(always=True) if timings else None
+    ip_address = client_ip(request)
+    location_lat, location_lon = resolve_location(ip_address) or (None, None)
+
+    with metrics.stage("risk_context"):
+        context = load_risk_context(db, data.username, data.device_fingerprint)
+    with metrics.stage("risk_assessment"):
+        risk_result = assess_risk(
+            db=db,
+            username=data.username,
+            ip_address=ip_address,
+            device_fingerprint=data.device_fingerprint,
+            location_lat=location_lat,
+            location_lon=location_lon,
+            context=context,
+            full=True,
+        )
 
-    return {
+    response = {
         "username": data.username,
         "ip_address": ip_address,
         "device_fingerprint": data.device_fingerprint,
+        "location": {"lat": location_lat, "lon": location_lon},
         "risk_score": risk_result["risk_score"],
         "risk_level": risk_result["risk_level"],
-        "threshold": 100,
+        "threshold": RISK_THRESHOLD,
+        "scorer": risk_result.get("scorer", "rules"),
         "signals": risk_result["signals"],
     }
+    if breakdown is not None:
+        response["timings"] = breakdown.report()
+        metrics.finish_request("debug_risk_assessment", breakdown)
+    return response
+
+
+@router.get("/debug/cache-stats")
+def debug_cache_stats():
+    return {**cache.cache_stats(), tokens.verified.name: tokens.verified.stats()}
+
+
+@router.get("/debug/audit-stats")
+def debug_audit_stats():
+    return audit.sink.stats()
+
+
+@router.get("/debug/maintenance-stats")
+def debug_maintenance_stats():
+    return maintenance.worker.stats()
+
+
+@router.get("/debug/throttle-stats")
+def debug_throttle_stats():
+    return throttle.throttle_stats()
+
+
+@router.get("/debug/analytics-stats")
+def debug_analytics_stats():
+    return analytics.recorder.stats()
+
+
+@router.get("/debug/anomaly-model-stats")
+def debug_anomaly_model_stats():
+    from app import anomaly  # Imported on demand: it pulls in NumPy, which startup otherwise skips
+    return {"risk_scorer": RISK_SCORER, **anomaly.model.stats()}
+
+
+@router.get("/debug/otp-delivery-stats")
+def debug_otp_delivery_stats():
+    return otp_delivery.dispatcher.stats()
@@ -0,0 +1,174 @@
+"""
+Bounded LRU caches, with a TTL and race-safe invalidation, for the state the risk
+engine reads on every login. See docs/design-notes.md for the multi-worker caveat.
+"""
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+
+from app.config import CACHE_ENABLED, CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS
+
+MISSING = object()  # Distinguishes "not cached" from a cached None
+
+_sequence = itertools.count(1)  # Numbers invalidations across every cache
+_current = 0
+
+
+def generation() -> int:
+    """A token to take before loading a value from the database, for set()."""
+    return _current
+
+
+def _next_generation() -> int:
+    global _current
+    _current = value = next(_sequence)
+    return value
+
+
+class TTLCache:
+    """Thread-safe LRU cache with a per-entry time-to-live and hit/miss counters."""
+
+    def __init__(self, name: str, max_entries: int, ttl_seconds: float):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._invalidated = OrderedDict()  # key -> generation of its last invalidation
+        self._floor = 0  # Tokens older than this may have lost their key's invalidation
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.stale_sets = 0
+
+    def get(self, key):
+        """Return the cached value for key, or MISSING."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISSING
+
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return MISSING
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, since: int | None = None):
+        """
+        Cache value for key. Pass the generation() token taken before value
+        was loaded; the value is dropped if key was invalidated since.
+        """
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            if since is not None and (since < self._floor or self._invalidated.get(key, 0) > since):
+                self.stale_sets += 1
+                return
+            self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._invalidated[key] = _next_generation()
+            self._invalidated.move_to_end(key)
+            # Forget the oldest invalidations; loads that started before them are refused instead
+            while len(self._invalidated) > max(self.max_entries, 1024):
+                _, self._floor = self._invalidated.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._invalidated.clear()
+            self._floor = _next_generation()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "stale_sets": self.stale_sets,
+            }
+
+
+@dataclass(frozen=True)
+class CachedUser:
+    id: int
+    username: str
+    email: str
+    password_hash: str
+
+
+@dataclass(frozen=True)
+class CachedProfile:
+    hour_histogram: tuple
+    histogram_updated_at: datetime | None
+    last_lat: float | None
+    last_lon: float | None
+    last_location_at: datetime | None
+    last_login_at: datetime | None
+    trusted_device_count: int
+
+
+def snapshot_user(user) -> CachedUser:
+    return CachedUser(
+        id=user.id,
+        username=user.username,
+        email=user.email,
+        password_hash=user.password_hash,
+    )
+
+
+def snapshot_profile(profile) -> CachedProfile | None:
+    if profile is None:
+        return None
+    return CachedProfile(
+        hour_histogram=tuple(profile.hour_histogram or [0.0] * 24),
+        histogram_updated_at=profile.histogram_updated_at,
+        last_lat=profile.last_lat,
+        last_lon=profile.last_lon,
+        last_location_at=profile.last_location_at,
+        last_login_at=profile.last_login_at,
+        trusted_device_count=profile.trusted_device_count or 0,
+    )
+
+
+_max_entries = CACHE_MAX_ENTRIES if CACHE_ENABLED else 0
+
+# username -> CachedUser, or None for usernames that don't exist
+users = TTLCache("users", _max_entries, CACHE_TTL_SECONDS)
+# user_id -> frozenset of trusted device fingerprints
+trusted_devices = TTLCache("trusted_devices", _max_entries, CACHE_TTL_SECONDS)
+# user_id -> CachedProfile, or None for users without a profile yet
+profiles = TTLCache("profiles", _max_entries, CACHE_TTL_SECONDS)
+
+ALL_CACHES = (users, trusted_devices, profiles)
+
+
+def invalidate_user_state(user_id: int):
+    """Drop everything cached about a user's devices and login history."""
+    trusted_devices.invalidate(user_id)
+    profiles.invalidate(user_id)
+
+
+def cache_stats() -> dict:
+    return {cache.name: cache.stats() for cache in ALL_CACHES}
@@ -0,0 +1,32 @@
+"""
+The client's address, as seen through trusted reverse proxies.
+
+Behind a load balancer request.client is the proxy, so every client would
+share one throttle key and one GeoIP location. Each proxy appends the
+address it received the request from to X-Forwarded-For. With
+TRUSTED_PROXY_HOPS proxies in front of the app, the client is therefore the
+entry that many places from the right. Entries further left were sent by
+the client itself and can be forged, so they are never used. That is also
+why uvicorn's --forwarded-allow-ips='*', which takes the leftmost entry,
+isn't used.
+
+Only set TRUSTED_PROXY_HOPS where the app can't be reached except through
+those proxies; otherwise a client can name any address it likes.
+"""
+from starlette.requests import Request
+
+from app.config import TRUSTED_PROXY_HOPS
+from app.ip_index import packed_address
+
+
+def client_ip(request: Request, hops: int = TRUSTED_PROXY_HOPS) -> str:
+    peer = request.client.host if request.client else "unknown"
+    if hops <= 0:
+        return peer
+
+    forwarded = [entry.strip() for entry in request.headers.get("x-forwarded-for", "").split(",")]
+    forwarded = [entry for entry in forwarded if entry]
+    if len(forwarded) < hops:
+        return peer  # Didn't come through every proxy
+    candidate = forwarded[-hops]
+    return candidate if packed_address(candidate) is not None else peer
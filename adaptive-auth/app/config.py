@@ -1,7 +1,148 @@
 from dotenv import load_dotenv
+from pathlib import Path
 import os
 
 load_dotenv()
 
+BASE_DIR = Path(__file__).resolve().parent.parent
+DATA_DIR = BASE_DIR / "data"
+
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./adaptive_auth.db")
-SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret-key-change-in-production")
+DEFAULT_SECRET_KEY = "dev-secret-key-change-in-production"  # Public; outside DEMO_MODE the app refuses to start on it
+SECRET_KEY = os.getenv("SECRET_KEY", DEFAULT_SECRET_KEY)
+
+# In-process cache for user, trusted-device and profile lookups
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "true").lower() == "true"
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "60"))
+
+# Worker pool that runs bcrypt off the event loop
+HASH_POOL_KIND = os.getenv("HASH_POOL_KIND", "thread")  # "thread" or "process"
+HASH_POOL_SIZE = int(os.getenv("HASH_POOL_SIZE", str(os.cpu_count() or 2)))  # 0 runs bcrypt in Starlette's threadpool
+HASH_POOL_QUEUE_LIMIT = int(os.getenv("HASH_POOL_QUEUE_LIMIT", "64"))
+
+# IP reputation: comma-separated blocklist files of "CIDR [points]" lines
+IP_BLOCKLIST_PATHS = [
+    path.strip() for path in os.getenv("IP_BLOCKLIST_PATHS", str(DATA_DIR / "ip_blocklist.txt")).split(",")
+    if path.strip()
+]
+IP_REPUTATION_INDEX_PATH = os.getenv("IP_REPUTATION_INDEX_PATH", str(DATA_DIR / "ip_reputation.idx"))
+IP_REPUTATION_DEFAULT_POINTS = int(os.getenv("IP_REPUTATION_DEFAULT_POINTS", "90"))
+IP_REPUTATION_MAX_POINTS = int(os.getenv("IP_REPUTATION_MAX_POINTS", "150"))
+IP_REPUTATION_RELOAD_SECONDS = float(os.getenv("IP_REPUTATION_RELOAD_SECONDS", "5"))
+
+# Offline GeoIP: comma-separated CSV files of "network,latitude,longitude" rows
+GEOIP_DB_PATHS = [
+    path.strip() for path in os.getenv("GEOIP_DB_PATHS", str(DATA_DIR / "geoip.csv")).split(",")
+    if path.strip()
+]
+GEOIP_INDEX_PATH = os.getenv("GEOIP_INDEX_PATH", str(DATA_DIR / "geoip.idx"))
+GEOIP_CACHE_SIZE = int(os.getenv("GEOIP_CACHE_SIZE", "65536"))
+GEOIP_RELOAD_SECONDS = float(os.getenv("GEOIP_RELOAD_SECONDS", "30"))
+
+# LoginAttempt audit trail: "sync" writes in the request's transaction,
+# "async" queues attempts for a background writer that group-commits them
+AUDIT_MODE = os.getenv("AUDIT_MODE", "sync")
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+AUDIT_FLUSH_INTERVAL_SECONDS = float(os.getenv("AUDIT_FLUSH_INTERVAL_SECONDS", "0.2"))
+AUDIT_OVERFLOW = os.getenv("AUDIT_OVERFLOW", "sync")  # "sync", "block" or "drop" when the queue is full
+
+# Database engine tuning
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL")  # Derived from DATABASE_URL when unset
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "30"))
+DB_POOL_RECYCLE_SECONDS = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800"))
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+# Background maintenance: pending_auth expiry, login_attempts retention, vacuum
+MAINTENANCE_ENABLED = os.getenv("MAINTENANCE_ENABLED", "true").lower() == "true"
+MAINTENANCE_INTERVAL_SECONDS = float(os.getenv("MAINTENANCE_INTERVAL_SECONDS", "900"))
+MAINTENANCE_BATCH_SIZE = int(os.getenv("MAINTENANCE_BATCH_SIZE", "500"))
+MAINTENANCE_PAUSE_SECONDS = float(os.getenv("MAINTENANCE_PAUSE_SECONDS", "0.05"))  # Between batches, to let logins write
+LOGIN_ATTEMPT_RETENTION_DAYS = int(os.getenv("LOGIN_ATTEMPT_RETENTION_DAYS", "90"))
+VACUUM_PAGES_PER_RUN = int(os.getenv("VACUUM_PAGES_PER_RUN", "1000"))
+
+# Reverse proxies in front of the app; 0 uses the peer address and ignores X-Forwarded-For
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))  # 1 on Railway, behind its edge proxy
+
+# Brute-force throttling, checked before any risk assessment or bcrypt work
+THROTTLE_ENABLED = os.getenv("THROTTLE_ENABLED", "true").lower() == "true"
+THROTTLE_BACKEND = os.getenv("THROTTLE_BACKEND", "memory")  # "memory" (per worker) or "file" (shared)
+THROTTLE_STORE_PATH = os.getenv("THROTTLE_STORE_PATH", str(DATA_DIR / "throttle.db"))
+THROTTLE_MAX_KEYS = int(os.getenv("THROTTLE_MAX_KEYS", "100000"))  # Memory backend only
+THROTTLE_WINDOW_SECONDS = float(os.getenv("THROTTLE_WINDOW_SECONDS", "300"))
+THROTTLE_IP_LIMIT = int(os.getenv("THROTTLE_IP_LIMIT", "100"))
+THROTTLE_USERNAME_LIMIT = int(os.getenv("THROTTLE_USERNAME_LIMIT", "20"))
+THROTTLE_PAIR_LIMIT = int(os.getenv("THROTTLE_PAIR_LIMIT", "10"))
+THROTTLE_OTP_IP_LIMIT = int(os.getenv("THROTTLE_OTP_IP_LIMIT", "30"))
+THROTTLE_OTP_USER_LIMIT = int(os.getenv("THROTTLE_OTP_USER_LIMIT", "10"))
+
+# Access tokens. JWT_KEYS is "kid:secret,kid:secret"; the first key signs, the rest only verify
+JWT_KEYS = os.getenv("JWT_KEYS", "")
+JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
+JWT_ISSUER = os.getenv("JWT_ISSUER", "adaptive-auth")
+ACCESS_TOKEN_TTL_SECONDS = int(os.getenv("ACCESS_TOKEN_TTL_SECONDS", "900"))
+TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", "10000"))
+
+# Batch risk scoring
+BATCH_SCORING_MAX_EVENTS = int(os.getenv("BATCH_SCORING_MAX_EVENTS", "50000"))
+
+# Demo mode returns the OTP in the login response so the demo works without a real sender
+DEMO_MODE = os.getenv("DEMO_MODE", "true").lower() == "true"
+
+# OTP delivery: outbox dispatcher and transport
+OTP_TRANSPORT = os.getenv("OTP_TRANSPORT", "log")  # "log", "file", "memory" or "package.module:ClassName"
+OTP_FILE_PATH = os.getenv("OTP_FILE_PATH", str(DATA_DIR / "otp_messages.jsonl"))
+OTP_DISPATCH_BATCH_SIZE = int(os.getenv("OTP_DISPATCH_BATCH_SIZE", "50"))
+OTP_DISPATCH_INTERVAL_SECONDS = float(os.getenv("OTP_DISPATCH_INTERVAL_SECONDS", "1.0"))  # Poll; new OTPs wake it early
+OTP_MAX_ATTEMPTS = int(os.getenv("OTP_MAX_ATTEMPTS", "5"))
+OTP_RETRY_BASE_SECONDS = float(os.getenv("OTP_RETRY_BASE_SECONDS", "1.0"))  # Doubles after each failed attempt
+OTP_CLAIM_TIMEOUT_SECONDS = float(os.getenv("OTP_CLAIM_TIMEOUT_SECONDS", "30"))
+OTP_OUTBOX_KEY = os.getenv("OTP_OUTBOX_KEY", "")  # Fernet key for queued codes; derived from SECRET_KEY if unset
+
+# Metrics: Prometheus text at /metrics, plus per-signal and per-stage timing histograms
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+METRICS_SIGNAL_SAMPLE_EVERY = int(os.getenv("METRICS_SIGNAL_SAMPLE_EVERY", "16"))  # 1 times every assessment
+
+# Frontend static serving: files smaller than this aren't gzip/brotli encoded
+FRONTEND_DIST = BASE_DIR / "frontend" / "dist"
+STATIC_COMPRESS_MIN_BYTES = int(os.getenv("STATIC_COMPRESS_MIN_BYTES", "1024"))
+
+# Login-attempt export for SIEM ingestion; /export is disabled while EXPORT_TOKEN is empty
+EXPORT_TOKEN = os.getenv("EXPORT_TOKEN", "")
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "2000"))
+EXPORT_SETTLE_SECONDS = float(os.getenv("EXPORT_SETTLE_SECONDS", "5"))  # Leaves rows still in the audit queue for the next run
+
+# Risk analytics: hourly rollups counted in memory and upserted in the background
+ANALYTICS_ENABLED = os.getenv("ANALYTICS_ENABLED", "true").lower() == "true"
+ANALYTICS_FLUSH_INTERVAL_SECONDS = float(os.getenv("ANALYTICS_FLUSH_INTERVAL_SECONDS", "5"))
+ANALYTICS_MAX_RANGE_DAYS = int(os.getenv("ANALYTICS_MAX_RANGE_DAYS", "366"))
+
+# Bulk user provisioning; /provision is disabled while PROVISION_TOKEN is empty
+PROVISION_TOKEN = os.getenv("PROVISION_TOKEN", "")
+PROVISION_WORKERS = int(os.getenv("PROVISION_WORKERS", "0"))  # bcrypt processes per import; 0: all cores in the CLI, a quarter in the server
+PROVISION_CHUNK_SIZE = int(os.getenv("PROVISION_CHUNK_SIZE", "2000"))  # Rows deduplicated and hashed together
+PROVISION_INSERT_BATCH = int(os.getenv("PROVISION_INSERT_BATCH", "500"))  # Rows per insert transaction
+PROVISION_PAUSE_SECONDS = float(os.getenv("PROVISION_PAUSE_SECONDS", "0.02"))  # Lets waiting writers in between batches
+PROVISION_MAX_REPORTED_ERRORS = int(os.getenv("PROVISION_MAX_REPORTED_ERRORS", "1000"))
+
+# Risk scorer: "rules" (the weighted signals) or "anomaly" (per-user model from python -m app.anomaly train)
+RISK_SCORER = os.getenv("RISK_SCORER", "rules")
+ANOMALY_MODEL_PATH = os.getenv("ANOMALY_MODEL_PATH", str(DATA_DIR / "anomaly_model.bin"))
+ANOMALY_POINTS_PER_BIT = float(os.getenv("ANOMALY_POINTS_PER_BIT", "15"))  # 100 points, and MFA, at ~6.7 bits of surprise
+ANOMALY_CHALLENGE_NEW_DEVICES = os.getenv("ANOMALY_CHALLENGE_NEW_DEVICES", "true").lower() == "true"  # As the rules do
+ANOMALY_HISTORY_DAYS = int(os.getenv("ANOMALY_HISTORY_DAYS", str(LOGIN_ATTEMPT_RETENTION_DAYS)))  # Older logins are purged
+ANOMALY_HALF_LIFE_DAYS = float(os.getenv("ANOMALY_HALF_LIFE_DAYS", "30"))  # A login's weight in training halves monthly
+ANOMALY_RELOAD_SECONDS = float(os.getenv("ANOMALY_RELOAD_SECONDS", "30"))
+
+# Startup: schema migration and pre-warming before /health/ready reports ready
+# Deployments migrate once before the workers start (python -m app.migrate); true has every worker do it, for development
+AUTO_MIGRATE = os.getenv("AUTO_MIGRATE", "false").lower() == "true"
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+WARMUP_DB_CONNECTIONS = int(os.getenv("WARMUP_DB_CONNECTIONS", "4"))  # Pooled connections opened before ready
+WARMUP_HOT_USERS = int(os.getenv("WARMUP_HOT_USERS", "2000"))  # Most active users whose state is preloaded into the caches
+WARMUP_HOT_USERS_HOURS = float(os.getenv("WARMUP_HOT_USERS_HOURS", "24"))  # Activity window that ranks them
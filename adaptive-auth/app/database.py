@@ -1,15 +1,141 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
-from app.config import DATABASE_URL
+from app import metrics
+from app.config import (
+    DATABASE_URL, ASYNC_DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT_SECONDS,
+    DB_POOL_RECYCLE_SECONDS, SQLITE_JOURNAL_MODE, SQLITE_SYNCHRONOUS, SQLITE_BUSY_TIMEOUT_MS,
+)
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# Async drivers used when ASYNC_DATABASE_URL isn't set explicitly
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+
+
+def normalize_url(url: str) -> str:
+    # Heroku/Railway hand out postgres:// URLs, which SQLAlchemy no longer accepts
+    if url.startswith("postgres://"):
+        return "postgresql://" + url[len("postgres://"):]
+    return url
+
+
+def is_sqlite(url: str) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+
+def engine_options(url: str) -> dict:
+    """Engine keyword arguments appropriate for the URL's backend."""
+    if is_sqlite(url):
+        return {"connect_args": {
+            "check_same_thread": False,
+            "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000,
+        }}
+
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT_SECONDS,
+        "pool_recycle": DB_POOL_RECYCLE_SECONDS,
+        "pool_pre_ping": True,
+    }
+
+
+def configure_sqlite_connection(dbapi_connection, connection_record):
+    # WAL lets readers run alongside the single writer; NORMAL skips an fsync per commit
+    # auto_vacuum only takes effect on a new file; see app.maintenance for existing ones
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.close()
+
+
+def dialect_insert(bind, model):
+    """An INSERT supporting ON CONFLICT clauses, for SQLite and PostgreSQL."""
+    if bind.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model)
+
+
+def insert_or_ignore(bind, model, conflict_columns: list[str]):
+    """INSERT ... ON CONFLICT DO NOTHING, for SQLite and PostgreSQL."""
+    return dialect_insert(bind, model).on_conflict_do_nothing(index_elements=conflict_columns)
+
+
+def build_engine(url: str):
+    url = normalize_url(url)
+    engine = create_engine(url, **engine_options(url))
+    if is_sqlite(url):
+        event.listen(engine, "connect", configure_sqlite_connection)
+    metrics.instrument_engine(engine)
+    return engine
+
+
+engine = build_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+metrics.instrument_sessions(SessionLocal)
 Base = declarative_base()
 
 
+def dispose_inherited_connections():
+    """ProcessPoolExecutor initializer: never reuse connections inherited from the parent process."""
+    engine.dispose(close=False)
+
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+# --- Optional async engine ---
+# Created on first use so the async driver (aiosqlite or asyncpg) is only
+# required by deployments that actually use AsyncSession.
+
+_async_engine = None
+_AsyncSessionLocal = None
+
+
+def async_database_url() -> str:
+    if ASYNC_DATABASE_URL:
+        return normalize_url(ASYNC_DATABASE_URL)
+
+    url = make_url(normalize_url(DATABASE_URL))
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None:
+        raise RuntimeError(f"No async driver known for {url.get_backend_name()}; set ASYNC_DATABASE_URL")
+    return url.set(drivername=f"{url.get_backend_name()}+{driver}").render_as_string(hide_password=False)
+
+
+def get_async_sessionmaker():
+    global _async_engine, _AsyncSessionLocal
+    if _AsyncSessionLocal is None:
+        from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+        url = async_database_url()
+        options = engine_options(url)
+        if is_sqlite(url):
+            # aiosqlite runs each connection on its own thread already
+            options["connect_args"].pop("check_same_thread")
+        _async_engine = create_async_engine(url, **options)
+        if is_sqlite(url):
+            event.listen(_async_engine.sync_engine, "connect", configure_sqlite_connection)
+        metrics.instrument_engine(_async_engine.sync_engine)
+        _AsyncSessionLocal = async_sessionmaker(_async_engine, class_=AsyncSession, expire_on_commit=False)
+    return _AsyncSessionLocal
+
+
+async def get_async_db():
+    """FastAPI dependency yielding an AsyncSession, for async endpoints."""
+    async with get_async_sessionmaker()() as db:
+        yield db
+
+
+async def dispose_engines():
+    engine.dispose()
+    if _async_engine is not None:
+        await _async_engine.dispose()
@@ -1,11 +1,20 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter, ValidationError
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from datetime import datetime, timedelta, timezone
-import bcrypt
+import json
 
+from app import cache
+from app.config import BATCH_SCORING_MAX_EVENTS
 from app.database import get_db
+from app.hashing import hash_password
 from app.models import User, LoginAttempt, TrustedDevice
 from app.risk_engine import assess_risk, RISK_THRESHOLD
+from app.profiles import rebuild_profile
+from app.schemas import ScoringEvent
 
 router = APIRouter(prefix="/demo", tags=["Demo & Simulation"])
 
@@ -30,6 +39,7 @@ def simulate_login(
         device_fingerprint=device_fingerprint,
         location_lat=location_lat,
         location_lon=location_lon,
+        full=True,
     )
 
     return {
@@ -45,6 +55,61 @@ def simulate_login(
     }
 
 
+_event_list = TypeAdapter(list[ScoringEvent])
+
+
+async def _read_events(request: Request) -> list[ScoringEvent]:
+    """Parse a JSON array of events, or NDJSON as it streams in."""
+    try:
+        if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+            events = []
+            buffer = b""
+            async for chunk in request.stream():
+                *lines, buffer = (buffer + chunk).split(b"\n")
+                events.extend(ScoringEvent.model_validate_json(line) for line in lines if line.strip())
+                if len(events) > BATCH_SCORING_MAX_EVENTS:
+                    break
+            if buffer.strip():
+                events.append(ScoringEvent.model_validate_json(buffer))
+        else:
+            events = _event_list.validate_json(await request.body())
+    except ValidationError as exc:
+        raise RequestValidationError(exc.errors(include_url=False, include_context=False))
+
+    if len(events) > BATCH_SCORING_MAX_EVENTS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_SCORING_MAX_EVENTS} events per batch")
+    return events
+
+
+@router.post("/simulate-batch")
+async def simulate_batch(request: Request, db: Session = Depends(get_db)):
+    """
+    Score many candidate events at once, with the same per-signal breakdown
+    as /simulate-login. Send a JSON array of events, or NDJSON (one event
+    per line, Content-Type: application/x-ndjson) to get NDJSON back.
+    """
+    from app.batch_scoring import score_events  # NumPy is imported on the first batch, not at startup
+
+    events = await _read_events(request)
+    results = await run_in_threadpool(score_events, db, events)
+
+    rows = (
+        {
+            "username": event.username,
+            "ip_address": event.ip_address,
+            "device_fingerprint": event.device_fingerprint,
+            "location": {"lat": event.location_lat, "lon": event.location_lon},
+            **result,
+            "action": "Require MFA" if result["risk_level"] == "high" else "Allow password-only",
+        }
+        for event, result in zip(events, results)
+    )
+
+    if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+        return StreamingResponse((json.dumps(row) + "\n" for row in rows), media_type="application/x-ndjson")
+    return {"count": len(results), "threshold": RISK_THRESHOLD, "results": list(rows)}
+
+
 @router.post("/seed-login-history")
 def seed_login_history(username: str, db: Session = Depends(get_db)):
     """
@@ -54,11 +119,10 @@ def seed_login_history(username: str, db: Session = Depends(get_db)):
     user = db.query(User).filter(User.username == username).first()
     if not user:
         # Auto-create demo user so the simulation panel works out of the box
-        hashed = bcrypt.hashpw("password123".encode('utf-8'), bcrypt.gensalt())
         user = User(
             username=username,
             email=f"{username}@demo.local",
-            password_hash=hashed.decode('utf-8'),
+            password_hash=hash_password("password123"),
         )
         db.add(user)
         db.commit()
@@ -111,7 +175,13 @@ def seed_login_history(username: str, db: Session = Depends(get_db)):
             device_fingerprint="home-macbook-pro",
         ))
 
+    # Seeded attempts are backdated, so rebuild the profile rather than folding them in
+    db.flush()
+    rebuild_profile(db, user.id)
+
     db.commit()
+    cache.users.invalidate(username)
+    cache.invalidate_user_state(user.id)
     return {
         "success": True,
         "message": f"Seeded 11 login attempts (including 1 recent) and trusted device for {username}",
@@ -0,0 +1,196 @@
+"""
+Streaming export of login_attempts for SIEM ingestion, as NDJSON or CSV, with
+resumable keyset cursors. Design notes are in docs/design-notes.md.
+"""
+import argparse
+import base64
+import csv
+import io
+import json
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import Iterator
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, tuple_
+
+from app import audit
+from app.config import (
+    AUDIT_FLUSH_INTERVAL_SECONDS, AUDIT_MODE, EXPORT_PAGE_SIZE, EXPORT_SETTLE_SECONDS, EXPORT_TOKEN,
+)
+from app.database import engine
+from app.models import LoginAttempt, User
+from app.profiles import as_utc
+from app.tokens import require_static_token
+
+router = APIRouter(prefix="/export", tags=["Export"])
+
+FIELDS = ["cursor", "id", "timestamp", "user_id", "username", "ip_address", "device_fingerprint",
+          "location_lat", "location_lon", "risk_score", "risk_level", "success", "failure_reason"]
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(timestamp: datetime, attempt_id: int) -> str:
+    return _cursor(as_utc(timestamp).isoformat(), attempt_id)
+
+
+def _cursor(iso_timestamp: str, attempt_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{iso_timestamp}|{attempt_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        timestamp, _, attempt_id = raw.partition("|")
+        return as_utc(datetime.fromisoformat(timestamp)), int(attempt_id)
+    except ValueError as exc:  # Includes binascii.Error and UnicodeDecodeError
+        raise InvalidCursor(f"invalid cursor {cursor!r}") from exc
+
+
+def check_settle_window():
+    """Raise at startup if the async audit writer's normal lag can exceed EXPORT_SETTLE_SECONDS."""
+    # The writer waits up to one flush interval for a first row, then up to one more to fill the batch
+    if EXPORT_TOKEN and AUDIT_MODE == "async" and EXPORT_SETTLE_SECONDS <= 2 * AUDIT_FLUSH_INTERVAL_SECONDS:
+        raise RuntimeError("EXPORT_SETTLE_SECONDS must be more than twice AUDIT_FLUSH_INTERVAL_SECONDS, "
+                           "or the export can pass attempts still queued for writing")
+
+
+def parse_since(value: str) -> datetime:
+    """An ISO date or datetime; without an offset it is taken as UTC."""
+    return as_utc(datetime.fromisoformat(value.replace("Z", "+00:00")))
+
+
+def _page_query(after: tuple[datetime, int] | None, since: datetime | None, until: datetime, limit: int):
+    query = select(
+        LoginAttempt.id, LoginAttempt.timestamp, LoginAttempt.user_id, User.username,
+        LoginAttempt.ip_address, LoginAttempt.device_fingerprint,
+        LoginAttempt.location_lat, LoginAttempt.location_lon,
+        LoginAttempt.risk_score, LoginAttempt.risk_level, LoginAttempt.success, LoginAttempt.failure_reason,
+    ).outerjoin(User, User.id == LoginAttempt.user_id).where(LoginAttempt.timestamp < until)
+    if after is not None:
+        query = query.where(tuple_(LoginAttempt.timestamp, LoginAttempt.id) > after)
+    if since is not None:
+        query = query.where(LoginAttempt.timestamp >= since)
+    return query.order_by(LoginAttempt.timestamp, LoginAttempt.id).limit(limit)
+
+
+def iter_attempts(since: datetime | None = None, cursor: str | None = None, until: datetime | None = None,
+                  page_size: int = EXPORT_PAGE_SIZE) -> Iterator[dict]:
+    """Yield attempts after cursor (and at or after since) as dicts, a page per connection."""
+    after = decode_cursor(cursor) if cursor else None
+    if until is None:
+        # This process's queued attempts are held back exactly; other workers' by the settle time
+        flushed = min(datetime.now(timezone.utc), audit.sink.flushed_through())
+        until = flushed - timedelta(seconds=EXPORT_SETTLE_SECONDS)
+    while True:
+        with engine.connect() as conn:
+            rows = conn.execute(_page_query(after, since, until, page_size)).all()
+        for row in rows:
+            timestamp = as_utc(row.timestamp).isoformat()
+            yield {
+                "cursor": _cursor(timestamp, row.id),
+                "id": row.id,
+                "timestamp": timestamp.replace("+00:00", "Z"),
+                "user_id": row.user_id,
+                "username": row.username,
+                "ip_address": row.ip_address,
+                "device_fingerprint": row.device_fingerprint,
+                "location_lat": row.location_lat,
+                "location_lon": row.location_lon,
+                "risk_score": row.risk_score,
+                "risk_level": row.risk_level,
+                "success": row.success,
+                "failure_reason": row.failure_reason,
+            }
+        if len(rows) < page_size:
+            return
+        after = (rows[-1].timestamp, rows[-1].id)
+
+
+def iter_ndjson(attempts: Iterator[dict], page_size: int = EXPORT_PAGE_SIZE) -> Iterator[str]:
+    lines = []
+    for attempt in attempts:
+        lines.append(json.dumps(attempt) + "\n")
+        if len(lines) >= page_size:
+            yield "".join(lines)
+            lines = []
+    if lines:
+        yield "".join(lines)
+
+
+def iter_csv(attempts: Iterator[dict], page_size: int = EXPORT_PAGE_SIZE) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=FIELDS, lineterminator="\n")
+    writer.writeheader()
+    for n, attempt in enumerate(attempts, 1):
+        writer.writerow(attempt)
+        if n % page_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+ENCODERS = {"ndjson": iter_ndjson, "csv": iter_csv}
+
+
+@router.get("/login-attempts", dependencies=[Depends(require_static_token(EXPORT_TOKEN, "EXPORT_TOKEN"))])
+def export_login_attempts(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    since: str | None = None,
+    cursor: str | None = None,
+):
+    """
+    Stream login attempts in (timestamp, id) order. Resume with the cursor
+    of the last row received. Requires `Authorization: Bearer <EXPORT_TOKEN>`.
+    """
+    try:
+        since_at = parse_since(since) if since else None
+        if cursor:
+            decode_cursor(cursor)  # Reject a bad cursor before the 200 goes out
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+
+    # A sync iterator: Starlette pulls each chunk in its threadpool
+    body = ENCODERS[format](iter_attempts(since_at, cursor))
+    return StreamingResponse(body, media_type=MEDIA_TYPES[format],
+                             headers={"Content-Disposition": f'attachment; filename="login_attempts.{format}"'})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export login attempts as NDJSON or CSV")
+    parser.add_argument("--format", choices=sorted(ENCODERS), default="ndjson")
+    parser.add_argument("--since", type=parse_since, help="ISO date or datetime, UTC unless an offset is given")
+    parser.add_argument("--cursor", help="resume after the row with this cursor")
+    parser.add_argument("--output", help="file to write; defaults to stdout")
+    args = parser.parse_args()
+
+    from app.migrate import upgrade_database
+    upgrade_database()
+
+    progress = {"count": 0, "cursor": args.cursor}
+
+    def tracked(attempts):
+        for attempt in attempts:
+            progress["count"] += 1
+            progress["cursor"] = attempt["cursor"]
+            yield attempt
+
+    out = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        for chunk in ENCODERS[args.format](tracked(iter_attempts(args.since, args.cursor))):
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+        # Also printed after a failure part-way, so the export can be resumed
+        print(f"[export] {progress['count']} attempts; resume with --cursor {progress['cursor']}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Offline GeoIP resolution.
+
+IP-range-to-location CSV files (GEOIP_DB_PATHS) are compiled into the same
+memory-mapped range index as the IP blocklists (see app.ip_index), with an
+LRU cache in front for hot addresses. Resolution never touches the network.
+
+The CSV needs a header row naming a "network" column (CIDR, address or
+"first-last" range) plus "latitude" and "longitude" columns, so GeoLite2-style
+block files work as-is. Lines starting with "#" are ignored.
+"""
+import csv
+from functools import lru_cache
+from typing import Iterator
+
+from app.config import GEOIP_DB_PATHS, GEOIP_INDEX_PATH, GEOIP_CACHE_SIZE, GEOIP_RELOAD_SECONDS
+from app.ip_index import ReloadingIndex, parse_range
+
+
+def read_geoip_csv(path: str) -> Iterator[tuple[int, int, int, tuple[float, float]]]:
+    """Yield (version, first, last, (lat, lon)) for every located row in a GeoIP CSV."""
+    skipped = 0
+    with open(path, newline="") as f:
+        rows = csv.reader(line for line in f if not line.startswith("#"))
+        header = [column.strip().lower() for column in next(rows, [])]
+        try:
+            network_col = header.index("network")
+            lat_col = header.index("latitude")
+            lon_col = header.index("longitude")
+        except ValueError:
+            print(f"[geoip] {path} has no network/latitude/longitude header, ignoring it")
+            return
+
+        for row in rows:
+            try:
+                version, first, last = parse_range(row[network_col])
+                lat, lon = float(row[lat_col]), float(row[lon_col])
+            except (IndexError, ValueError):
+                skipped += 1  # Includes rows with no coordinates
+                continue
+            yield version, first, last, (lat, lon)
+
+    if skipped:
+        print(f"[geoip] skipped {skipped} rows without a usable range or location in {path}")
+
+
+geoip = ReloadingIndex(
+    name="geoip",
+    sources=GEOIP_DB_PATHS,
+    index_path=GEOIP_INDEX_PATH,
+    payload_format="<ff",
+    read_source=read_geoip_csv,
+    # Equal priority: where ranges nest, the one that ends first (the innermost) wins
+    priority=lambda payload: 0,
+    check_interval=GEOIP_RELOAD_SECONDS,
+)
+
+
+@lru_cache(maxsize=GEOIP_CACHE_SIZE)
+def _resolve(ip_address: str, generation: int) -> tuple[float, float] | None:
+    payload = geoip.lookup(ip_address)
+    return (round(payload[0], 4), round(payload[1], 4)) if payload else None
+
+
+def resolve_location(ip_address: str) -> tuple[float, float] | None:
+    """Return (lat, lon) for ip_address, or None if it isn't in the GeoIP data."""
+    # Keying on the reload count means a reload never serves stale cached answers
+    return _resolve(ip_address, geoip.reloads)
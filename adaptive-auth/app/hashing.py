@@ -0,0 +1,119 @@
+"""
+Password hashing, kept off the event loop.
+
+bcrypt is deliberately slow, so async endpoints hand it to a dedicated pool
+of HASH_POOL_SIZE workers (threads or processes, per HASH_POOL_KIND). At most
+HASH_POOL_QUEUE_LIMIT jobs may wait behind the busy workers; past that the
+pool raises HashingPoolSaturated straight away, so callers can reject the
+request instead of letting latency pile up.
+"""
+import asyncio
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+import bcrypt
+from starlette.concurrency import run_in_threadpool
+
+from app.config import HASH_POOL_KIND, HASH_POOL_SIZE, HASH_POOL_QUEUE_LIMIT
+
+
+def hash_password(password: str) -> str:
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+
+
+def verify_password(password: str, password_hash: str) -> bool:
+    return bcrypt.checkpw(password.encode("utf-8"), password_hash.encode("utf-8"))
+
+
+class HashingPoolSaturated(Exception):
+    """Raised when the hashing queue is full and the request should be shed."""
+
+
+class HashingPool:
+    def __init__(self, kind: str, workers: int, queue_limit: int):
+        self.kind = kind
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.in_flight = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._executor: Executor | None = None
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="bcrypt",
+                )
+        return self._executor
+
+    def _acquire(self):
+        with self._lock:
+            if self.in_flight >= self.workers + self.queue_limit:
+                self.rejected += 1
+                raise HashingPoolSaturated()
+            self.in_flight += 1
+
+    def _release(self, *_):
+        with self._lock:
+            self.in_flight -= 1
+
+    async def run(self, fn, *args):
+        """Run fn(*args) on the pool, or raise HashingPoolSaturated if it's full."""
+        if self.workers <= 0:
+            return await run_in_threadpool(fn, *args)
+
+        self._acquire()
+        try:
+            with self._lock:
+                executor = self._get_executor()
+            future = executor.submit(fn, *args)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def warm(self, password_hash: str):
+        """
+        Start every worker and have each verify password_hash once, so the
+        first logins don't pay for process start-up or bcrypt's first call.
+        """
+        if self.workers <= 0:
+            verify_password("warm-up", password_hash)
+            return
+        with self._lock:
+            executor = self._get_executor()
+        # Submitted together so that each worker is started, not one reused
+        futures = [executor.submit(verify_password, "warm-up", password_hash) for _ in range(self.workers)]
+        for future in futures:
+            future.result()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "kind": self.kind,
+                "workers": self.workers,
+                "queue_limit": self.queue_limit,
+                "in_flight": self.in_flight,
+                "rejected": self.rejected,
+            }
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+pool = HashingPool(HASH_POOL_KIND, HASH_POOL_SIZE, HASH_POOL_QUEUE_LIMIT)
+
+
+async def hash_password_async(password: str) -> str:
+    return await pool.run(hash_password, password)
+
+
+async def verify_password_async(password: str, password_hash: str) -> bool:
+    return await pool.run(verify_password, password, password_hash)
@@ -0,0 +1,345 @@
+"""
+Compact, memory-mapped IP range index.
+
+Source files (blocklists, GeoIP tables, ...) are compiled into a flat binary
+file of disjoint, sorted [start, end] address ranges with a fixed-size
+payload per range. Lookups binary-search the memory-mapped file directly,
+so every uvicorn worker shares the same pages instead of holding its own
+copy, and a lookup costs O(log n) comparisons with no parsing.
+
+File layout:
+
+    header    magic, version, payload size, IPv4 count, IPv6 count, and a
+              digest of the sources it was compiled from
+    IPv4      starts[count], ends[count] as native uint32, then payloads[count]
+    IPv6      starts[count], ends[count] as 16-byte big-endian, then payloads[count]
+
+IPv4 bounds are native integers so bisect can run over a memoryview at C
+speed; IPv6 bounds are big-endian bytes, which compare like integers. The
+file is compiled on the machine that reads it, so native byte order is safe.
+"""
+import hashlib
+import heapq
+import ipaddress
+import mmap
+import os
+import socket
+import struct
+import threading
+from array import array
+from bisect import bisect_right
+from typing import Callable, Iterable
+
+MAGIC = b"AAIX"
+FORMAT_VERSION = 2
+_HEADER = struct.Struct("=4sHHII16s")  # 32 bytes, so the IPv4 arrays stay aligned
+_FAMILIES = ((4, 4), (6, 16))  # (IP version, address width in bytes)
+
+
+class IndexFormatError(Exception):
+    """Raised when a compiled index file is missing, truncated or foreign."""
+
+
+_IPV4_MAPPED_PREFIX = b"\x00" * 10 + b"\xff\xff"
+
+
+def packed_address(ip: str) -> bytes | None:
+    """Return the packed form of ip, folding IPv4-mapped IPv6 to IPv4."""
+    # inet_pton is several times faster than the ipaddress module
+    try:
+        return socket.inet_pton(socket.AF_INET, ip)
+    except OSError:
+        pass
+    try:
+        packed = socket.inet_pton(socket.AF_INET6, ip)
+    except OSError:
+        return None
+    if packed.startswith(_IPV4_MAPPED_PREFIX):
+        return packed[12:]
+    return packed
+
+
+def parse_range(value: str) -> tuple[int, int, int]:
+    """Parse a CIDR, a single address or a "first-last" pair into (version, first, last)."""
+    if "-" in value:
+        first, last = (ipaddress.ip_address(part.strip()) for part in value.split("-", 1))
+        if first.version != last.version or int(first) > int(last):
+            raise ValueError(f"invalid address range: {value}")
+        return first.version, int(first), int(last)
+
+    network = ipaddress.ip_network(value.strip(), strict=False)
+    return network.version, int(network.network_address), int(network.broadcast_address)
+
+
+def _disjoint(ranges: list, priority: Callable) -> list:
+    """
+    Flatten possibly-overlapping (first, last, payload) ranges into disjoint
+    ones. Where ranges overlap, the payload with the highest priority wins.
+    Adjacent pieces with equal payloads are merged back together.
+    """
+    if not ranges:
+        return []
+
+    ranges.sort(key=lambda item: item[0])
+    bounds = sorted({first for first, _, _ in ranges} | {last + 1 for _, last, _ in ranges})
+
+    result = []
+    active = []  # heap of (-priority, last, position)
+    position = 0
+    for low, next_low in zip(bounds, bounds[1:]):
+        while position < len(ranges) and ranges[position][0] <= low:
+            first, last, payload = ranges[position]
+            heapq.heappush(active, (-priority(payload), last, position))
+            position += 1
+        while active and active[0][1] < low:
+            heapq.heappop(active)
+        if not active:
+            continue
+
+        payload = ranges[active[0][2]][2]
+        high = next_low - 1
+        if result and result[-1][1] == low - 1 and result[-1][2] == payload:
+            result[-1] = (result[-1][0], high, payload)
+        else:
+            result.append((low, high, payload))
+    return result
+
+
+def sources_digest(paths: list[str]) -> bytes:
+    """
+    Fingerprint a set of source files by path, inode, size, mtime and ctime.
+    ctime changes on every rewrite and can't be set back, so a replaced file
+    is noticed even if it carries an older mtime (cp -p, unpacked archives).
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for path in paths:
+        stat = os.stat(path)
+        digest.update(f"{os.path.abspath(path)}\0{stat.st_ino}\0{stat.st_size}\0"
+                      f"{stat.st_mtime_ns}\0{stat.st_ctime_ns}\n".encode())
+    return digest.digest()
+
+
+def read_sources_digest(path: str) -> bytes | None:
+    """The sources digest recorded in a compiled index, or None if it isn't a current index."""
+    try:
+        with open(path, "rb") as f:
+            header = f.read(_HEADER.size)
+    except OSError:
+        return None
+    if len(header) < _HEADER.size:
+        return None
+    magic, version, _, _, _, digest = _HEADER.unpack(header)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        return None
+    return digest
+
+
+def compile_index(path: str, ranges: Iterable[tuple[int, int, int, tuple]],
+                  payload_format: str, priority: Callable, digest: bytes = b"") -> int:
+    """
+    Write (version, first, last, payload) ranges to a compiled index at path,
+    recording digest (see sources_digest) in the header. The file is written
+    next to its destination and renamed into place, so readers only ever see
+    a complete index. Returns the number of ranges.
+    """
+    payload_struct = struct.Struct(payload_format)
+    by_version = {4: [], 6: []}
+    for version, first, last, payload in ranges:
+        by_version[version].append((first, last, tuple(payload)))
+
+    sections = {version: _disjoint(by_version[version], priority) for version, _ in _FAMILIES}
+
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, payload_struct.size,
+                             len(sections[4]), len(sections[6]), digest))
+        for version, width in _FAMILIES:
+            intervals = sections[version]
+            if version == 4:
+                f.write(array("I", (first for first, _, _ in intervals)).tobytes())
+                f.write(array("I", (last for _, last, _ in intervals)).tobytes())
+            else:
+                f.write(b"".join(first.to_bytes(width, "big") for first, _, _ in intervals))
+                f.write(b"".join(last.to_bytes(width, "big") for _, last, _ in intervals))
+            f.write(b"".join(payload_struct.pack(*payload) for _, _, payload in intervals))
+    os.replace(temp_path, path)
+    return sum(len(intervals) for intervals in sections.values())
+
+
+class _FixedWidthView:
+    """Sequence view over count fixed-width byte strings inside a buffer, for bisect."""
+
+    def __init__(self, buffer, offset: int, width: int, count: int):
+        self._buffer = buffer
+        self._offset = offset
+        self._width = width
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index: int) -> bytes:
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+        start = self._offset + index * self._width
+        return self._buffer[start:start + self._width]
+
+
+class IPRangeIndex:
+    """A compiled index file, memory-mapped read-only."""
+
+    def __init__(self, path: str, payload_format: str):
+        self.path = path
+        self._payload = struct.Struct(payload_format)
+
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < _HEADER.size:
+                raise IndexFormatError(f"{path} is too small to be an index")
+            self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, payload_size, v4_count, v6_count, _ = _HEADER.unpack_from(self._buffer, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise IndexFormatError(f"{path} is not a version {FORMAT_VERSION} index")
+        if payload_size != self._payload.size:
+            raise IndexFormatError(f"{path} payload size {payload_size} != {self._payload.size}")
+
+        expected_size = _HEADER.size + (4 + 4 + payload_size) * v4_count + (16 + 16 + payload_size) * v6_count
+        if expected_size > size:
+            raise IndexFormatError(f"{path} is truncated")
+
+        offset = _HEADER.size
+        self._families = {}
+        for (version, width), count in zip(_FAMILIES, (v4_count, v6_count)):
+            if version == 4:
+                view = memoryview(self._buffer)
+                starts = view[offset:offset + 4 * count].cast("I")
+                ends = view[offset + 4 * count:offset + 8 * count].cast("I")
+            else:
+                starts = _FixedWidthView(self._buffer, offset, width, count)
+                ends = _FixedWidthView(self._buffer, offset + width * count, width, count)
+            offset += 2 * width * count
+            self._families[width] = (starts, ends, offset)
+            offset += payload_size * count
+
+        self.range_count = v4_count + v6_count
+
+    def lookup(self, ip: str) -> tuple | None:
+        """Return the payload of the range containing ip, or None."""
+        key = packed_address(ip)
+        if key is None:
+            return None
+
+        starts, ends, payload_offset = self._families[len(key)]
+        if len(key) == 4:
+            key = int.from_bytes(key, "big")
+        position = bisect_right(starts, key) - 1
+        if position < 0 or ends[position] < key:
+            return None
+        return self._payload.unpack_from(self._buffer, payload_offset + position * self._payload.size)
+
+
+class ReloadingIndex:
+    """
+    Keeps a compiled IPRangeIndex in sync with its source files.
+
+    The index is compiled on first use, and a background watcher recompiles
+    and swaps it in whenever a source file changes. Lookups keep using the
+    old index until the new one is fully loaded. When several workers share
+    index_path, whichever notices the change first recompiles it and the
+    others simply re-map the new file.
+    """
+
+    def __init__(self, name: str, sources: list[str], index_path: str,
+                 payload_format: str, read_source: Callable[[str], Iterable],
+                 priority: Callable, check_interval: float = 5.0):
+        self.name = name
+        self.sources = sources
+        self.index_path = index_path
+        self.payload_format = payload_format
+        self.read_source = read_source
+        self.priority = priority
+        self.check_interval = check_interval
+        self.reloads = 0
+        self.last_error: str | None = None
+
+        self._index: IPRangeIndex | None = None
+        self._loaded_signature = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher: threading.Thread | None = None
+        self._initialized = False
+
+    def _existing_sources(self) -> list[str]:
+        return [path for path in self.sources if os.path.exists(path)]
+
+    def _index_is_stale(self, digest: bytes) -> bool:
+        # Any added, removed or rewritten source changes the digest, whatever its mtime
+        return read_sources_digest(self.index_path) != digest
+
+    def _compile(self, sources: list[str], digest: bytes):
+        def ranges():
+            for path in sources:
+                yield from self.read_source(path)
+        compile_index(self.index_path, ranges(), self.payload_format, self.priority, digest)
+
+    def refresh(self):
+        """Recompile and reload if any source changed since the index was built."""
+        with self._lock:
+            self._initialized = True
+            try:
+                sources = self._existing_sources()
+                if not sources:
+                    self._index = None
+                    self._loaded_signature = None
+                    return
+
+                digest = sources_digest(sources)
+                if self._index_is_stale(digest):
+                    self._compile(sources, digest)
+
+                stat = os.stat(self.index_path)
+                signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+                if signature != self._loaded_signature:
+                    # Swapping the reference is atomic; in-flight lookups finish on the old map
+                    self._index = IPRangeIndex(self.index_path, self.payload_format)
+                    self._loaded_signature = signature
+                    self.reloads += 1
+                self.last_error = None
+            except (OSError, ValueError, IndexFormatError) as exc:
+                # Keep serving the previous index rather than failing open or closed
+                self.last_error = f"{type(exc).__name__}: {exc}"
+                print(f"[{self.name}] reload failed: {self.last_error}")
+
+    def lookup(self, ip: str) -> tuple | None:
+        if not self._initialized:
+            self.refresh()
+        index = self._index
+        return index.lookup(ip) if index is not None else None
+
+    def _watch(self):
+        while not self._stop.wait(self.check_interval):
+            self.refresh()
+
+    def start(self):
+        """Load the index now and start watching its sources in the background."""
+        self.refresh()
+        if self._watcher is None and self.check_interval > 0:
+            self._stop.clear()
+            self._watcher = threading.Thread(target=self._watch, name=f"{self.name}-watcher", daemon=True)
+            self._watcher.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=self.check_interval + 1)
+            self._watcher = None
+
+    def stats(self) -> dict:
+        index = self._index
+        return {
+            "sources": self._existing_sources(),
+            "ranges": index.range_count if index is not None else 0,
+            "reloads": self.reloads,
+            "last_error": self.last_error,
+        }
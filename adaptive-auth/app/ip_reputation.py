@@ -0,0 +1,56 @@
+"""
+IP reputation from local CIDR blocklists.
+
+Blocklist files (IP_BLOCKLIST_PATHS) hold one CIDR, address or "first-last"
+range per line, optionally followed by the risk points a match adds. They're
+compiled into a shared memory-mapped index (see app.ip_index) and reloaded
+in the background whenever a file changes.
+"""
+from typing import Iterator
+
+from app.config import (
+    IP_BLOCKLIST_PATHS, IP_REPUTATION_INDEX_PATH, IP_REPUTATION_DEFAULT_POINTS,
+    IP_REPUTATION_RELOAD_SECONDS,
+)
+from app.ip_index import ReloadingIndex, parse_range
+
+MAX_SEVERITY = 0xFFFF  # Stored as an unsigned 16-bit payload
+
+
+def read_blocklist(path: str) -> Iterator[tuple[int, int, int, tuple[int]]]:
+    """Yield (version, first, last, (severity,)) for every valid line in a blocklist."""
+    skipped = 0
+    with open(path) as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if not line:
+                continue
+
+            parts = line.split()
+            try:
+                version, first, last = parse_range(parts[0])
+                severity = int(parts[1]) if len(parts) > 1 else IP_REPUTATION_DEFAULT_POINTS
+            except ValueError:
+                skipped += 1
+                continue
+            yield version, first, last, (max(0, min(severity, MAX_SEVERITY)),)
+
+    if skipped:
+        print(f"[ip-reputation] skipped {skipped} invalid lines in {path}")
+
+
+reputation = ReloadingIndex(
+    name="ip-reputation",
+    sources=IP_BLOCKLIST_PATHS,
+    index_path=IP_REPUTATION_INDEX_PATH,
+    payload_format="<H",
+    read_source=read_blocklist,
+    priority=lambda payload: payload[0],
+    check_interval=IP_REPUTATION_RELOAD_SECONDS,
+)
+
+
+def ip_severity(ip_address: str) -> int:
+    """Risk points for ip_address, or 0 if it isn't on any blocklist."""
+    payload = reputation.lookup(ip_address)
+    return payload[0] if payload else 0
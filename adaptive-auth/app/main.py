@@ -1,32 +1,114 @@
-from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from pathlib import Path
-from app.database import Base, engine
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+from app.config import AUTO_MIGRATE, FRONTEND_DIST, MAINTENANCE_ENABLED, METRICS_ENABLED, RISK_SCORER
+from app.database import dispose_engines
 from app.auth import router as auth_router
+from app.analytics import router as analytics_router
 from app.demo import router as demo_router
+from app.export import router as export_router
+from app.provisioning import router as provisioning_router
+from app import analytics, audit, export, hashing, maintenance, metrics, otp_delivery, throttle, tokens
+from app.warmup import warmer
+from app.static_assets import frontend
+from app.ip_reputation import reputation
+from app.geoip import geoip
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    tokens.check_signing_keys()
+    otp_delivery.check_outbox_key()
+    export.check_settle_window()
+    # Normally done once before the workers start (python -m app.migrate); the lock serializes workers on SQLite
+    if AUTO_MIGRATE:
+        from app.migrate import upgrade_database  # Alembic is only imported when it is needed
+        upgrade_database()
+    reputation.start()
+    geoip.start()
+    audit.sink.start()
+    otp_delivery.dispatcher.start()
+    analytics.recorder.start()
+    if RISK_SCORER == "anomaly":
+        from app import anomaly
+        anomaly.model.start()
+    if MAINTENANCE_ENABLED:
+        maintenance.worker.start()
+    # Serves straight away; /health/ready waits for the warm-up
+    warmer.start()
+    yield
+    warmer.stop()
+    maintenance.worker.stop()
+    if RISK_SCORER == "anomaly":
+        anomaly.model.stop()
+    analytics.recorder.stop()
+    otp_delivery.dispatcher.stop()
+    audit.sink.stop()
+    geoip.stop()
+    reputation.stop()
+    hashing.pool.shutdown()
+    await dispose_engines()
 
-# Create all tables on startup
-Base.metadata.create_all(bind=engine)
 
 app = FastAPI(
     title="Adaptive Authentication Framework",
     description="Risk-based authentication with conditional MFA",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
+
+@app.exception_handler(hashing.HashingPoolSaturated)
+async def hashing_pool_saturated(request: Request, exc: hashing.HashingPoolSaturated):
+    # Shed load cheaply rather than queueing behind a full bcrypt pool
+    return JSONResponse(
+        status_code=503,
+        content={"success": False, "message": "Server busy, please retry"},
+        headers={"Retry-After": "1"},
+    )
+
+
+@app.exception_handler(throttle.Throttled)
+async def throttled(request: Request, exc: throttle.Throttled):
+    return JSONResponse(
+        status_code=429,
+        content={"success": False, "message": "Too many attempts, please try again later"},
+        headers={"Retry-After": str(int(exc.retry_after))},
+    )
+
+
+@app.get("/health/live", include_in_schema=False)
+def live():
+    return {"status": "live"}
+
+
+@app.get("/health/ready", include_in_schema=False)
+def ready():
+    # Load balancers should route to a worker only once it has warmed up
+    return JSONResponse(status_code=200 if warmer.ready else 503,
+                        content={"status": "ready" if warmer.ready else "warming", **warmer.stats()})
+
+
 app.include_router(auth_router)
 app.include_router(demo_router)
+app.include_router(export_router)
+app.include_router(analytics_router)
+app.include_router(provisioning_router)
 
-# Serve React frontend
-frontend_dist = Path(__file__).parent.parent / "frontend" / "dist"
+if METRICS_ENABLED:
+    @app.get("/metrics", include_in_schema=False)
+    def prometheus_metrics():
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
-if frontend_dist.exists():
-    app.mount("/assets", StaticFiles(directory=frontend_dist / "assets"), name="assets")
+# Serve React frontend from memory, precompressed (see app.static_assets); loaded by the warm-up
+if FRONTEND_DIST.exists():
+    @app.api_route("/assets/{path:path}", methods=["GET", "HEAD"], include_in_schema=False)
+    async def serve_asset(path: str, request: Request):
+        return frontend().respond(f"assets/{path}", request.headers)
 
-    @app.get("/{full_path:path}")
-    def serve_frontend(full_path: str):
-        return FileResponse(frontend_dist / "index.html")
+    @app.api_route("/{full_path:path}", methods=["GET", "HEAD"], include_in_schema=False)
+    async def serve_frontend(full_path: str, request: Request):
+        return frontend().respond(full_path, request.headers, fallback=True)
 else:
     @app.get("/")
     def root():
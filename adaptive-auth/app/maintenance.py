@@ -0,0 +1,246 @@
+"""
+Background maintenance: expiry, retention and compaction.
+
+Each run
+  - deletes PendingAuth rows that have been used or have expired, along
+    with their otp_outbox messages,
+  - rolls LoginAttempt rows older than LOGIN_ATTEMPT_RETENTION_DAYS up into
+    per-user daily summaries (login_attempt_daily) and deletes them,
+  - on SQLite, returns freed pages to the filesystem with incremental vacuum.
+
+Work is done in batches of MAINTENANCE_BATCH_SIZE rows, each in its own
+short transaction, with a MAINTENANCE_PAUSE_SECONDS sleep in between. The
+write lock is therefore only ever held for one small batch, and logins
+queued behind it get their turn before the next one starts.
+
+Nothing the risk engine reads depends on old attempts: the signals use
+user_profiles and trusted_devices. A profile rebuilt with `python -m
+app.profiles backfill` only sees retained attempts, but at the default 90
+days the decayed histogram weight of anything older is negligible.
+
+Runs in-process from the app lifespan (MAINTENANCE_ENABLED), or on demand:
+    python -m app.maintenance
+"""
+import argparse
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, or_, text
+from sqlalchemy.orm import Session
+
+from app.config import (
+    MAINTENANCE_INTERVAL_SECONDS, MAINTENANCE_BATCH_SIZE, MAINTENANCE_PAUSE_SECONDS,
+    LOGIN_ATTEMPT_RETENTION_DAYS, VACUUM_PAGES_PER_RUN,
+)
+from app.database import SessionLocal, engine, is_sqlite
+from app.models import LoginAttempt, LoginAttemptDaily, OtpOutbox, PendingAuth
+from app.profiles import as_utc
+
+UNKNOWN_USER_ID = 0  # Summary key for attempts against usernames that don't exist
+
+
+def purge_pending_auth(db: Session, now: datetime, batch_size: int = MAINTENANCE_BATCH_SIZE,
+                       pause: float = MAINTENANCE_PAUSE_SECONDS) -> int:
+    """Delete used or expired PendingAuth rows and their outbox messages. Returns the number deleted."""
+    deleted = 0
+    while True:
+        ids = [pending_id for (pending_id,) in db.query(PendingAuth.id).filter(
+            or_(PendingAuth.is_used == True, PendingAuth.expires_at < now),
+        ).order_by(PendingAuth.id).limit(batch_size)]
+        if not ids:
+            return deleted
+
+        db.execute(delete(OtpOutbox).where(OtpOutbox.pending_auth_id.in_(ids)))
+        db.execute(delete(PendingAuth).where(PendingAuth.id.in_(ids)))
+        db.commit()
+        deleted += len(ids)
+        if len(ids) < batch_size:
+            return deleted
+        time.sleep(pause)
+
+
+def _summarize(attempts) -> dict:
+    """Aggregate attempts into {(user_id, day): counters}."""
+    summaries = {}
+    for attempt in attempts:
+        key = (attempt.user_id or UNKNOWN_USER_ID, as_utc(attempt.timestamp).date())
+        summary = summaries.setdefault(key, {
+            "attempts": 0, "successes": 0, "failures": 0,
+            "high_risk": 0, "risk_score_total": 0, "max_risk_score": 0,
+        })
+        score = attempt.risk_score or 0
+        summary["attempts"] += 1
+        summary["successes" if attempt.success else "failures"] += 1
+        summary["high_risk"] += attempt.risk_level == "high"
+        summary["risk_score_total"] += score
+        summary["max_risk_score"] = max(summary["max_risk_score"], score)
+    return summaries
+
+
+def _merge_summaries(db: Session, summaries: dict):
+    """Add counters onto existing daily rows, creating the missing ones."""
+    user_ids = {user_id for user_id, _ in summaries}
+    days = {day for _, day in summaries}
+    existing = {
+        (row.user_id, row.day): row
+        for row in db.query(LoginAttemptDaily).filter(
+            LoginAttemptDaily.user_id.in_(user_ids),
+            LoginAttemptDaily.day.in_(days),
+        )
+    }
+
+    for (user_id, day), counters in summaries.items():
+        row = existing.get((user_id, day))
+        if row is None:
+            db.add(LoginAttemptDaily(user_id=user_id, day=day, **counters))
+            continue
+        row.attempts += counters["attempts"]
+        row.successes += counters["successes"]
+        row.failures += counters["failures"]
+        row.high_risk += counters["high_risk"]
+        row.risk_score_total += counters["risk_score_total"]
+        row.max_risk_score = max(row.max_risk_score, counters["max_risk_score"])
+
+
+def compact_login_attempts(db: Session, cutoff: datetime, batch_size: int = MAINTENANCE_BATCH_SIZE,
+                           pause: float = MAINTENANCE_PAUSE_SECONDS) -> int:
+    """
+    Roll attempts older than cutoff into login_attempt_daily and delete them.
+    Summary and delete commit together, so an interrupted run never counts
+    a row twice. Returns the number of attempts compacted.
+    """
+    compacted = 0
+    while True:
+        # A range on ix_login_attempts_time, so each batch reads only old rows
+        attempts = db.query(LoginAttempt).filter(
+            LoginAttempt.timestamp < cutoff,
+        ).order_by(LoginAttempt.timestamp, LoginAttempt.id).limit(batch_size).all()
+        if not attempts:
+            return compacted
+
+        _merge_summaries(db, _summarize(attempts))
+        db.execute(delete(LoginAttempt).where(LoginAttempt.id.in_([attempt.id for attempt in attempts])))
+        db.commit()
+        db.expunge_all()
+        compacted += len(attempts)
+        if len(attempts) < batch_size:
+            return compacted
+        time.sleep(pause)
+
+
+def incremental_vacuum(pages: int = VACUUM_PAGES_PER_RUN) -> bool:
+    """
+    Release up to `pages` free pages on SQLite. Only works on databases with
+    auto_vacuum=INCREMENTAL: new databases get it from the connect pragmas,
+    existing ones need a one-off `python -m app.maintenance --convert-vacuum`.
+    Returns whether anything was attempted.
+    """
+    if not is_sqlite(str(engine.url)) or pages <= 0:
+        return False
+    with engine.connect() as connection:
+        if connection.execute(text("PRAGMA auto_vacuum")).scalar() != 2:
+            return False
+        connection.execute(text(f"PRAGMA incremental_vacuum({int(pages)})"))
+        connection.commit()
+    return True
+
+
+def convert_to_incremental_vacuum():
+    """Switch an existing SQLite file to auto_vacuum=INCREMENTAL. Rewrites the file; run offline."""
+    if not is_sqlite(str(engine.url)):
+        return
+    with engine.connect() as connection:
+        connection.execute(text("PRAGMA auto_vacuum=INCREMENTAL"))
+        connection.commit()
+        connection.execution_options(isolation_level="AUTOCOMMIT").execute(text("VACUUM"))
+
+
+def run_once(now: datetime | None = None, retention_days: int = LOGIN_ATTEMPT_RETENTION_DAYS,
+             batch_size: int = MAINTENANCE_BATCH_SIZE, pause: float = MAINTENANCE_PAUSE_SECONDS) -> dict:
+    """Run every maintenance task once and report what was done."""
+    now = now or datetime.now(timezone.utc)
+    started = time.perf_counter()
+    db = SessionLocal()
+    try:
+        pending = purge_pending_auth(db, now, batch_size, pause)
+        compacted = compact_login_attempts(db, now - timedelta(days=retention_days), batch_size, pause)
+    finally:
+        db.close()
+    vacuumed = incremental_vacuum()
+    return {
+        "pending_auth_deleted": pending,
+        "login_attempts_compacted": compacted,
+        "vacuumed": vacuumed,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+class MaintenanceWorker:
+    """Runs run_once every `interval` seconds on a daemon thread."""
+
+    def __init__(self, interval: float = MAINTENANCE_INTERVAL_SECONDS):
+        self.interval = interval
+        self.runs = 0
+        self.last_result: dict | None = None
+        self.last_error: str | None = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def _run(self):
+        # Wait a full interval first so maintenance never competes with startup
+        while not self._stop.wait(self.interval):
+            try:
+                self.last_result = run_once()
+                self.last_error = None
+            except Exception as exc:
+                self.last_error = f"{type(exc).__name__}: {exc}"
+                print(f"[maintenance] run failed: {self.last_error}")
+            self.runs += 1
+
+    def start(self):
+        if self._thread is None and self.interval > 0:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="maintenance", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            # A batch in progress finishes within one short transaction
+            self._thread.join(timeout=30)
+            self._thread = None
+
+    def stats(self) -> dict:
+        return {
+            "interval_seconds": self.interval,
+            "runs": self.runs,
+            "last_result": self.last_result,
+            "last_error": self.last_error,
+        }
+
+
+worker = MaintenanceWorker()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Expire, compact and vacuum the auth database")
+    parser.add_argument("--retention-days", type=int, default=LOGIN_ATTEMPT_RETENTION_DAYS)
+    parser.add_argument("--batch-size", type=int, default=MAINTENANCE_BATCH_SIZE)
+    parser.add_argument("--pause", type=float, default=MAINTENANCE_PAUSE_SECONDS,
+                        help="Seconds to sleep between batches")
+    parser.add_argument("--convert-vacuum", action="store_true",
+                        help="Switch an existing SQLite file to incremental vacuum first (rewrites the file)")
+    args = parser.parse_args()
+
+    from app.migrate import upgrade_database
+    upgrade_database()
+
+    if args.convert_vacuum:
+        convert_to_incremental_vacuum()
+    result = run_once(retention_days=args.retention_days, batch_size=args.batch_size, pause=args.pause)
+    print(", ".join(f"{key}={value}" for key, value in result.items()))
+
+
+if __name__ == "__main__":
+    main()
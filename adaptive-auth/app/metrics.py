@@ -0,0 +1,308 @@
+"""
+In-process metrics, exposed in Prometheus text format at /metrics.
+
+Counters and histograms are plain Python objects, updated without locks to
+keep recording to a fraction of a microsecond. Under the GIL a concurrent
+update can very occasionally be lost, which is fine for monitoring.
+Histograms use fixed buckets and keep one count array per label
+combination, so nothing is allocated per observation once a series exists.
+
+What gets measured:
+    signal_seconds{signal}       each risk signal's evaluate call
+    risk_scoring_seconds{scorer} assess_risk's scoring, rules or anomaly model (RISK_SCORER)
+    stage_seconds{stage}         risk_context, risk_assessment, password_verify, commit
+    db_query_seconds             every statement executed through the engine
+    request_seconds{endpoint}    instrumented endpoints, end to end
+    request_db_queries{endpoint} statements issued per instrumented request
+    plus counters for risk levels, login and OTP outcomes, and throttling
+
+Per-request breakdowns: an instrumented endpoint puts a RequestTimings in a
+context variable. Signal, stage and query timings recorded while it is set
+are also added to it. Starlette's threadpool copies the context, so this
+works across run_in_threadpool. /auth/debug/risk-assessment?timings=true
+returns the breakdown.
+
+Signals are only timed for every METRICS_SIGNAL_SAMPLE_EVERY-th assessment,
+or when a breakdown was asked for, so signal_seconds is a sample. A signal
+takes a few microseconds, and timing every one cost about as much again.
+
+With METRICS_ENABLED=false nothing is recorded and /metrics isn't mounted,
+but an explicitly requested debug breakdown still works.
+"""
+import inspect
+import itertools
+from bisect import bisect_left
+from contextvars import ContextVar
+from functools import wraps
+from time import perf_counter
+
+from app.config import METRICS_ENABLED, METRICS_SIGNAL_SAMPLE_EVERY
+
+ENABLED = METRICS_ENABLED
+SIGNAL_SAMPLE_EVERY = max(1, METRICS_SIGNAL_SAMPLE_EVERY)
+PREFIX = "adaptive_auth_"
+
+# Seconds; covers a sub-microsecond cache hit up to a queued bcrypt
+LATENCY_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34)
+
+REGISTRY = []
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = PREFIX + name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {}
+        REGISTRY.append(self)
+
+    def inc(self, *labels, amount: int = 1):
+        if ENABLED:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels) -> int:
+        return self._values.get(labels, 0)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}")
+        return lines
+
+
+class _Series:
+    """One histogram label combination: per-bucket counts (the last is +Inf) and a sum."""
+    __slots__ = ("buckets", "counts", "total")
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0
+
+    def observe(self, value: float):
+        if ENABLED:
+            self.counts[bisect_left(self.buckets, value)] += 1
+            self.total += value
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = PREFIX + name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}
+        REGISTRY.append(self)
+
+    def labels(self, *values) -> _Series:
+        """The series for these label values; hot paths can hold on to it."""
+        series = self._series.get(values)
+        if series is None:
+            series = self._series.setdefault(values, _Series(self.buckets))
+        return series
+
+    def observe(self, value: float, *labels):
+        self.labels(*labels).observe(value)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        series = sorted((labels, (list(one.counts), one.total)) for labels, one in list(self._series.items()))
+        for labels, (counts, total) in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(float(total))}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- Metrics ---
+
+signal_seconds = Histogram("signal_seconds", "Time spent evaluating each risk signal", ("signal",))
+scoring_seconds = Histogram("risk_scoring_seconds", "Time assess_risk spends scoring a login", ("scorer",))
+stage_seconds = Histogram("stage_seconds", "Time spent in each stage of a login", ("stage",))
+db_query_seconds = Histogram("db_query_seconds", "Time spent executing each database statement")
+request_seconds = Histogram("request_seconds", "Instrumented request latency", ("endpoint",))
+request_db_queries = Histogram("request_db_queries", "Database statements per instrumented request",
+                               ("endpoint",), buckets=COUNT_BUCKETS)
+risk_levels = Counter("risk_assessments_total", "Login risk assessments by resulting level", ("level",))
+logins = Counter("logins_total", "Login attempts by outcome", ("outcome",))
+otp_verifications = Counter("otp_verifications_total", "OTP verifications by outcome", ("outcome",))
+throttled = Counter("throttled_total", "Requests rejected by a brute-force limiter", ("limiter",))
+
+
+# --- Per-request breakdowns ---
+
+class RequestTimings:
+    __slots__ = ("started", "detailed", "stages", "signals", "queries", "query_seconds", "_token")
+
+    def __init__(self, detailed: bool = False):
+        self.started = perf_counter()
+        self.detailed = detailed  # A breakdown was asked for, so every signal is timed
+        self.stages = {}
+        self.signals = {}
+        self.queries = 0
+        self.query_seconds = 0.0
+        self._token = None
+
+    def report(self) -> dict:
+        """The breakdown so far, in milliseconds."""
+        return {
+            "total_ms": round((perf_counter() - self.started) * 1000, 3),
+            "stages_ms": {name: round(seconds * 1000, 3) for name, seconds in self.stages.items()},
+            "signals_ms": {name: round(seconds * 1000, 3) for name, seconds in self.signals.items()},
+            "db_queries": self.queries,
+            "db_query_ms": round(self.query_seconds * 1000, 3),
+        }
+
+
+_current: ContextVar[RequestTimings | None] = ContextVar("request_timings", default=None)
+
+
+def current() -> RequestTimings | None:
+    return _current.get()
+
+
+def start_request(always: bool = False) -> RequestTimings | None:
+    """Start collecting a breakdown for this request; a no-op while metrics are off unless always."""
+    if not (ENABLED or always):
+        return None
+    timings = RequestTimings(detailed=always)
+    timings._token = _current.set(timings)
+    return timings
+
+
+def finish_request(endpoint: str, timings: RequestTimings | None):
+    if timings is None:
+        return
+    _current.reset(timings._token)
+    request_seconds.observe(perf_counter() - timings.started, endpoint)
+    request_db_queries.observe(timings.queries, endpoint)
+
+
+def instrumented(endpoint: str):
+    """Decorate a sync or async endpoint to record its latency and query count."""
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @wraps(fn)
+            async def wrapper(*args, **kwargs):
+                timings = start_request()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    finish_request(endpoint, timings)
+        else:
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                timings = start_request()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    finish_request(endpoint, timings)
+        return wrapper
+    return decorator
+
+
+_assessments = itertools.count()
+
+
+def time_signals(timings: RequestTimings | None) -> bool:
+    """Whether this assessment times each signal: a requested breakdown, or one in SIGNAL_SAMPLE_EVERY."""
+    if timings is not None and timings.detailed:
+        return True
+    return ENABLED and next(_assessments) % SIGNAL_SAMPLE_EVERY == 0
+
+
+def record_signal(name: str, seconds: float, timings: RequestTimings | None):
+    signal_seconds.observe(seconds, name)
+    if timings is not None:
+        timings.signals[name] = seconds
+
+
+def record_stage(name: str, seconds: float, series: _Series | None = None):
+    (series or stage_seconds.labels(name)).observe(seconds)
+    timings = _current.get()
+    if timings is not None:
+        timings.stages[name] = timings.stages.get(name, 0.0) + seconds
+
+
+class stage:
+    """Time a block as a login stage: `with metrics.stage("password_verify"): ...`"""
+    __slots__ = ("name", "series", "started")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.series = stage_seconds.labels(name)
+
+    def __enter__(self):
+        self.started = perf_counter()
+
+    def __exit__(self, *exc):
+        record_stage(self.name, perf_counter() - self.started, self.series)
+
+
+# --- SQLAlchemy hooks ---
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_started = perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = perf_counter() - context._metrics_started
+    _db_query_series.observe(elapsed)
+    timings = _current.get()
+    if timings is not None:
+        timings.queries += 1
+        timings.query_seconds += elapsed
+
+
+_db_query_series = db_query_seconds.labels()
+
+
+def _before_commit(session):
+    session.info["metrics_commit_started"] = perf_counter()
+
+
+def _after_commit(session):
+    started = session.info.pop("metrics_commit_started", None)
+    if started is not None:
+        record_stage("commit", perf_counter() - started)
+
+
+def instrument_engine(engine):
+    from sqlalchemy import event
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def instrument_sessions(session_factory):
+    """Time commits, including the flush that precedes them."""
+    from sqlalchemy import event
+    event.listen(session_factory, "before_commit", _before_commit)
+    event.listen(session_factory, "after_commit", _after_commit)
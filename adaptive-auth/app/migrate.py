@@ -0,0 +1,70 @@
+"""
+Schema migrations.
+
+The schema is owned by the Alembic chain in migrations/. Upgrade with either
+    python -m app.migrate
+    alembic upgrade head
+"""
+import argparse
+from contextlib import contextmanager
+
+from alembic import command
+from alembic.config import Config
+
+from app.config import BASE_DIR
+from app.database import engine, is_sqlite
+
+try:
+    import fcntl
+except ImportError:  # Windows: migrations aren't serialized across processes
+    fcntl = None
+
+
+def alembic_config() -> Config:
+    config = Config(str(BASE_DIR / "alembic.ini"))
+    config.set_main_option("script_location", str(BASE_DIR / "migrations"))
+    return config
+
+
+@contextmanager
+def migration_lock():
+    """
+    Hold an exclusive lock on a file beside a SQLite database, so processes
+    started together migrate it one at a time; the later ones find it at head.
+    """
+    database = engine.url.database
+    if fcntl is None or not is_sqlite(str(engine.url)) or database in (None, "", ":memory:"):
+        yield
+        return
+    with open(f"{database}.migrate.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def upgrade_database(revision: str = "head"):
+    """Bring the database up to `revision` using the app's engine."""
+    config = alembic_config()
+    config.attributes["configure_logger"] = False  # Don't clobber the app's logging setup
+    with migration_lock(), engine.begin() as connection:
+        config.attributes["connection"] = connection
+        command.upgrade(config, revision)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upgrade the database schema")
+    parser.add_argument("--sqlite-only", action="store_true",
+                        help="do nothing unless DATABASE_URL is SQLite, whose file a pre-deploy step can't reach")
+    args = parser.parse_args()
+
+    if args.sqlite_only and not is_sqlite(str(engine.url)):
+        print("Not a SQLite database; left to the pre-deploy migration")
+        return
+    upgrade_database()
+    print("Database is up to date")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, Float, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, Float, Date, DateTime, ForeignKey, JSON, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone
 from app.database import Base
@@ -17,10 +17,20 @@ class User(Base):
 
     login_attempts = relationship("LoginAttempt", back_populates="user")
     trusted_devices = relationship("TrustedDevice", back_populates="user")
+    profile = relationship("UserProfile", back_populates="user", uselist=False)
 
 
 class LoginAttempt(Base):
     __tablename__ = "login_attempts"
+    __table_args__ = (
+        # Covers per-user successful-login scans, ordered by time
+        Index("ix_login_attempts_user_success_time",
+              "user_id", "success", "timestamp", "location_lat", "location_lon"),
+        # Keyset order for replaying each user's history (app.replay)
+        Index("ix_login_attempts_user_time", "user_id", "timestamp", "id"),
+        # Compaction's age range (app.maintenance) and the SIEM export's keyset order (app.export)
+        Index("ix_login_attempts_time", "timestamp", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
@@ -39,6 +49,9 @@ class LoginAttempt(Base):
 
 class TrustedDevice(Base):
     __tablename__ = "trusted_devices"
+    __table_args__ = (
+        Index("uq_trusted_devices_user_device", "user_id", "device_fingerprint", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -63,3 +76,79 @@ class PendingAuth(Base):
     device_fingerprint = Column(String, nullable=True)
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
     is_used = Column(Boolean, default=False)
+
+
+class UserProfile(Base):
+    """Per-user behavioral state, updated on every successful login."""
+    __tablename__ = "user_profiles"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    hour_histogram = Column(JSON, nullable=False, default=lambda: [0.0] * 24)
+    histogram_updated_at = Column(DateTime, nullable=True)
+    last_lat = Column(Float, nullable=True)
+    last_lon = Column(Float, nullable=True)
+    last_location_at = Column(DateTime, nullable=True)
+    last_login_at = Column(DateTime, nullable=True)
+    trusted_device_count = Column(Integer, default=0)
+
+    user = relationship("User", back_populates="profile")
+
+
+class LoginAttemptDaily(Base):
+    """Per-user daily rollup of login attempts that have aged out of login_attempts."""
+    __tablename__ = "login_attempt_daily"
+    __table_args__ = (
+        Index("uq_login_attempt_daily_user_day", "user_id", "day", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False)  # 0 for attempts against unknown usernames
+    day = Column(Date, nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    successes = Column(Integer, default=0, nullable=False)
+    failures = Column(Integer, default=0, nullable=False)
+    high_risk = Column(Integer, default=0, nullable=False)
+    risk_score_total = Column(Integer, default=0, nullable=False)
+    max_risk_score = Column(Integer, default=0, nullable=False)
+
+
+class OtpOutbox(Base):
+    """OTP messages waiting to be delivered, written in the same transaction as their PendingAuth."""
+    __tablename__ = "otp_outbox"
+    __table_args__ = (
+        # The dispatcher's poll: due messages in order
+        Index("ix_otp_outbox_status_due", "status", "next_attempt_at"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    pending_auth_id = Column(Integer, ForeignKey("pending_auth.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    channel = Column(String, nullable=False)
+    destination = Column(String, nullable=False)
+    sealed_code = Column(String, nullable=True)  # Encrypted (app.otp_delivery.seal_code); cleared once finished
+    status = Column(String, nullable=False, default="pending")  # pending, sending, sent, failed, expired
+    attempts = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+    next_attempt_at = Column(DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+    claim_token = Column(String, nullable=True)
+    claimed_at = Column(DateTime, nullable=True)
+    sent_at = Column(DateTime, nullable=True)
+    last_error = Column(String, nullable=True)
+
+
+class RiskRollup(Base):
+    """Hourly counts of login and OTP outcomes, maintained incrementally by app.analytics."""
+    __tablename__ = "risk_rollups"
+    __table_args__ = (
+        # Also the upsert target, and hour-first for time-range queries
+        Index("uq_risk_rollups_key", "hour", "event", "risk_level", "signal", "outcome", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True)
+    hour = Column(DateTime, nullable=False)  # UTC, truncated to the hour
+    event = Column(String, nullable=False)  # "login" or "otp"
+    risk_level = Column(String, nullable=False)  # "low", "high", or "none" when rejected unassessed
+    signal = Column(String, nullable=False)  # A flagged signal's name, or "*" for the event itself
+    outcome = Column(String, nullable=False)
+    count = Column(Integer, default=0, nullable=False)
+    risk_score_total = Column(Integer, default=0, nullable=False)
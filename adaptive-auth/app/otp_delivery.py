@@ -0,0 +1,317 @@
+"""
+Asynchronous OTP delivery through a transactional outbox, sent by a background
+dispatcher over the OTP_TRANSPORT sender. Design notes are in docs/design-notes.md.
+"""
+import base64
+import hashlib
+import importlib
+import json
+import random
+import secrets
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta, timezone
+
+from cryptography.fernet import Fernet, InvalidToken
+from sqlalchemy import and_, func, or_, update
+from sqlalchemy.orm import Session
+
+from app.config import (
+    DEFAULT_SECRET_KEY, DEMO_MODE, SECRET_KEY, OTP_TRANSPORT, OTP_FILE_PATH, OTP_DISPATCH_BATCH_SIZE,
+    OTP_DISPATCH_INTERVAL_SECONDS, OTP_MAX_ATTEMPTS, OTP_RETRY_BASE_SECONDS, OTP_CLAIM_TIMEOUT_SECONDS, OTP_OUTBOX_KEY,
+)
+from app.database import SessionLocal
+from app.models import OtpOutbox, PendingAuth
+from app.profiles import as_utc
+
+
+@dataclass(frozen=True)
+class OtpMessage:
+    id: int
+    user_id: int
+    channel: str
+    destination: str
+    code: str
+
+
+# --- Transports ---
+
+class Transport:
+    """Base sender. Subclasses implement send(), or send_batch() if they can batch natively."""
+
+    def send(self, message: OtpMessage):
+        raise NotImplementedError
+
+    def send_batch(self, messages: list[OtpMessage]) -> list[Exception | None]:
+        """Send every message; returns None or the exception for each, in order."""
+        results = []
+        for message in messages:
+            try:
+                self.send(message)
+                results.append(None)
+            except Exception as exc:
+                results.append(exc)
+        return results
+
+
+class LogTransport(Transport):
+    def send(self, message: OtpMessage):
+        print(f"[DEMO] OTP for {message.destination}: {message.code}")
+
+
+class FileTransport(Transport):
+    """Appends one JSON line per message, so local tools can tail the file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send_batch(self, messages: list[OtpMessage]) -> list[Exception | None]:
+        lines = "".join(json.dumps({**asdict(message), "sent_at": time.time()}) + "\n" for message in messages)
+        with self._lock, open(self.path, "a") as f:
+            f.write(lines)
+        return [None] * len(messages)
+
+
+class MemoryTransport(Transport):
+    """Keeps sent messages in memory. Set fail_next to make that many sends fail."""
+
+    def __init__(self):
+        self.sent: list[OtpMessage] = []
+        self.fail_next = 0
+
+    def send(self, message: OtpMessage):
+        if self.fail_next > 0:
+            self.fail_next -= 1
+            raise ConnectionError("simulated transport failure")
+        self.sent.append(message)
+
+
+def load_transport(name: str) -> Transport:
+    if name == "log":
+        return LogTransport()
+    if name == "file":
+        return FileTransport(OTP_FILE_PATH)
+    if name == "memory":
+        return MemoryTransport()
+    module_name, _, class_name = name.partition(":")
+    if not class_name:
+        raise ValueError(f"OTP_TRANSPORT must be log, file, memory or package.module:ClassName, got {name!r}")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+# --- Outbox ---
+
+def outbox_cipher(key: str = OTP_OUTBOX_KEY, secret: str = SECRET_KEY) -> Fernet:
+    if not key:
+        key = base64.urlsafe_b64encode(hashlib.sha256(b"otp-outbox:" + secret.encode()).digest())
+    return Fernet(key)
+
+
+_cipher = outbox_cipher()
+
+
+def check_outbox_key():
+    """Raise at startup if queued codes would be sealed under the public default SECRET_KEY outside DEMO_MODE."""
+    if not DEMO_MODE and not OTP_OUTBOX_KEY and SECRET_KEY == DEFAULT_SECRET_KEY:
+        raise RuntimeError("Queued OTP codes would be encrypted under the public default SECRET_KEY; "
+                           "set OTP_OUTBOX_KEY or SECRET_KEY")
+
+
+def seal_code(code: str) -> str:
+    return _cipher.encrypt(code.encode()).decode()
+
+
+def open_code(sealed: str) -> str:
+    """Decrypt a sealed code; raises cryptography's InvalidToken if it was sealed under another key."""
+    return _cipher.decrypt(sealed.encode()).decode()
+
+
+def enqueue_otp(db: Session, pending: PendingAuth, user, code: str, channel: str = "email"):
+    """Queue the OTP for delivery in the caller's transaction. The caller commits, then calls notify()."""
+    if pending.id is None:
+        db.flush()
+    db.add(OtpOutbox(
+        pending_auth_id=pending.id,
+        user_id=user.id,
+        channel=channel,
+        destination=user.email,
+        sealed_code=seal_code(code),
+    ))
+
+
+class OtpDispatcher:
+    def __init__(self, transport: Transport, batch_size: int, interval: float, max_attempts: int,
+                 retry_base: float, claim_timeout: float, session_factory=SessionLocal):
+        self.transport = transport
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.claim_timeout = claim_timeout
+        self.session_factory = session_factory
+
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._start_lock = threading.Lock()
+        self._next_retry: float | None = None  # Monotonic time of the soonest retry this process scheduled
+
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.expired = 0
+        self.errors = 0
+        self._latencies = deque(maxlen=1000)  # Seconds from enqueue to sent, most recent messages
+
+    def notify(self):
+        """Wake the dispatcher after committing new outbox rows."""
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self.start()
+        self._wake.set()
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="otp-dispatcher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        # Anything unsent stays in the outbox for the next start
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 5)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            # Sleep until the poll interval or the next scheduled retry, whichever is sooner
+            retry_in = self._next_retry - time.monotonic() if self._next_retry is not None else self.interval
+            self._wake.wait(max(0.0, min(self.interval, retry_in)))
+            self._wake.clear()
+            self._next_retry = None
+            try:
+                while not self._stop.is_set() and self.dispatch_once() == self.batch_size:
+                    pass  # A full batch means more may be waiting
+            except Exception as exc:
+                self.errors += 1
+                print(f"[otp] dispatch failed: {type(exc).__name__}: {exc}")
+
+    def _claim(self, db: Session, now: datetime) -> str | None:
+        claimable = or_(
+            and_(OtpOutbox.status == "pending", OtpOutbox.next_attempt_at <= now),
+            and_(OtpOutbox.status == "sending",
+                 OtpOutbox.claimed_at < now - timedelta(seconds=self.claim_timeout)),
+        )
+        ids = [outbox_id for (outbox_id,) in db.query(OtpOutbox.id).filter(claimable).order_by(
+            OtpOutbox.next_attempt_at,
+        ).limit(self.batch_size)]
+        if not ids:
+            return None
+
+        # Re-checking claimable in the UPDATE keeps other dispatchers' claims intact
+        token = secrets.token_hex(8)
+        db.execute(update(OtpOutbox).where(OtpOutbox.id.in_(ids), claimable).values(
+            status="sending", claim_token=token, claimed_at=now,
+        ))
+        db.commit()
+        return token
+
+    def dispatch_once(self) -> int:
+        """Claim and deliver one batch. Returns how many messages were claimed."""
+        db = self.session_factory()
+        try:
+            now = datetime.now(timezone.utc)
+            token = self._claim(db, now)
+            if token is None:
+                return 0
+
+            # Outer join: a challenge already verified or purged leaves its row nothing to send
+            rows = db.query(OtpOutbox, PendingAuth.expires_at, PendingAuth.is_used).outerjoin(
+                PendingAuth, PendingAuth.id == OtpOutbox.pending_auth_id,
+            ).filter(OtpOutbox.claim_token == token).all()
+
+            deliverable, messages = [], []
+            for row, expires_at, used in rows:
+                if expires_at is None or used or as_utc(expires_at) <= now:
+                    row.status, row.sealed_code = "expired", None
+                    self.expired += 1
+                    continue
+                try:
+                    code = open_code(row.sealed_code)
+                except InvalidToken:
+                    row.status, row.sealed_code, row.last_error = "failed", None, "code sealed under another key"
+                    self.failed += 1
+                    continue
+                deliverable.append(row)
+                messages.append(OtpMessage(id=row.id, user_id=row.user_id, channel=row.channel,
+                                           destination=row.destination, code=code))
+
+            try:
+                results = self.transport.send_batch(messages) if messages else []
+            except Exception as exc:
+                results = [exc] * len(deliverable)
+
+            finished = datetime.now(timezone.utc)
+            for row, error in zip(deliverable, results):
+                row.attempts += 1
+                if error is None:
+                    row.status, row.sealed_code, row.sent_at, row.last_error = "sent", None, finished, None
+                    self.sent += 1
+                    self._latencies.append((finished - as_utc(row.created_at)).total_seconds())
+                elif row.attempts >= self.max_attempts:
+                    row.status, row.sealed_code, row.last_error = "failed", None, str(error)
+                    self.failed += 1
+                else:
+                    backoff = self.retry_base * 2 ** (row.attempts - 1) * random.uniform(0.8, 1.2)
+                    row.status, row.last_error = "pending", str(error)
+                    row.next_attempt_at = finished + timedelta(seconds=backoff)
+                    self.retried += 1
+                    retry_at = time.monotonic() + backoff
+                    self._next_retry = min(self._next_retry or retry_at, retry_at)
+            db.commit()
+            return len(rows)
+        finally:
+            db.close()
+
+    def stats(self) -> dict:
+        latencies = sorted(self._latencies)
+
+        def percentile(pct: float):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(pct / 100 * len(latencies)))] * 1000, 1)
+
+        db = self.session_factory()
+        try:
+            backlog = dict(db.query(OtpOutbox.status, func.count()).filter(
+                OtpOutbox.status.in_(("pending", "sending")),
+            ).group_by(OtpOutbox.status).all())
+        finally:
+            db.close()
+
+        return {
+            "transport": type(self.transport).__name__,
+            "backlog": backlog,
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+            "expired": self.expired,
+            "errors": self.errors,
+            "delivery_latency_ms": {"p50": percentile(50), "p95": percentile(95), "p99": percentile(99)},
+        }
+
+
+dispatcher = OtpDispatcher(
+    transport=load_transport(OTP_TRANSPORT),
+    batch_size=OTP_DISPATCH_BATCH_SIZE,
+    interval=OTP_DISPATCH_INTERVAL_SECONDS,
+    max_attempts=OTP_MAX_ATTEMPTS,
+    retry_base=OTP_RETRY_BASE_SECONDS,
+    claim_timeout=OTP_CLAIM_TIMEOUT_SECONDS,
+)
@@ -0,0 +1,186 @@
+"""
+Incrementally maintained per-user behavioral profiles.
+
+Each successful login folds into a 24-bin login-hour histogram that decays
+exponentially over time, and updates the last known location. The risk
+signals read this O(1) state instead of scanning login_attempts.
+
+Backfill profiles for existing data with:
+    python -m app.profiles backfill
+"""
+import argparse
+from datetime import datetime, timezone
+from sqlalchemy.orm import Session
+
+from app.database import insert_or_ignore
+from app.models import User, LoginAttempt, TrustedDevice, UserProfile
+
+PROFILE_HALF_LIFE_DAYS = 14  # A login's weight in the histogram halves every two weeks
+
+
+def as_utc(value: datetime) -> datetime:
+    """SQLite hands back naive datetimes; treat them as UTC."""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def decay_factor(since: datetime | None, until: datetime) -> float:
+    """Weight multiplier for histogram mass recorded at `since`, as seen at `until`."""
+    if since is None:
+        return 1.0
+    elapsed_days = (as_utc(until) - as_utc(since)).total_seconds() / 86400
+    return 0.5 ** (elapsed_days / PROFILE_HALF_LIFE_DAYS)
+
+
+def decayed_histogram(profile: UserProfile | None, now: datetime) -> list[float]:
+    """Return the profile's login-hour histogram decayed to `now`."""
+    if profile is None or not profile.hour_histogram:
+        return [0.0] * 24
+    factor = decay_factor(profile.histogram_updated_at, now)
+    return [weight * factor for weight in profile.hour_histogram]
+
+
+def get_or_create_profile(db: Session, user_id: int) -> UserProfile:
+    profile = db.get(UserProfile, user_id)
+    if profile is None:
+        # Sessions don't autoflush, so one created earlier in this transaction is only in db.new
+        profile = next((obj for obj in db.new if isinstance(obj, UserProfile) and obj.user_id == user_id), None)
+    if profile is None:
+        # A concurrent first login may create the row after our read; skip it rather than fail
+        db.execute(insert_or_ignore(db.get_bind(), UserProfile, ["user_id"]).values(
+            user_id=user_id, hour_histogram=[0.0] * 24, trusted_device_count=0,
+        ))
+        profile = db.get(UserProfile, user_id)
+    return profile
+
+
+def apply_login(profile: UserProfile, timestamp: datetime,
+                location_lat: float | None, location_lon: float | None):
+    """Fold one successful login into a profile. Does not touch the session."""
+    timestamp = as_utc(timestamp)
+    histogram = list(profile.hour_histogram or [0.0] * 24)
+    updated_at = profile.histogram_updated_at
+
+    if updated_at is None or timestamp >= as_utc(updated_at):
+        # Age the existing mass up to this login, then add it at full weight
+        factor = decay_factor(updated_at, timestamp)
+        histogram = [weight * factor for weight in histogram]
+        histogram[timestamp.hour] += 1.0
+        profile.histogram_updated_at = timestamp
+    else:
+        # Out-of-order login (e.g. seeded history): add it pre-aged instead
+        histogram[timestamp.hour] += decay_factor(timestamp, updated_at)
+
+    # Assign a new list so SQLAlchemy notices the JSON column changed
+    profile.hour_histogram = histogram
+
+    if profile.last_login_at is None or timestamp >= as_utc(profile.last_login_at):
+        profile.last_login_at = timestamp
+
+    if location_lat is not None and location_lon is not None:
+        if profile.last_location_at is None or timestamp >= as_utc(profile.last_location_at):
+            profile.last_lat = location_lat
+            profile.last_lon = location_lon
+            profile.last_location_at = timestamp
+
+
+def record_successful_login(db: Session, user_id: int, timestamp: datetime,
+                            location_lat: float | None = None,
+                            location_lon: float | None = None) -> UserProfile:
+    """Update the user's profile in the caller's transaction. Caller commits."""
+    profile = get_or_create_profile(db, user_id)
+    apply_login(profile, timestamp, location_lat, location_lon)
+    return profile
+
+
+def record_trusted_device(db: Session, user_id: int) -> UserProfile:
+    """Count a newly trusted device in the caller's transaction. Caller commits."""
+    profile = get_or_create_profile(db, user_id)
+    profile.trusted_device_count = (profile.trusted_device_count or 0) + 1
+    return profile
+
+
+def trust_device(db: Session, user_id: int, device_fingerprint: str, now: datetime) -> bool:
+    """
+    Trust a device in a single insert that skips an already trusted one, and
+    count it in the profile if it was new. Returns whether it was new. Caller
+    commits.
+    """
+    inserted = db.execute(
+        insert_or_ignore(db.get_bind(), TrustedDevice, ["user_id", "device_fingerprint"]).values(
+            user_id=user_id, device_fingerprint=device_fingerprint, first_seen=now, last_seen=now,
+        ).returning(TrustedDevice.id)
+    ).first()
+    if inserted is not None:
+        record_trusted_device(db, user_id)
+    return inserted is not None
+
+
+def rebuild_profile(db: Session, user_id: int) -> UserProfile:
+    """Recompute a user's profile from scratch from login_attempts and trusted_devices."""
+    profile = get_or_create_profile(db, user_id)
+    profile.hour_histogram = [0.0] * 24
+    profile.histogram_updated_at = None
+    profile.last_lat = profile.last_lon = None
+    profile.last_location_at = None
+    profile.last_login_at = None
+
+    attempts = db.query(
+        LoginAttempt.timestamp, LoginAttempt.location_lat, LoginAttempt.location_lon,
+    ).filter(
+        LoginAttempt.user_id == user_id,
+        LoginAttempt.success == True,
+    ).order_by(LoginAttempt.timestamp).yield_per(1000)
+
+    for timestamp, location_lat, location_lon in attempts:
+        apply_login(profile, timestamp, location_lat, location_lon)
+
+    profile.trusted_device_count = db.query(TrustedDevice).filter(
+        TrustedDevice.user_id == user_id,
+    ).count()
+    return profile
+
+
+def backfill_profiles(db: Session, batch_size: int = 500) -> int:
+    """Rebuild every user's profile, committing every `batch_size` users."""
+    rebuilt = 0
+    last_id = 0
+    while True:
+        user_ids = [user_id for (user_id,) in db.query(User.id).filter(
+            User.id > last_id,
+        ).order_by(User.id).limit(batch_size)]
+        if not user_ids:
+            break
+
+        for user_id in user_ids:
+            rebuild_profile(db, user_id)
+        db.commit()
+
+        rebuilt += len(user_ids)
+        last_id = user_ids[-1]
+    return rebuilt
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain per-user behavioral profiles")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    backfill = subcommands.add_parser("backfill", help="Build profiles from existing login_attempts")
+    backfill.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    from app.database import SessionLocal
+    from app.migrate import upgrade_database
+    upgrade_database()
+
+    db = SessionLocal()
+    try:
+        if args.command == "backfill":
+            count = backfill_profiles(db, batch_size=args.batch_size)
+            print(f"Rebuilt profiles for {count} users")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
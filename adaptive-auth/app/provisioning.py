@@ -0,0 +1,390 @@
+"""
+Bulk user provisioning from NDJSON or CSV.
+
+Each row has a username, an email and either a plaintext `password` or an
+existing bcrypt `password_hash` ($2a$/$2b$/$2y$, as exported by most
+identity providers). Rows with a hash skip bcrypt entirely, which is by
+far the fastest way to bring a tenant over.
+
+The file is read as a stream in chunks of PROVISION_CHUNK_SIZE rows:
+
+  1. rows are validated; a username or email repeated within the file
+     fails on every occurrence after the first;
+  2. the chunk is checked against existing users with one
+     `username IN (...) OR email IN (...)` query;
+  3. the remaining plaintext passwords are hashed on a pool of
+     PROVISION_WORKERS spawned processes (by default every core for the
+     CLI, a quarter of them inside the server, which keeps serving
+     logins). The next chunk is hashed while this one is inserted;
+  4. rows are inserted with INSERT ... ON CONFLICT DO NOTHING RETURNING, in
+     transactions of PROVISION_INSERT_BATCH rows with a pause of
+     PROVISION_PAUSE_SECONDS after each. SQLite's write lock is therefore
+     held for a few milliseconds at a time, and logins and registrations
+     waiting on it get in between batches. A user registered concurrently
+     after step 2 is caught by the conflict clause and reported like any
+     other duplicate.
+
+Rows are never updated; a failed row is reported with its line number and
+the rest of the file carries on. Bytes that aren't UTF-8 fail their row
+the same way. Re-running a file is safe: rows already
+created fail as duplicates.
+
+    POST /provision/users  (Authorization: Bearer $PROVISION_TOKEN; text/csv or application/x-ndjson)
+    python -m app.provisioning users.csv
+    python -m app.provisioning users.ndjson --dry-run
+
+The endpoint answers when the whole file is done. Importing plaintext
+passwords costs a bcrypt hash per user, so large files of those are better
+run with the CLI next to the database.
+"""
+import argparse
+import csv
+import io
+import json
+import multiprocessing
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Iterable, Iterator, TextIO
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy import or_, select
+from starlette.concurrency import run_in_threadpool
+
+from app import cache
+from app.config import (
+    PROVISION_CHUNK_SIZE, PROVISION_INSERT_BATCH, PROVISION_MAX_REPORTED_ERRORS, PROVISION_PAUSE_SECONDS,
+    PROVISION_TOKEN, PROVISION_WORKERS,
+)
+from app.database import dialect_insert, engine
+from app.hashing import hash_password
+from app.models import User
+from app.tokens import require_static_token
+
+router = APIRouter(prefix="/provision", tags=["Provisioning"])
+
+FORMATS = ("ndjson", "csv")
+BCRYPT_HASH = re.compile(r"^\$2[aby]\$\d{2}\$[./A-Za-z0-9]{53}$")
+EMAIL = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+SPOOL_MAX_MEMORY_BYTES = 8 * 1024 * 1024  # Larger uploads spill to a temporary file
+
+
+class Row:
+    __slots__ = ("line", "username", "email", "password", "password_hash")
+
+    def __init__(self, line: int, username: str, email: str, password: str | None, password_hash: str | None):
+        self.line = line
+        self.username = username
+        self.email = email
+        self.password = password
+        self.password_hash = password_hash
+
+
+class Report:
+    def __init__(self, max_errors: int = PROVISION_MAX_REPORTED_ERRORS):
+        self.rows = 0
+        self.created = 0
+        self.hashed = 0
+        self.error_counts = Counter()
+        self.errors = []
+        self.max_errors = max_errors
+        self.started = time.perf_counter()
+
+    def fail(self, line: int, username, error: str):
+        self.error_counts[error] += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"line": line, "username": username, "error": error})
+
+    def as_dict(self, dry_run: bool = False) -> dict:
+        failed = sum(self.error_counts.values())
+        report = {
+            "rows": self.rows,
+            "created": self.created,
+            "failed": failed,
+            "hashed": self.hashed,
+            "error_counts": dict(self.error_counts),
+            "errors": sorted(self.errors, key=lambda error: error["line"]),
+            "errors_truncated": failed > len(self.errors),
+            "seconds": round(time.perf_counter() - self.started, 3),
+        }
+        if dry_run:
+            report["would_create"] = self.rows - failed
+        return report
+
+
+# --- Parsing ---
+
+def read_records(stream: TextIO, format: str) -> Iterator[tuple[int, dict | str]]:
+    """Yield (line number, record) pairs; a record that can't be parsed comes back as an error string."""
+    if format == "csv":
+        reader = csv.DictReader(stream)
+        try:
+            for record in reader:
+                yield reader.line_num, record
+        except csv.Error as exc:
+            yield reader.line_num, f"invalid CSV: {exc}"
+        return
+
+    for line, text in enumerate(stream, 1):
+        if not text.strip():
+            continue
+        try:
+            record = json.loads(text)
+        except ValueError:
+            yield line, "invalid JSON"
+            continue
+        yield line, record if isinstance(record, dict) else "expected a JSON object"
+
+
+def _field(record: dict, name: str) -> str | None:
+    value = record.get(name)
+    if value is None:
+        return None
+    if not isinstance(value, str):
+        raise ValueError(f"{name} must be a string")
+    return value.strip() or None
+
+
+def parse_row(line: int, record: dict) -> Row:
+    """Validate one record, raising ValueError with the reason it can't be provisioned."""
+    username = _field(record, "username")
+    email = _field(record, "email")
+    password = record.get("password") or None
+    password_hash = _field(record, "password_hash")
+    if any("\ufffd" in value for value in record.values() if isinstance(value, str)):
+        raise ValueError("invalid UTF-8")  # Replaced by text_stream while decoding
+    if not username:
+        raise ValueError("missing username")
+    if not email or not EMAIL.match(email):
+        raise ValueError("invalid email")
+    if password is not None and not isinstance(password, str):
+        raise ValueError("password must be a string")
+    if (password is None) == (password_hash is None):
+        raise ValueError("exactly one of password and password_hash is required")
+    if password_hash is not None and not BCRYPT_HASH.match(password_hash):
+        raise ValueError("password_hash is not a bcrypt hash")
+    if password is not None and len(password.encode("utf-8")) > 72:
+        raise ValueError("password is longer than bcrypt's 72 bytes")
+    return Row(line, username, email, password, password_hash)
+
+
+# --- Provisioning ---
+
+def existing_users(conn, rows: list[Row]) -> tuple[set[str], set[str]]:
+    """Usernames and emails from rows that already belong to some user."""
+    usernames = [row.username for row in rows]
+    emails = [row.email for row in rows]
+    found = conn.execute(
+        select(User.username, User.email).where(or_(User.username.in_(usernames), User.email.in_(emails)))
+    ).all()
+    return {username for username, _ in found}, {email for _, email in found}
+
+
+class Provisioner:
+    """Runs one file through validate, dedupe, hash and insert; see the module docstring."""
+
+    def __init__(self, executor: Executor | None = None, workers: int = 1, chunk_size: int = PROVISION_CHUNK_SIZE,
+                 insert_batch: int = PROVISION_INSERT_BATCH, pause_seconds: float = PROVISION_PAUSE_SECONDS,
+                 dry_run: bool = False, report: Report | None = None):
+        self.executor = executor
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.insert_batch = insert_batch
+        self.pause_seconds = pause_seconds
+        self.dry_run = dry_run
+        self.report = report or Report()
+        self._seen_usernames = set()
+        self._seen_emails = set()
+
+    def _valid_rows(self, records: Iterable[tuple[int, dict | str]]) -> Iterator[Row]:
+        for line, record in records:
+            self.report.rows += 1
+            if isinstance(record, str):
+                self.report.fail(line, None, record)
+                continue
+            try:
+                row = parse_row(line, record)
+            except ValueError as exc:
+                self.report.fail(line, record.get("username"), str(exc))
+                continue
+            # Compared as given; the login path looks usernames up exactly
+            if row.username in self._seen_usernames:
+                self.report.fail(line, row.username, "duplicate username in file")
+                continue
+            if row.email in self._seen_emails:
+                self.report.fail(line, row.username, "duplicate email in file")
+                continue
+            self._seen_usernames.add(row.username)
+            self._seen_emails.add(row.email)
+            yield row
+
+    def _chunks(self, rows: Iterator[Row]) -> Iterator[list[Row]]:
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _new_rows(self, chunk: list[Row]) -> list[Row]:
+        with engine.connect() as conn:
+            usernames, emails = existing_users(conn, chunk)
+        new = []
+        for row in chunk:
+            if row.username in usernames:
+                self.report.fail(row.line, row.username, "username already exists")
+            elif row.email in emails:
+                self.report.fail(row.line, row.username, "email already exists")
+            else:
+                new.append(row)
+        return new
+
+    def _start_hashing(self, rows: list[Row]):
+        plaintext = [row for row in rows if row.password_hash is None]
+        if not plaintext or self.dry_run:
+            return plaintext, iter(())
+        passwords = [row.password for row in plaintext]
+        if self.executor is None:
+            return plaintext, map(hash_password, passwords)
+        # Executor.map submits everything now and yields in order later
+        chunksize = max(1, len(passwords) // (self.workers * 4))
+        return plaintext, self.executor.map(hash_password, passwords, chunksize=chunksize)
+
+    def _finish(self, rows: list[Row], hashing):
+        plaintext, hashes = hashing
+        for row, password_hash in zip(plaintext, hashes):
+            row.password_hash = password_hash
+            row.password = None
+            self.report.hashed += 1
+        if not self.dry_run:
+            self._insert(rows)
+
+    def _insert(self, rows: list[Row]):
+        statement = dialect_insert(engine, User).on_conflict_do_nothing().returning(User.username)
+        for start in range(0, len(rows), self.insert_batch):
+            batch = rows[start:start + self.insert_batch]
+            with engine.begin() as conn:
+                created = set(conn.execute(statement, [
+                    {"username": row.username, "email": row.email, "password_hash": row.password_hash}
+                    for row in batch
+                ]).scalars())
+            for row in batch:
+                if row.username in created:
+                    # The username may be cached as "doesn't exist"
+                    cache.users.invalidate(row.username)
+                else:
+                    self.report.fail(row.line, row.username, "username or email already exists")
+            self.report.created += len(created)
+            if self.pause_seconds > 0:
+                time.sleep(self.pause_seconds)
+
+    def run(self, records: Iterable[tuple[int, dict | str]]) -> Report:
+        pending = None
+        for chunk in self._chunks(self._valid_rows(records)):
+            rows = self._new_rows(chunk)
+            hashing = self._start_hashing(rows)
+            if pending is not None:
+                self._finish(*pending)
+            pending = (rows, hashing)
+        if pending is not None:
+            self._finish(*pending)
+        return self.report
+
+
+def default_workers(in_server: bool) -> int:
+    """PROVISION_WORKERS, or when it's 0, every core for the CLI and a quarter of them in the server."""
+    if PROVISION_WORKERS > 0:
+        return PROVISION_WORKERS
+    cores = os.cpu_count() or 1
+    return max(1, cores // 4) if in_server else cores
+
+
+def text_stream(binary) -> io.TextIOWrapper:
+    """Decode an upload. Invalid UTF-8 becomes U+FFFD, which parse_row rejects, instead of an exception."""
+    return io.TextIOWrapper(binary, encoding="utf-8-sig", errors="replace", newline="")
+
+
+def provision(stream: TextIO, format: str, workers: int | None = None, dry_run: bool = False,
+              **options) -> dict:
+    """Provision every user in an NDJSON or CSV text stream and return the report."""
+    workers = default_workers(in_server=False) if workers is None else workers
+    executor = None
+    if workers > 1 and not dry_run:
+        # Spawned, not forked: the server has threads, and a fork copies their locks mid-use
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        report = Provisioner(executor, workers, dry_run=dry_run, **options).run(read_records(stream, format))
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+    return report.as_dict(dry_run)
+
+
+# --- API ---
+
+# One import at a time per process
+_running = threading.Lock()
+
+
+def _format_of(request: Request, format: str | None) -> str:
+    if format:
+        return format
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    return "csv" if content_type in ("text/csv", "application/csv") else "ndjson"
+
+
+@router.post("/users", dependencies=[Depends(require_static_token(PROVISION_TOKEN, "PROVISION_TOKEN"))])
+async def provision_users(request: Request, format: str | None = Query(None, pattern="^(ndjson|csv)$"),
+                          dry_run: bool = False):
+    """
+    Create users from an NDJSON or CSV body (format from Content-Type unless
+    given). Returns counts and per-row errors. Requires
+    `Authorization: Bearer <PROVISION_TOKEN>`.
+    """
+    if not _running.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail="A provisioning run is already in progress")
+    try:
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY_BYTES) as spool:
+            async for chunk in request.stream():
+                spool.write(chunk)
+            spool.seek(0)
+            text = text_stream(spool)
+            try:
+                return await run_in_threadpool(provision, text, _format_of(request, format),
+                                               workers=default_workers(in_server=True), dry_run=dry_run)
+            finally:
+                text.detach()
+    finally:
+        _running.release()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-provision users from NDJSON or CSV")
+    parser.add_argument("path", help='file to read, or "-" for stdin')
+    parser.add_argument("--format", choices=FORMATS, help="defaults to csv for *.csv files, ndjson otherwise")
+    parser.add_argument("--workers", type=int, default=default_workers(in_server=False), help="bcrypt processes")
+    parser.add_argument("--dry-run", action="store_true", help="validate and check for duplicates only")
+    args = parser.parse_args()
+
+    from app.migrate import upgrade_database
+    upgrade_database()
+
+    format = args.format or ("csv" if args.path.lower().endswith(".csv") else "ndjson")
+    if args.path == "-":
+        stream = text_stream(sys.stdin.buffer)
+    else:
+        stream = open(args.path, encoding="utf-8-sig", errors="replace", newline="")
+    with stream:
+        report = provision(stream, format, workers=args.workers, dry_run=args.dry_run)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+"""
+Replay login history under alternative risk weights and thresholds, to backtest them.
+How state is rebuilt, and its limits after compaction, is in docs/design-notes.md.
+"""
+import argparse
+import json
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.orm import Session
+
+from app.cache import CachedUser
+from app.models import LoginAttempt, LoginAttemptDaily, TrustedDevice
+from app.profiles import apply_login, as_utc
+from app.risk_engine import RISK_THRESHOLD, SIGNALS, RiskEvent, build_risk_context
+
+REPLAY_CHUNK_SIZE = 5000
+REPLAY_WARMUP_DAYS = 14  # Surviving history that only builds state once older attempts were compacted
+SCORE_BUCKET = 10  # Width of the score histogram buckets
+SKIPPED_FAILURES = {"throttled", "otp_throttled"}  # Rejected before any risk assessment
+
+
+@dataclass
+class ReplayConfig:
+    """A threshold plus per-signal weights. Missing weights keep their registered value."""
+    name: str
+    threshold: int = RISK_THRESHOLD
+    weights: dict = field(default_factory=dict)
+
+    def weight(self, signal) -> int:
+        return self.weights.get(signal.name, signal.weight)
+
+
+def parse_config(value: str) -> ReplayConfig:
+    """Parse "name:threshold=80,new_device=60" into a ReplayConfig."""
+    name, _, settings = value.partition(":")
+    config = ReplayConfig(name=name)
+    known = {signal.name for signal in SIGNALS}
+    for setting in filter(None, settings.split(",")):
+        key, _, number = setting.partition("=")
+        key = key.strip()
+        if key == "threshold":
+            config.threshold = int(number)
+        elif key in known:
+            config.weights[key] = int(number)
+        else:
+            raise ValueError(f"unknown setting {key!r}; expected threshold or one of {sorted(known)}")
+    return config
+
+
+def signal_results(event: RiskEvent, context) -> dict:
+    """Raw signal outputs (bool, or int points), independent of any configuration."""
+    return {signal.name: signal.evaluate(event, context) for signal in SIGNALS}
+
+
+def score(results: dict, config: ReplayConfig) -> tuple[int, dict]:
+    """Score raw signal results under config. Integer results scale with the weight."""
+    total = 0
+    points = {}
+    for signal in SIGNALS:
+        weight = config.weight(signal)
+        result = results[signal.name]
+        if isinstance(result, bool):
+            value = weight if result else 0
+        else:
+            value = max(0, min(int(result), signal.weight)) * weight // signal.weight if signal.weight else 0
+        points[signal.name] = value
+        total += value
+    return total, points
+
+
+class Tally:
+    """Aggregate outcomes for one configuration; shards' tallies are merged."""
+
+    def __init__(self):
+        self.scored = 0
+        self.successful = 0
+        self.challenged = 0      # Successful logins that would have needed MFA
+        self.high_risk = 0       # Any attempt at or over the threshold
+        self.scores = Counter()  # Exact score -> attempts
+        self.fired = Counter()   # Signal name -> attempts where it added points
+
+    def add(self, total: int, points: dict, high: bool, success: bool):
+        self.scored += 1
+        self.scores[total] += 1
+        self.high_risk += high
+        if success:
+            self.successful += 1
+            self.challenged += high
+        for name, value in points.items():
+            if value:
+                self.fired[name] += 1
+
+    def merge(self, other: "Tally"):
+        self.scored += other.scored
+        self.successful += other.successful
+        self.challenged += other.challenged
+        self.high_risk += other.high_risk
+        self.scores.update(other.scores)
+        self.fired.update(other.fired)
+
+    def percentile(self, pct: float) -> int | None:
+        if not self.scored:
+            return None
+        rank = pct / 100 * (self.scored - 1)
+        seen = 0
+        for value in sorted(self.scores):
+            seen += self.scores[value]
+            if seen > rank:
+                return value
+        return max(self.scores)
+
+    def report(self, config: ReplayConfig) -> dict:
+        buckets = Counter()
+        for value, count in self.scores.items():
+            buckets[value // SCORE_BUCKET * SCORE_BUCKET] += count
+        return {
+            "name": config.name,
+            "threshold": config.threshold,
+            "weights": {signal.name: config.weight(signal) for signal in SIGNALS},
+            "scored": self.scored,
+            "successful": self.successful,
+            "challenged": self.challenged,
+            "challenge_rate": round(self.challenged / self.successful, 4) if self.successful else None,
+            "high_risk_rate": round(self.high_risk / self.scored, 4) if self.scored else None,
+            "score_percentiles": {f"p{pct}": self.percentile(pct) for pct in (50, 90, 99)},
+            "score_histogram": {f"{low}-{low + SCORE_BUCKET - 1}": buckets[low] for low in sorted(buckets)},
+            "signals_fired": {signal.name: self.fired[signal.name] for signal in SIGNALS},
+        }
+
+
+def _attempt_chunks(db: Session, first_user: int, last_user: int, chunk_size: int):
+    """Yield attempts for user ids in [first_user, last_user) in per-user time order."""
+    columns = (LoginAttempt.id, LoginAttempt.user_id, LoginAttempt.timestamp, LoginAttempt.ip_address,
+               LoginAttempt.device_fingerprint, LoginAttempt.location_lat, LoginAttempt.location_lon,
+               LoginAttempt.risk_score, LoginAttempt.risk_level, LoginAttempt.success, LoginAttempt.failure_reason)
+    position = None
+    while True:
+        query = select(*columns).where(
+            LoginAttempt.user_id >= first_user,
+            LoginAttempt.user_id < last_user,
+        )
+        if position is not None:
+            query = query.where(
+                tuple_(LoginAttempt.user_id, LoginAttempt.timestamp, LoginAttempt.id) > tuple_(*position)
+            )
+        rows = db.execute(query.order_by(
+            LoginAttempt.user_id, LoginAttempt.timestamp, LoginAttempt.id,
+        ).limit(chunk_size)).all()
+        if not rows:
+            return
+        yield rows
+        last = rows[-1]
+        position = (last.user_id, last.timestamp, last.id)
+
+
+def _trusted_since(db: Session, user_ids: set) -> dict:
+    """{user_id: {fingerprint: first_seen}} for the given users."""
+    devices = {}
+    for user_id, fingerprint, first_seen in db.query(
+        TrustedDevice.user_id, TrustedDevice.device_fingerprint, TrustedDevice.first_seen,
+    ).filter(TrustedDevice.user_id.in_(user_ids)):
+        devices.setdefault(user_id, {})[fingerprint] = as_utc(first_seen)
+    return devices
+
+
+def _new_profile():
+    # apply_login and the signals only need these attributes
+    return SimpleNamespace(hour_histogram=[0.0] * 24, histogram_updated_at=None, last_login_at=None,
+                           last_lat=None, last_lon=None, last_location_at=None)
+
+
+def replay_attempts(db: Session, first_user: int, last_user: int, chunk_size: int = REPLAY_CHUNK_SIZE):
+    """
+    Yield (row, signal results) for every attempt by user ids in
+    [first_user, last_user), in per-user time order. Results are None for
+    attempts rejected before any assessment.
+    """
+    current_user, user, profile = None, None, None
+    for rows in _attempt_chunks(db, first_user, last_user, chunk_size):
+        trusted = _trusted_since(db, {row.user_id for row in rows})
+        for row in rows:
+            if row.user_id != current_user:
+                # Rows arrive user by user, so the previous user's state can go
+                current_user = row.user_id
+                user = CachedUser(id=row.user_id, username="", email="", password_hash="")
+                profile = _new_profile()
+
+            timestamp = as_utc(row.timestamp)
+            results = None
+            if row.failure_reason not in SKIPPED_FAILURES:
+                # Strictly before: the OTP that trusted a device is logged at its first_seen
+                devices = frozenset(
+                    fingerprint for fingerprint, since in trusted.get(row.user_id, {}).items()
+                    if since < timestamp
+                )
+                context = build_risk_context(user, profile, devices, row.device_fingerprint, timestamp)
+                event = RiskEvent(
+                    ip_address=row.ip_address,
+                    device_fingerprint=row.device_fingerprint,
+                    location_lat=row.location_lat,
+                    location_lon=row.location_lon,
+                )
+                results = signal_results(event, context)
+            yield row, results
+
+            if row.success:
+                apply_login(profile, timestamp, row.location_lat, row.location_lon)
+
+
+def replay_shard(first_user: int, last_user: int, configs: list[ReplayConfig],
+                 chunk_size: int = REPLAY_CHUNK_SIZE, score_from: datetime | None = None) -> list[Tally]:
+    """
+    Replay one user id range. Returns one Tally per config, in order.
+    Attempts before score_from update state but aren't tallied.
+    """
+    from app.database import SessionLocal
+
+    score_from = as_utc(score_from) if score_from is not None else None
+    tallies = [Tally() for _ in configs]
+    db = SessionLocal()
+    try:
+        for row, results in replay_attempts(db, first_user, last_user, chunk_size):
+            if results is None or (score_from is not None and as_utc(row.timestamp) < score_from):
+                continue
+            for config, tally in zip(configs, tallies):
+                total, points = score(results, config)
+                tally.add(total, points, total >= config.threshold, bool(row.success))
+    finally:
+        db.close()
+    return tallies
+
+
+def shard_ranges(db: Session, shards: int) -> list[tuple[int, int]]:
+    low, high = db.query(func.min(LoginAttempt.user_id), func.max(LoginAttempt.user_id)).one()
+    if low is None:
+        return []
+    step = max(1, -(-(high - low + 1) // shards))
+    return [(start, min(start + step, high + 1)) for start in range(low, high + 1, step)]
+
+
+def scoring_start(db: Session, warmup_days: float) -> datetime | None:
+    """Where scoring starts: warmup_days into the surviving history once any was compacted, else None."""
+    if db.query(LoginAttemptDaily.id).first() is None:
+        return None  # Nothing compacted, so every user's history is complete
+    oldest = db.query(func.min(LoginAttempt.timestamp)).scalar()
+    return as_utc(oldest) + timedelta(days=warmup_days) if oldest is not None else None
+
+
+def replay(configs: list[ReplayConfig], workers: int = 1, shards: int | None = None,
+           chunk_size: int = REPLAY_CHUNK_SIZE, warmup_days: float = REPLAY_WARMUP_DAYS) -> list[dict]:
+    """Replay all attempts by known users under each config; returns one report per config."""
+    from app.database import SessionLocal, dispose_inherited_connections
+
+    db = SessionLocal()
+    try:
+        ranges = shard_ranges(db, shards or workers * 4)
+        score_from = scoring_start(db, warmup_days)
+    finally:
+        db.close()
+
+    totals = [Tally() for _ in configs]
+    if workers <= 1:
+        results = (replay_shard(first, last, configs, chunk_size, score_from) for first, last in ranges)
+        for shard in results:
+            for total, tally in zip(totals, shard):
+                total.merge(tally)
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=dispose_inherited_connections) as pool:
+            futures = [pool.submit(replay_shard, first, last, configs, chunk_size, score_from)
+                       for first, last in ranges]
+            for future in futures:
+                for total, tally in zip(totals, future.result()):
+                    total.merge(tally)
+    scored_from = score_from.isoformat() if score_from is not None else None
+    return [{**tally.report(config), "scored_from": scored_from} for config, tally in zip(configs, totals)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay login history under alternative risk configurations")
+    parser.add_argument("--config", action="append", default=[],
+                        help='"name:threshold=N,signal=points,..."; may be repeated')
+    parser.add_argument("--config-file", help='JSON list of {"name", "threshold", "weights"} objects')
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--shards", type=int, help="user id ranges to split the work into (default 4 per worker)")
+    parser.add_argument("--chunk-size", type=int, default=REPLAY_CHUNK_SIZE)
+    parser.add_argument("--warmup-days", type=float, default=REPLAY_WARMUP_DAYS,
+                        help="surviving history that only builds state once older attempts were compacted")
+    args = parser.parse_args()
+
+    from app.migrate import upgrade_database
+    upgrade_database()
+
+    configs = [ReplayConfig(name="current")]
+    configs += [parse_config(value) for value in args.config]
+    if args.config_file:
+        with open(args.config_file) as f:
+            configs += [ReplayConfig(**item) for item in json.load(f)]
+
+    reports = replay(configs, workers=args.workers, shards=args.shards, chunk_size=args.chunk_size,
+                     warmup_days=args.warmup_days)
+    print(json.dumps(reports, indent=2))
+
+
+if __name__ == "__main__":
+    main()
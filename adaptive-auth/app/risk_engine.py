@@ -1,49 +1,263 @@
-from datetime import datetime, timedelta, timezone
+from dataclasses import dataclass, field
+from typing import Callable
+from datetime import datetime, timezone
 from math import radians, cos, sin, asin, sqrt
+from time import perf_counter
 from sqlalchemy.orm import Session
-from app.models import User, LoginAttempt, TrustedDevice
+from app import cache, metrics
+from app.cache import MISSING, CachedUser, CachedProfile, snapshot_user, snapshot_profile
+from app.models import User, TrustedDevice, UserProfile
+from app.profiles import decayed_histogram
+from app.config import IP_REPUTATION_MAX_POINTS, RISK_SCORER
+from app.ip_reputation import ip_severity
 
 RISK_THRESHOLD = 100
 MAX_TRAVEL_SPEED_KMH = 1000  # Faster than commercial flight = suspicious
 
 
+@dataclass
+class RiskContext:
+    """Everything the risk signals need to know about a user, loaded up front."""
+    user: CachedUser | None
+    profile: CachedProfile | None = None
+    trusted_devices: frozenset = frozenset()
+    device_trusted: bool = False
+    last_location: tuple[float, float, datetime] | None = None
+    hour_histogram: list[float] = field(default_factory=lambda: [0.0] * 24)
+    now: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+
+
+def load_risk_context(db: Session, username: str, device_fingerprint: str | None,
+                      now: datetime | None = None) -> RiskContext:
+    """
+    Load the user, trusted devices and behavioral profile, from the cache when
+    possible. A cold user costs a single round trip, so no signal has to query
+    the database itself.
+    """
+    now = now or datetime.now(timezone.utc)
+
+    # Taken before any query, so a write committed meanwhile keeps our copy out of the cache
+    since = cache.generation()
+    user = cache.users.get(username)
+    if user is MISSING:
+        user, profile, devices = _load_user_state(db, username)
+        cache.users.set(username, user, since)
+        if user is not None:
+            cache.profiles.set(user.id, profile, since)
+            cache.trusted_devices.set(user.id, devices, since)
+    elif user is not None:
+        profile = cache.profiles.get(user.id)
+        if profile is MISSING:
+            profile = snapshot_profile(db.get(UserProfile, user.id))
+            cache.profiles.set(user.id, profile, since)
+
+        devices = cache.trusted_devices.get(user.id)
+        if devices is MISSING:
+            devices = frozenset(fingerprint for (fingerprint,) in db.query(
+                TrustedDevice.device_fingerprint,
+            ).filter(TrustedDevice.user_id == user.id))
+            cache.trusted_devices.set(user.id, devices, since)
+
+    if user is None:
+        return RiskContext(user=None, now=now)
+    return build_risk_context(user, profile, devices, device_fingerprint, now)
+
+
+def build_risk_context(user: CachedUser | None, profile: CachedProfile | None, devices: frozenset,
+                       device_fingerprint: str | None, now: datetime) -> RiskContext:
+    """Assemble a RiskContext from already-loaded user state."""
+    if user is None:
+        return RiskContext(user=None, now=now)
+
+    context = RiskContext(
+        user=user,
+        profile=profile,
+        trusted_devices=devices,
+        device_trusted=device_fingerprint is not None and device_fingerprint in devices,
+        hour_histogram=decayed_histogram(profile, now),
+        now=now,
+    )
+    if profile is not None and profile.last_location_at is not None:
+        context.last_location = (profile.last_lat, profile.last_lon, profile.last_location_at)
+    return context
+
+
+def _load_user_state(db: Session, username: str):
+    """One query for the user, their profile and all their trusted devices."""
+    rows = db.query(User, UserProfile, TrustedDevice.device_fingerprint).outerjoin(
+        UserProfile, UserProfile.user_id == User.id,
+    ).outerjoin(
+        TrustedDevice, TrustedDevice.user_id == User.id,
+    ).filter(User.username == username).all()
+
+    if not rows:
+        return None, None, frozenset()
+
+    user, profile, _ = rows[0]
+    devices = frozenset(fingerprint for _, _, fingerprint in rows if fingerprint is not None)
+    return snapshot_user(user), snapshot_profile(profile), devices
+
+
+def preload_user_states(db: Session, user_ids: list[int], chunk_size: int = 500) -> int:
+    """
+    Fill the caches for many users with two queries per chunk, as
+    load_risk_context would one user at a time. Returns the users loaded.
+    """
+    loaded = 0
+    for start in range(0, len(user_ids), chunk_size):
+        chunk = user_ids[start:start + chunk_size]
+        since = cache.generation()
+        devices = {}
+        for user_id, fingerprint in db.query(TrustedDevice.user_id, TrustedDevice.device_fingerprint).filter(
+            TrustedDevice.user_id.in_(chunk),
+        ):
+            devices.setdefault(user_id, set()).add(fingerprint)
+
+        for user, profile in db.query(User, UserProfile).outerjoin(
+            UserProfile, UserProfile.user_id == User.id,
+        ).filter(User.id.in_(chunk)):
+            cache.users.set(user.username, snapshot_user(user), since)
+            cache.profiles.set(user.id, snapshot_profile(profile), since)
+            cache.trusted_devices.set(user.id, frozenset(devices.get(user.id, ())), since)
+            loaded += 1
+    return loaded
+
+
+@dataclass(frozen=True)
+class RiskEvent:
+    """The login being assessed."""
+    ip_address: str
+    device_fingerprint: str | None
+    location_lat: float | None
+    location_lon: float | None
+
+
+@dataclass(frozen=True)
+class Signal:
+    name: str
+    weight: int  # Most points this signal can add
+    cost: int    # Relative evaluation cost; cheaper signals run first
+    evaluate: Callable[[RiskEvent, RiskContext], bool | int]
+
+
+SIGNALS: list[Signal] = []  # In registration order, which is also report order
+_SIGNALS_BY_COST: list[Signal] = []
+
+
+def register_signal(name: str, weight: int, cost: int):
+    """
+    Register a risk signal. The decorated function takes (event, context) and
+    returns True to add the signal's full weight, False for nothing, or an
+    explicit number of points up to the weight.
+    """
+    def decorator(evaluate):
+        SIGNALS[:] = [signal for signal in SIGNALS if signal.name != name]
+        SIGNALS.append(Signal(name=name, weight=weight, cost=cost, evaluate=evaluate))
+        _SIGNALS_BY_COST[:] = sorted(SIGNALS, key=lambda signal: signal.cost)
+        return evaluate
+    return decorator
+
+
+# Alternatives to the weighted signals, selected with RISK_SCORER
+SCORERS: dict[str, Callable] = {}
+
+
+def register_scorer(name: str):
+    """
+    Register a scorer that assess_risk uses instead of the signals when
+    RISK_SCORER names it. The decorated function takes (event, context, full)
+    and returns an assess_risk-shaped dict, or None to fall back to the
+    signals (e.g. while it has no model loaded).
+    """
+    def decorator(score):
+        SCORERS[name] = score
+        return score
+    return decorator
+
+
+def signal_points(signal: Signal, event: RiskEvent, context: RiskContext) -> int:
+    result = signal.evaluate(event, context)
+    if isinstance(result, bool):
+        return signal.weight if result else 0
+    return max(0, min(int(result), signal.weight))
+
+
+def evaluate_signals(points_of: Callable[[Signal], int], full: bool = False) -> dict[str, int]:
+    """
+    {signal name: points} for the signals, cheapest first, until the ones left
+    can't change the risk level; every signal with full=True. assess_risk and
+    the analytics backfill both stop here, so they skip the same signals.
+    """
+    risk_score = 0
+    remaining_weight = sum(signal.weight for signal in _SIGNALS_BY_COST)
+    evaluated = {}
+    for signal in _SIGNALS_BY_COST:
+        if not full and (risk_score >= RISK_THRESHOLD
+                         or risk_score + remaining_weight < RISK_THRESHOLD):
+            break  # Decision can't change anymore
+        remaining_weight -= signal.weight
+        points = points_of(signal)
+        risk_score += points
+        evaluated[signal.name] = points
+    return evaluated
+
+
 def assess_risk(db: Session, username: str, ip_address: str,
                 device_fingerprint: str | None,
-                location_lat: float | None, location_lon: float | None) -> dict:
+                location_lat: float | None, location_lon: float | None,
+                context: RiskContext | None = None, full: bool = False) -> dict:
     """
     Evaluates login risk based on multiple signals.
     Returns dict with risk_score, risk_level, and individual signal results.
+    Pass a preloaded context to avoid loading it again.
+
+    Signals run cheapest-first and stop as soon as the remaining ones can't
+    change the risk level; skipped signals are reported with "skipped": True
+    and the score only covers the signals that ran. Pass full=True to
+    evaluate every signal.
+
+    With RISK_SCORER set to a registered scorer (see app.anomaly), that
+    scorer decides instead, as long as it returns a result.
     """
-    risk_score = 0
-    signals = {}
-
-    user = db.query(User).filter(User.username == username).first()
-
-    # 1. IP Reputation (High Impact: +90)
-    ip_flagged = is_ip_blacklisted(ip_address)
-    if ip_flagged:
-        risk_score += 90
-    signals["ip_reputation"] = {"flagged": ip_flagged, "points": 90 if ip_flagged else 0}
-
-    # 2. New Device (High Impact: +105)
-    new_device = is_new_device(db, user, device_fingerprint)
-    if new_device:
-        risk_score += 105
-    signals["new_device"] = {"flagged": new_device, "points": 105 if new_device else 0}
-
-    # 3. Impossible Travel (Critical Impact: +150)
-    impossible = is_impossible_travel(db, user, location_lat, location_lon)
-    if impossible:
-        risk_score += 150
-    signals["impossible_travel"] = {"flagged": impossible, "points": 150 if impossible else 0}
-
-    # 4. Atypical Login Time (Medium Impact: +30)
-    atypical = is_atypical_time(db, user)
-    if atypical:
-        risk_score += 30
-    signals["atypical_time"] = {"flagged": atypical, "points": 30 if atypical else 0}
+    if context is None:
+        context = load_risk_context(db, username, device_fingerprint)
+
+    event = RiskEvent(
+        ip_address=ip_address,
+        device_fingerprint=device_fingerprint,
+        location_lat=location_lat,
+        location_lon=location_lon,
+    )
+
+    scoring_started = perf_counter()
+    scorer = SCORERS.get(RISK_SCORER)
+    if scorer is not None:
+        result = scorer(event, context, full)
+        if result is not None:
+            metrics.scoring_seconds.observe(perf_counter() - scoring_started, RISK_SCORER)
+            return result
+
+    timings = metrics.current()
+    timed = metrics.time_signals(timings)
+
+    def points_of(signal: Signal) -> int:
+        if not timed:
+            return signal_points(signal, event, context)
+        started = perf_counter()
+        points = signal_points(signal, event, context)
+        metrics.record_signal(signal.name, perf_counter() - started, timings)
+        return points
+
+    evaluated = evaluate_signals(points_of, full)
+    risk_score = sum(evaluated.values())
+    signals = {
+        signal.name: {"flagged": evaluated[signal.name] > 0, "points": evaluated[signal.name]}
+        if signal.name in evaluated else {"flagged": None, "points": 0, "skipped": True}
+        for signal in SIGNALS
+    }
 
     risk_level = "high" if risk_score >= RISK_THRESHOLD else "low"
+    metrics.scoring_seconds.observe(perf_counter() - scoring_started, "rules")
 
     return {
         "risk_score": risk_score,
@@ -52,51 +266,58 @@ def assess_risk(db: Session, username: str, ip_address: str,
     }
 
 
+# --- Signals ---
+
+@register_signal("ip_reputation", weight=IP_REPUTATION_MAX_POINTS, cost=1)  # High Impact, per-range severity
+def ip_reputation_signal(event: RiskEvent, context: RiskContext) -> int:
+    return ip_severity(event.ip_address)
+
+
+@register_signal("new_device", weight=105, cost=2)  # High Impact
+def new_device_signal(event: RiskEvent, context: RiskContext) -> bool:
+    return is_new_device(context, event.device_fingerprint)
+
+
+@register_signal("impossible_travel", weight=150, cost=3)  # Critical Impact
+def impossible_travel_signal(event: RiskEvent, context: RiskContext) -> bool:
+    return is_impossible_travel(context, event.location_lat, event.location_lon)
+
+
+@register_signal("atypical_time", weight=30, cost=4)  # Medium Impact
+def atypical_time_signal(event: RiskEvent, context: RiskContext) -> bool:
+    return is_atypical_time(context)
+
+
 def is_ip_blacklisted(ip_address: str) -> bool:
     """Check if IP is in a known blacklist."""
-    # For demo: flag common suspicious patterns
-    # In production, you'd call an API like AbuseIPDB or maintain a local list
-    blacklisted_prefixes = ["192.168.99.", "10.0.99."]
-    return any(ip_address.startswith(prefix) for prefix in blacklisted_prefixes)
+    # Backed by the local CIDR blocklists in IP_BLOCKLIST_PATHS (see app.ip_reputation)
+    return ip_severity(ip_address) > 0
 
 
-def is_new_device(db: Session, user: User | None, device_fingerprint: str | None) -> bool:
+def is_new_device(context: RiskContext, device_fingerprint: str | None) -> bool:
     """Check if this device has been seen before for this user."""
-    if not user or not device_fingerprint:
+    if not context.user or not device_fingerprint:
         return True
 
-    trusted = db.query(TrustedDevice).filter(
-        TrustedDevice.user_id == user.id,
-        TrustedDevice.device_fingerprint == device_fingerprint,
-    ).first()
+    return not context.device_trusted
 
-    return trusted is None
 
-
-def is_impossible_travel(db: Session, user: User | None,
+def is_impossible_travel(context: RiskContext,
                          current_lat: float | None, current_lon: float | None) -> bool:
     """Detect if travel between last login and current login is physically impossible."""
-    if not user or current_lat is None or current_lon is None:
+    if not context.user or current_lat is None or current_lon is None:
         return False
 
-    last_login = db.query(LoginAttempt).filter(
-        LoginAttempt.user_id == user.id,
-        LoginAttempt.success == True,
-        LoginAttempt.location_lat.isnot(None),
-        LoginAttempt.location_lon.isnot(None),
-    ).order_by(LoginAttempt.timestamp.desc()).first()
-
-    if not last_login:
+    if not context.last_location:
         return False
 
-    distance_km = haversine(last_login.location_lat, last_login.location_lon,
-                            current_lat, current_lon)
+    last_lat, last_lon, last_time = context.last_location
+    distance_km = haversine(last_lat, last_lon, current_lat, current_lon)
 
     # Handle both timezone-aware and naive timestamps
-    last_time = last_login.timestamp
     if last_time.tzinfo is None:
         last_time = last_time.replace(tzinfo=timezone.utc)
-    time_diff = datetime.now(timezone.utc) - last_time
+    time_diff = context.now - last_time
     hours = time_diff.total_seconds() / 3600
 
     if hours <= 0:
@@ -115,26 +336,29 @@ def haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     return 6371 * 2 * asin(sqrt(a))
 
 
-def is_atypical_time(db: Session, user: User | None) -> bool:
+def is_atypical_time(context: RiskContext) -> bool:
     """Check if current login time is unusual for this user."""
-    if not user:
+    if not context.user:
         return False
 
-    thirty_days_ago = datetime.now(timezone.utc) - timedelta(days=30)
-    recent_logins = db.query(LoginAttempt).filter(
-        LoginAttempt.user_id == user.id,
-        LoginAttempt.success == True,
-        LoginAttempt.timestamp >= thirty_days_ago,
-    ).all()
-
-    if len(recent_logins) < 5:
+    total_weight = sum(context.hour_histogram)
+    if total_weight < 5:
         return False  # Not enough data to establish a pattern
 
-    login_hours = [attempt.timestamp.hour for attempt in recent_logins]
-    login_hours.sort()
-    median_hour = login_hours[len(login_hours) // 2]
+    # Weighted median of the decayed hour histogram
+    cumulative = 0.0
+    median_hour = 0
+    for hour, weight in enumerate(context.hour_histogram):
+        cumulative += weight
+        if cumulative > total_weight / 2:
+            median_hour = hour
+            break
 
-    current_hour = datetime.now(timezone.utc).hour
+    current_hour = context.now.hour
     hour_diff = min(abs(current_hour - median_hour), 24 - abs(current_hour - median_hour))
 
     return hour_diff > 3
+
+
+if RISK_SCORER == "anomaly":
+    from app import anomaly  # noqa: E402,F401  Registers the scorer; imports this module back
@@ -16,6 +16,18 @@ class OTPVerifyRequest(BaseModel):
     otp_code: str
 
 
+class ScoringEvent(BaseModel):
+    username: str
+    ip_address: str = "127.0.0.1"
+    device_fingerprint: Optional[str] = None
+    location_lat: Optional[float] = None
+    location_lon: Optional[float] = None
+
+
+class IntrospectRequest(BaseModel):
+    token: str
+
+
 class RegisterRequest(BaseModel):
     username: str
     email: str
@@ -32,9 +44,22 @@ class LoginResponse(BaseModel):
     require_otp: bool = False
     pending_auth_id: Optional[int] = None
     otp_code: Optional[str] = None
+    access_token: Optional[str] = None
 
 
 class AuthResponse(BaseModel):
     success: bool
     message: str
     access_token: Optional[str] = None
+
+
+class IntrospectResponse(BaseModel):
+    active: bool
+    sub: Optional[str] = None
+    username: Optional[str] = None
+    iss: Optional[str] = None
+    iat: Optional[int] = None
+    exp: Optional[int] = None
+    risk_level: Optional[str] = None
+    mfa: Optional[bool] = None
+    kid: Optional[str] = None
@@ -0,0 +1,222 @@
+"""
+In-memory serving of the built frontend (frontend/dist).
+
+Every file under the build directory is read once at startup, together with
+gzip and (if the brotli package is installed) brotli variants. A variant is
+kept only when it is smaller. Variants already on disk next to a file
+(index-abc123.js.br, .gz) are used as-is, as long as they are not older than
+the file. `python -m app.static_assets` writes them at build time with the
+slowest, smallest settings, so startup doesn't pay for compression.
+
+Each request is then a dict lookup plus a pick of encoding from
+Accept-Encoding. Responses carry a strong ETag per representation, and a
+matching If-None-Match gets a bodyless 304. Vite's content-hashed files
+(assets/index-BGpSfsPs.js) are cached as immutable for a year. Everything
+else, index.html and files copied from public/ included, is revalidated on
+each use.
+
+The app's site (frontend()) is built on first use, which the warm-up does
+before the worker reports ready, so importing the app reads nothing. Files
+are not re-read while the process runs; restart after a rebuild.
+"""
+import argparse
+import gzip
+import hashlib
+import mimetypes
+import re
+import threading
+from pathlib import Path
+
+from starlette.responses import Response
+
+from app.config import FRONTEND_DIST, STATIC_COMPRESS_MIN_BYTES
+
+try:
+    import brotli
+except ImportError:  # Optional: gzip only
+    brotli = None
+
+HASHED_NAME = re.compile(r"assets/[^/]+-[A-Za-z0-9_-]{8}\.[a-z0-9]+$")  # Vite's assets/[name]-[hash].[ext]
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+
+# Preferred first when the client accepts several
+ENCODINGS = ("br", "gzip")
+SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+
+def compress(data: bytes, encoding: str) -> bytes | None:
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=9, mtime=0)  # mtime=0 keeps the output reproducible
+    if encoding == "br" and brotli is not None:
+        return brotli.compress(data, quality=11)
+    return None
+
+
+def accepted_encodings(header: str) -> set[str]:
+    """Codings with a non-zero q value in an Accept-Encoding header."""
+    accepted = set()
+    for part in header.lower().split(","):
+        coding, _, params = part.partition(";")
+        coding = coding.strip()
+        name, _, value = params.partition("=")
+        if name.strip() == "q":
+            try:
+                if float(value) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if coding == "*":
+            accepted.update(ENCODINGS)
+        elif coding:
+            accepted.add(coding)
+    return accepted
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    # Weak comparison, as If-None-Match requires
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+class _Representation:
+    __slots__ = ("body", "etag", "headers", "not_modified_headers")
+
+    def __init__(self, body: bytes, etag: str, headers: dict):
+        self.body = body
+        self.etag = etag
+        self.headers = headers
+        self.not_modified_headers = {k: v for k, v in headers.items() if k != "content-encoding"}
+
+
+class StaticFile:
+    """One file and its encoded variants, with response headers precomputed."""
+
+    def __init__(self, path: Path, data: bytes, media_type: str, cache_control: str):
+        self.media_type = media_type
+        digest = hashlib.sha256(data).hexdigest()[:20]
+        variants = {None: data}
+        if len(data) >= STATIC_COMPRESS_MIN_BYTES and media_type.startswith(COMPRESSIBLE_TYPES):
+            for encoding in ENCODINGS:
+                encoded = _prebuilt(path, encoding) or compress(data, encoding)
+                if encoded is not None and len(encoded) < len(data):
+                    variants[encoding] = encoded
+        vary = len(variants) > 1
+        self.representations = {}
+        for encoding, body in variants.items():
+            etag = f'"{digest}-{encoding}"' if encoding else f'"{digest}"'
+            headers = {"etag": etag, "cache-control": cache_control}
+            if encoding:
+                headers["content-encoding"] = encoding
+            if vary:
+                headers["vary"] = "Accept-Encoding"
+            self.representations[encoding] = _Representation(body, etag, headers)
+
+    def pick(self, accept_encoding: str) -> _Representation:
+        if accept_encoding and len(self.representations) > 1:
+            accepted = accepted_encodings(accept_encoding)
+            for encoding in ENCODINGS:
+                if encoding in accepted and encoding in self.representations:
+                    return self.representations[encoding]
+        return self.representations[None]
+
+    def respond(self, request_headers) -> Response:
+        chosen = self.pick(request_headers.get("accept-encoding", ""))
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match and _etag_matches(if_none_match, chosen.etag):
+            return Response(status_code=304, headers=chosen.not_modified_headers)
+        return Response(chosen.body, headers=chosen.headers, media_type=self.media_type)
+
+
+def _prebuilt(path: Path, encoding: str) -> bytes | None:
+    variant = path.with_name(path.name + SUFFIXES[encoding])
+    try:
+        if variant.stat().st_mtime >= path.stat().st_mtime:
+            return variant.read_bytes()
+    except OSError:
+        pass
+    return None
+
+
+def _source_files(root: Path):
+    for path in sorted(root.rglob("*")):
+        if path.is_file() and path.suffix not in (".gz", ".br"):
+            yield path
+
+
+class StaticSite:
+    """A build directory held in memory, with index.html as the SPA fallback."""
+
+    def __init__(self, root: Path, index: str = "index.html"):
+        self.root = root
+        self.files = {}
+        for path in _source_files(root):
+            name = path.relative_to(root).as_posix()
+            media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+            if media_type.startswith("text/"):
+                media_type += "; charset=utf-8"
+            cache_control = IMMUTABLE if HASHED_NAME.match(name) else REVALIDATE
+            self.files[name] = StaticFile(path, path.read_bytes(), media_type, cache_control)
+        self.index = self.files.get(index)
+
+    def respond(self, name: str, request_headers, fallback: bool = False) -> Response:
+        """The file at `name`; with fallback, index.html for anything that isn't a file."""
+        static_file = self.files.get(name)
+        if static_file is None and fallback:
+            static_file = self.index
+        if static_file is None:
+            return Response("Not Found", status_code=404, media_type="text/plain")
+        return static_file.respond(request_headers)
+
+    def stats(self) -> dict:
+        return {
+            "files": len(self.files),
+            "bytes": sum(len(f.representations[None].body) for f in self.files.values()),
+            "encoded_bytes": {
+                encoding: sum(len(f.representations[encoding].body) for f in self.files.values()
+                              if encoding in f.representations)
+                for encoding in ENCODINGS
+            },
+            "brotli_available": brotli is not None,
+        }
+
+
+_frontend: StaticSite | None = None
+_frontend_lock = threading.Lock()
+
+
+def frontend() -> StaticSite:
+    """The site for FRONTEND_DIST, read (and compressed, unless precompressed) on first call."""
+    global _frontend
+    if _frontend is None:
+        with _frontend_lock:
+            if _frontend is None:
+                _frontend = StaticSite(FRONTEND_DIST)
+    return _frontend
+
+
+def precompress(root: Path) -> dict:
+    """Write .gz and .br variants next to every compressible file under root."""
+    written = dict.fromkeys(ENCODINGS, 0)
+    for path in _source_files(root):
+        media_type = mimetypes.guess_type(path.name)[0] or ""
+        data = path.read_bytes()
+        if len(data) < STATIC_COMPRESS_MIN_BYTES or not media_type.startswith(COMPRESSIBLE_TYPES):
+            continue
+        for encoding in ENCODINGS:
+            encoded = compress(data, encoding)
+            if encoded is not None and len(encoded) < len(data):
+                path.with_name(path.name + SUFFIXES[encoding]).write_bytes(encoded)
+                written[encoding] += 1
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompress a frontend build for app.static_assets")
+    parser.add_argument("root", nargs="?", default=str(FRONTEND_DIST))
+    args = parser.parse_args()
+    written = precompress(Path(args.root))
+    print(f"[static] wrote {written['gzip']} .gz and {written['br']} .br files under {args.root}"
+          + ("" if brotli else " (install brotli for .br)"))
@@ -0,0 +1,245 @@
+"""
+Sliding-window brute-force throttle.
+
+Every login is counted against its IP, its username and the (IP, username)
+pair before any risk assessment or bcrypt work happens. Once a key is over
+its limit, requests are rejected with a Retry-After instead of being hashed,
+so credential stuffing costs us a dictionary lookup rather than a CPU core.
+Successful logins refund their hit, so only failures add up over time and
+users behind a shared IP aren't punished for each other's logins.
+
+Counts use the sliding window counter approximation: the previous window's
+count is weighted by how much of it still overlaps the sliding window. That
+needs three numbers per key instead of a timestamp per attempt.
+
+THROTTLE_BACKEND selects where counters live:
+    memory  per worker, LRU-bounded by THROTTLE_MAX_KEYS (default)
+    file    a small SQLite file at THROTTLE_STORE_PATH shared by every
+            worker on the host, updated in one short transaction per check
+"""
+import math
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable
+
+from app.config import (
+    THROTTLE_ENABLED, THROTTLE_BACKEND, THROTTLE_STORE_PATH, THROTTLE_MAX_KEYS, THROTTLE_WINDOW_SECONDS,
+    THROTTLE_IP_LIMIT, THROTTLE_USERNAME_LIMIT, THROTTLE_PAIR_LIMIT,
+    THROTTLE_OTP_IP_LIMIT, THROTTLE_OTP_USER_LIMIT,
+)
+
+_EMPTY = (0, 0, 0)  # (window number, previous window count, current window count)
+
+
+class Throttled(Exception):
+    """Raised when a request is over its limit. Mapped to 429 in app.main."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"throttled for {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+def _advance(state: tuple, window: int) -> tuple:
+    """Roll a key's counters forward to the given window number."""
+    start, previous, current = state
+    if window == start:
+        return state
+    if window == start + 1:
+        return window, current, 0
+    return window, 0, 0
+
+
+def _retry_after(state: tuple, limit: int, now: float, window_seconds: float) -> float:
+    """Seconds until the weighted count for state drops below limit."""
+    _, previous, current = state
+    elapsed = now % window_seconds
+    if current >= limit:
+        # Wait for the next window, then for this window's weight to fade enough
+        wait = window_seconds - elapsed + window_seconds * (1 - limit / current)
+    else:
+        wait = window_seconds * (1 - (limit - current) / previous) - elapsed
+    return max(1.0, math.ceil(wait))
+
+
+class MemoryStore:
+    """Per-process counters, evicting the least recently used key when full."""
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+
+    def transact(self, keys: list[str], update: Callable[[dict], dict]):
+        with self._lock:
+            states = {key: self._states.get(key, _EMPTY) for key in keys}
+            for key, state in update(states).items():
+                self._states[key] = state
+                self._states.move_to_end(key)
+            while len(self._states) > self.max_keys:
+                self._states.popitem(last=False)
+
+    def size(self) -> int:
+        return len(self._states)
+
+
+class FileStore:
+    """Counters in a local SQLite file, so every worker on the host shares them."""
+
+    PRUNE_EVERY = 1000  # Transactions between sweeps of stale keys
+
+    def __init__(self, path: str, window_seconds: float):
+        self.path = path
+        self.window_seconds = window_seconds
+        self._local = threading.local()
+        self._transactions = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF")  # Losing counters in a crash is harmless
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS throttle "
+                "(key TEXT PRIMARY KEY, window INTEGER, previous INTEGER, current INTEGER)"
+            )
+            self._local.connection = connection
+        return connection
+
+    def transact(self, keys: list[str], update: Callable[[dict], dict]):
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            placeholders = ",".join("?" * len(keys))
+            rows = connection.execute(
+                f"SELECT key, window, previous, current FROM throttle WHERE key IN ({placeholders})", keys,
+            ).fetchall()
+            states = {key: _EMPTY for key in keys}
+            states.update({key: (window, previous, current) for key, window, previous, current in rows})
+
+            changed = update(states)
+            if changed:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO throttle (key, window, previous, current) VALUES (?, ?, ?, ?)",
+                    [(key, *state) for key, state in changed.items()],
+                )
+
+            self._transactions += 1
+            if self._transactions % self.PRUNE_EVERY == 0:
+                stale = int(time.time() // self.window_seconds) - 1
+                connection.execute("DELETE FROM throttle WHERE window < ?", (stale,))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def size(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM throttle").fetchone()[0]
+
+
+class SlidingWindowLimiter:
+    """Counts hits per key and refuses them once any key is over its limit."""
+
+    def __init__(self, name: str, store, window_seconds: float, enabled: bool = True):
+        self.name = name
+        self.store = store
+        self.window_seconds = window_seconds
+        self.enabled = enabled
+        self.allowed = 0
+        self.rejected = 0
+
+    def hit(self, limits: dict[str, int]) -> float | None:
+        """
+        Count one hit against every key in limits ({key: limit}). If any key
+        is already at its limit nothing is counted and the number of seconds
+        to wait is returned; otherwise returns None.
+        """
+        if not self.enabled:
+            return None
+
+        now = time.time()
+        window = int(now // self.window_seconds)
+        weight = 1 - (now % self.window_seconds) / self.window_seconds
+        retry_after = None
+
+        def update(states: dict) -> dict:
+            nonlocal retry_after
+            advanced = {key: _advance(state, window) for key, state in states.items()}
+            for key, limit in limits.items():
+                _, previous, current = advanced[key]
+                if limit <= 0:
+                    continue  # A limit of 0 disables that key
+                if previous * weight + current >= limit:
+                    wait = _retry_after(advanced[key], limit, now, self.window_seconds)
+                    retry_after = max(retry_after or 0, wait)
+            if retry_after is not None:
+                return {}
+            return {key: (start, previous, current + 1) for key, (start, previous, current) in advanced.items()}
+
+        self.store.transact(list(limits), update)
+        if retry_after is None:
+            self.allowed += 1
+        else:
+            self.rejected += 1
+        return retry_after
+
+    def refund(self, keys: list[str]):
+        """Take back a hit that turned out to be legitimate, e.g. a successful login."""
+        if not self.enabled:
+            return
+
+        window = int(time.time() // self.window_seconds)
+
+        def update(states: dict) -> dict:
+            refunded = {}
+            for key, state in states.items():
+                start, previous, current = _advance(state, window)
+                if current > 0:
+                    refunded[key] = (start, previous, current - 1)
+                elif previous > 0:
+                    refunded[key] = (start, previous - 1, current)
+            return refunded
+
+        self.store.transact(keys, update)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "backend": type(self.store).__name__,
+            "window_seconds": self.window_seconds,
+            "keys": self.store.size(),
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+        }
+
+
+def _build_store():
+    if THROTTLE_BACKEND == "file":
+        return FileStore(THROTTLE_STORE_PATH, THROTTLE_WINDOW_SECONDS)
+    return MemoryStore(THROTTLE_MAX_KEYS)
+
+
+_store = _build_store()
+logins = SlidingWindowLimiter("login", _store, THROTTLE_WINDOW_SECONDS, THROTTLE_ENABLED)
+otp = SlidingWindowLimiter("otp", _store, THROTTLE_WINDOW_SECONDS, THROTTLE_ENABLED)
+
+
+def login_limits(ip_address: str, username: str) -> dict[str, int]:
+    return {
+        f"login-ip:{ip_address}": THROTTLE_IP_LIMIT,
+        f"login-user:{username}": THROTTLE_USERNAME_LIMIT,
+        f"login-pair:{ip_address}|{username}": THROTTLE_PAIR_LIMIT,
+    }
+
+
+def otp_limits(ip_address: str, user_id: int | None) -> dict[str, int]:
+    limits = {f"otp-ip:{ip_address}": THROTTLE_OTP_IP_LIMIT}
+    if user_id is not None:
+        limits[f"otp-user:{user_id}"] = THROTTLE_OTP_USER_LIMIT
+    return limits
+
+
+def throttle_stats() -> dict:
+    return {limiter.name: limiter.stats() for limiter in (logins, otp)}
@@ -0,0 +1,137 @@
+"""
+Signed access tokens.
+
+Tokens are JWTs carrying the user, the risk level of the login and whether
+MFA was satisfied, so downstream services can authorize requests without
+calling back. Each token names its signing key in the `kid` header.
+
+Key rotation: JWT_KEYS lists "kid:secret" pairs. The first pair signs new
+tokens and every pair is accepted for verification, so a rotation is
+    1. add the new key at the front, keeping the old one after it,
+    2. remove the old key once ACCESS_TOKEN_TTL_SECONDS has passed.
+Without JWT_KEYS, SECRET_KEY signs under kid "default"; outside DEMO_MODE
+the app refuses to start while that is still the public default.
+
+Verification is local: keys are parsed once at import, and tokens that
+verified recently are kept in a bounded cache, so re-validating the same
+token is a dictionary lookup plus an expiry check.
+"""
+import hashlib
+import hmac
+import secrets
+import time
+
+from fastapi import Depends, HTTPException
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from jose import JWTError, jwk, jwt
+
+from app.cache import MISSING, TTLCache
+from app.config import (
+    DEFAULT_SECRET_KEY, DEMO_MODE, SECRET_KEY, JWT_KEYS, JWT_ALGORITHM, JWT_ISSUER, ACCESS_TOKEN_TTL_SECONDS, TOKEN_CACHE_MAX_ENTRIES,
+)
+
+
+class InvalidToken(Exception):
+    """Raised for tokens that are malformed, forged, expired or signed by an unknown key."""
+
+
+def parse_keys(value: str) -> dict:
+    """Parse "kid:secret,kid:secret" into an ordered {kid: secret} mapping."""
+    keys = {}
+    for pair in filter(None, (item.strip() for item in value.split(","))):
+        kid, separator, secret = pair.partition(":")
+        if not separator or not kid or not secret:
+            raise ValueError(f"JWT_KEYS entry must look like kid:secret, got {pair!r}")
+        keys[kid] = secret
+    return keys
+
+
+# Constructed once; jose would otherwise re-parse the secret on every call
+_secrets = parse_keys(JWT_KEYS) or {"default": SECRET_KEY}
+KEYS = {kid: jwk.construct(secret, JWT_ALGORITHM) for kid, secret in _secrets.items()}
+SIGNING_KID = next(iter(KEYS))
+
+# Cache expiry is only an upper bound; each hit still checks the token's own exp
+verified = TTLCache("verified_tokens", TOKEN_CACHE_MAX_ENTRIES, ACCESS_TOKEN_TTL_SECONDS)
+
+
+def check_signing_keys():
+    """Raise at startup if tokens would be signed with the public default SECRET_KEY outside DEMO_MODE."""
+    if not DEMO_MODE and _secrets == {"default": DEFAULT_SECRET_KEY}:
+        raise RuntimeError("Access tokens would be signed with the public default SECRET_KEY; "
+                           "set JWT_KEYS or SECRET_KEY")
+
+
+def issue_access_token(user_id: int, username: str, risk_level: str, mfa: bool) -> str:
+    now = int(time.time())
+    claims = {
+        "iss": JWT_ISSUER,
+        "sub": str(user_id),
+        "username": username,
+        "iat": now,
+        "exp": now + ACCESS_TOKEN_TTL_SECONDS,
+        "jti": secrets.token_urlsafe(12),
+        "risk_level": risk_level,
+        "mfa": mfa,
+        "amr": ["pwd", "otp"] if mfa else ["pwd"],
+    }
+    return jwt.encode(claims, KEYS[SIGNING_KID], algorithm=JWT_ALGORITHM, headers={"kid": SIGNING_KID})
+
+
+def _decode(token: str) -> dict:
+    try:
+        kid = jwt.get_unverified_header(token).get("kid")
+    except JWTError as exc:
+        raise InvalidToken(str(exc)) from exc
+
+    key = KEYS.get(kid)
+    if key is None:
+        raise InvalidToken(f"unknown key id {kid!r}")
+    try:
+        claims = jwt.decode(token, key, algorithms=[JWT_ALGORITHM], issuer=JWT_ISSUER)
+    except JWTError as exc:
+        raise InvalidToken(str(exc)) from exc
+    claims["kid"] = kid
+    return claims
+
+
+def verify_access_token(token: str) -> dict:
+    """Return the token's claims, or raise InvalidToken."""
+    # Keyed by digest so the cache doesn't hold bearer tokens in memory
+    cache_key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+    claims = verified.get(cache_key)
+    if claims is MISSING:
+        claims = _decode(token)
+        verified.set(cache_key, claims)
+    if claims["exp"] <= time.time():
+        verified.invalidate(cache_key)
+        raise InvalidToken("token has expired")
+    return dict(claims)
+
+
+_bearer = HTTPBearer(auto_error=False)
+
+
+def require_access_token(credentials: HTTPAuthorizationCredentials | None = Depends(_bearer)) -> dict:
+    """FastAPI dependency returning the caller's verified claims, or 401."""
+    if credentials is None:
+        raise HTTPException(status_code=401, detail="Missing bearer token",
+                            headers={"WWW-Authenticate": "Bearer"})
+    try:
+        return verify_access_token(credentials.credentials)
+    except InvalidToken as exc:
+        raise HTTPException(status_code=401, detail=str(exc),
+                            headers={"WWW-Authenticate": "Bearer"})
+
+
+def require_static_token(expected: str, setting: str):
+    """
+    FastAPI dependency for operator endpoints guarded by a fixed bearer
+    token from config. The endpoint answers 404 while the token is unset.
+    """
+    def dependency(credentials: HTTPAuthorizationCredentials | None = Depends(_bearer)):
+        if not expected:
+            raise HTTPException(status_code=404, detail=f"Disabled; set {setting} to enable it")
+        if credentials is None or not hmac.compare_digest(credentials.credentials.encode(), expected.encode()):
+            raise HTTPException(status_code=401, detail="Invalid token", headers={"WWW-Authenticate": "Bearer"})
+    return dependency
@@ -0,0 +1,184 @@
+"""
+Worker warm-up, run in the background after startup.
+
+A fresh uvicorn worker has an empty connection pool, empty caches, untouched
+memory-mapped indexes and a hashing pool with no workers, so its first
+logins pay for all of that. The warm-up does that work before the worker is
+reported ready at /health/ready:
+
+    database    opens WARMUP_DB_CONNECTIONS pooled connections and runs the
+                login queries once, so SQLAlchemy has compiled them
+    reference   looks up an address in the IP reputation and GeoIP indexes
+                (and the anomaly model when it is the scorer)
+    hot_users   loads the WARMUP_HOT_USERS users with the most successful
+                logins in the last WARMUP_HOT_USERS_HOURS into the caches
+    static      reads the frontend build into memory (app.static_assets)
+    bcrypt      starts every hashing pool worker and verifies a hash on each
+
+/health/live answers as soon as the app is serving. The database step
+retries until it succeeds; the other steps only record their errors,
+because the worker can serve without them. Preloaded cache entries expire
+after CACHE_TTL_SECONDS like any others; they cover the first minute or so
+of traffic, which is the part that used to be slow.
+"""
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import bcrypt
+from sqlalchemy import func, text
+
+from app import hashing, static_assets
+from app.config import (
+    CACHE_ENABLED, CACHE_MAX_ENTRIES, FRONTEND_DIST, RISK_SCORER, WARMUP_DB_CONNECTIONS, WARMUP_ENABLED,
+    WARMUP_HOT_USERS, WARMUP_HOT_USERS_HOURS,
+)
+from app.database import SessionLocal, engine
+from app.geoip import resolve_location
+from app.ip_reputation import ip_severity
+from app.models import LoginAttempt, TrustedDevice, UserProfile
+from app.risk_engine import _load_user_state, preload_user_states
+
+DB_RETRY_SECONDS = 1.0
+SAMPLE_ADDRESS = "192.0.2.1"  # TEST-NET-1; only the lookup path matters
+
+
+def warm_database() -> dict:
+    size = getattr(engine.pool, "size", lambda: WARMUP_DB_CONNECTIONS)()
+    connections = []
+    try:
+        # Held open together, so each is a separate pooled connection
+        for _ in range(max(1, min(WARMUP_DB_CONNECTIONS, size))):
+            connection = engine.connect()
+            connections.append(connection)
+            connection.execute(text("SELECT 1"))
+    finally:
+        for connection in connections:
+            connection.close()
+
+    db = SessionLocal()
+    try:
+        _load_user_state(db, "")
+        db.get(UserProfile, 0)
+        db.query(TrustedDevice.device_fingerprint).filter(TrustedDevice.user_id == 0).all()
+    finally:
+        db.close()
+    return {"connections": len(connections)}
+
+
+def warm_reference_data() -> dict:
+    ip_severity(SAMPLE_ADDRESS)
+    resolve_location(SAMPLE_ADDRESS)
+    if RISK_SCORER == "anomaly":
+        from app import anomaly
+        model = anomaly.model.get()
+        if model is not None:
+            model.lookup(0)
+    return {}
+
+
+def warm_hot_users() -> dict:
+    limit = min(WARMUP_HOT_USERS, CACHE_MAX_ENTRIES)
+    if not CACHE_ENABLED or limit <= 0:
+        return {"users": 0}
+
+    since = datetime.now(timezone.utc) - timedelta(hours=WARMUP_HOT_USERS_HOURS)
+    db = SessionLocal()
+    try:
+        user_ids = [user_id for (user_id,) in db.query(LoginAttempt.user_id).filter(
+            LoginAttempt.timestamp >= since, LoginAttempt.success == True, LoginAttempt.user_id.isnot(None),
+        ).group_by(LoginAttempt.user_id).order_by(func.count().desc()).limit(limit)]
+        return {"users": preload_user_states(db, user_ids)}
+    finally:
+        db.close()
+
+
+def warm_static() -> dict:
+    if not FRONTEND_DIST.exists():
+        return {"files": 0}
+    return {"files": len(static_assets.frontend().files)}
+
+
+def warm_bcrypt() -> dict:
+    hashing.pool.warm(bcrypt.hashpw(b"warm-up", bcrypt.gensalt(4)).decode())
+    return {"workers": max(hashing.pool.workers, 1)}
+
+
+STEPS = {
+    "database": warm_database,
+    "reference": warm_reference_data,
+    "hot_users": warm_hot_users,
+    "static": warm_static,
+    "bcrypt": warm_bcrypt,
+}
+
+
+class Warmer:
+    """Runs the warm-up steps on a daemon thread and reports readiness."""
+
+    def __init__(self, enabled: bool = WARMUP_ENABLED, steps: dict = STEPS):
+        self.enabled = enabled
+        self.steps = steps
+        self.results: dict[str, dict] = {}
+        self.seconds: float | None = None
+        self.last_error: str | None = None
+        self._ready = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        return self._ready.wait(timeout)
+
+    def _run_step(self, name: str, step) -> bool:
+        started = time.perf_counter()
+        try:
+            result = step()
+        except Exception as exc:
+            self.last_error = f"{name}: {type(exc).__name__}: {exc}"
+            print(f"[warmup] {self.last_error}")
+            return False
+        self.results[name] = {"seconds": round(time.perf_counter() - started, 4), **result}
+        return True
+
+    def _run(self):
+        started = time.perf_counter()
+        for name, step in self.steps.items():
+            # Not ready without a database; everything else is best effort
+            while not self._run_step(name, step) and name == "database":
+                if self._stop.wait(DB_RETRY_SECONDS):
+                    return
+            if self._stop.is_set():
+                return
+        self.seconds = round(time.perf_counter() - started, 4)
+        self._ready.set()
+
+    def start(self):
+        if not self.enabled:
+            self._ready.set()
+            return
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="warmup", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=30)
+            self._thread = None
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "ready": self.ready,
+            "seconds": self.seconds,
+            "steps": self.results,
+            "last_error": self.last_error,
+        }
+
+
+warmer = Warmer()
@@ -0,0 +1,76 @@
+"""
+Analytics queries from rollups against the same question asked of login_attempts.
+
+Generates a synthetic dataset (see benchmarks.synthetic_data), backfills
+risk_rollups from it, then times /analytics/summary over several ranges,
+in-process. For comparison it times a GROUP BY over login_attempts for the
+same ranges, which answers only part of the question (no signals, no OTP
+outcomes). Each number is the median of --repeat calls.
+
+    python -m benchmarks.analytics_rollups --users 20000 --attempts-per-user 20
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+
+def median_ms(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return round(sorted(samples)[len(samples) // 2], 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--attempts-per-user", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=11)
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp.name}/analytics.db"
+
+    from datetime import datetime, timedelta, timezone
+    from sqlalchemy import func, select
+    from starlette.testclient import TestClient
+    from app import analytics
+    from app.database import SessionLocal
+    from app.main import app
+    from app.migrate import upgrade_database
+    from app.models import LoginAttempt
+    from benchmarks.synthetic_data import generate
+
+    upgrade_database()
+    dataset = generate(args.users, args.attempts_per_user)
+    filled = analytics.backfill()
+    client = TestClient(app)
+    end = analytics.hour_of(datetime.now(timezone.utc)) + timedelta(hours=1)
+
+    results = {}
+    db = SessionLocal()
+    for days in (1, 7, 90):
+        start = end - timedelta(days=days)
+        params = {"start": start.isoformat(), "end": end.isoformat()}
+
+        def scan():
+            db.execute(select(LoginAttempt.risk_level, LoginAttempt.success, func.count()).where(
+                LoginAttempt.timestamp >= start, LoginAttempt.timestamp < end,
+            ).group_by(LoginAttempt.risk_level, LoginAttempt.success)).all()
+
+        results[f"{days}d"] = {
+            "summary_ms": median_ms(lambda: client.get("/analytics/summary", params=params), args.repeat),
+            "timeseries_ms": median_ms(lambda: client.get("/analytics/timeseries", params=params), args.repeat),
+            "login_attempts_scan_ms": median_ms(scan, args.repeat),
+        }
+    db.close()
+    print(json.dumps({"login_attempts": dataset["rows"]["login_attempts"], "backfill": filled,
+                      "queries": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
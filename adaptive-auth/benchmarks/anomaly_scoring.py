@@ -0,0 +1,169 @@
+"""
+Anomaly model versus the rule-based signals: decisions and scoring latency.
+
+Generates a synthetic dataset (see benchmarks.synthetic_data) plus one user
+who logs in at two times of day, trains app.anomaly on it, then scores the
+same events with both scorers:
+
+    legit          a user's recent successful login, repeated a week later
+                   from the same device, place and time of week
+    new_device     the same login from a device the user never used
+    remote_attack  an unknown device in another city at a random hour
+    local_attack   an unknown device near the user's home at a random hour
+
+For each scorer it reports the share of events that would be challenged
+(risk level "high") and the per-call scoring latency. For the model it also
+reports the share challenged at other ANOMALY_POINTS_PER_BIT settings, with
+and without ANOMALY_CHALLENGE_NEW_DEVICES. For the two-window
+user it reports, at four hours of the day, whether the rules' atypical_time
+signal flags and how many points the model's hour_of_week component adds.
+
+    python -m benchmarks.anomaly_scoring --users 5000 --events 2000
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+
+def percentile_us(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1e6, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--attempts-per-user", type=int, default=20)
+    parser.add_argument("--events", type=int, default=2000, help="events of each kind")
+    parser.add_argument("--seed", type=int, default=11)
+    parser.add_argument("--points-per-bit", type=float, nargs="+", default=[10, 15, 20, 25, 30])
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp.name}/anomaly.db"
+    os.environ["ANOMALY_MODEL_PATH"] = f"{tmp.name}/anomaly_model.bin"
+    os.environ["RISK_SCORER"] = "rules"  # assess_risk runs the rules; the model is called directly
+
+    from datetime import datetime, timedelta, timezone
+
+    import numpy as np
+    from app import anomaly
+    from app.database import SessionLocal
+    from app.migrate import upgrade_database
+    from app.models import LoginAttempt, User
+    from app.profiles import as_utc, rebuild_profile
+    from app.risk_engine import RISK_THRESHOLD, RiskEvent, assess_risk, is_atypical_time, load_risk_context
+    from benchmarks.synthetic_data import CITIES, generate
+
+    upgrade_database()
+    generate(args.users, args.attempts_per_user)
+    db = SessionLocal()
+
+    # A user with a morning and an evening window, 08:10 and 20:10 UTC
+    now = datetime.now(timezone.utc)
+    user = User(username="two-windows", email="two-windows@bench.local", password_hash="!")  # Never logs in
+    db.add(user)
+    db.flush()
+    for day in range(1, 61):
+        for hour in (8, 20):
+            moment = (now - timedelta(days=day)).replace(hour=hour, minute=10, second=0, microsecond=0)
+            db.add(LoginAttempt(user_id=user.id, timestamp=moment, ip_address="100.64.9.9",
+                                device_fingerprint="two-windows-phone", location_lat=51.51, location_lon=-0.13,
+                                risk_score=0, risk_level="low", success=True))
+    db.flush()
+    rebuild_profile(db, user.id)
+    db.commit()
+
+    trained = anomaly.train()
+
+    rng = np.random.default_rng(args.seed)
+    recent = db.query(LoginAttempt).filter(
+        LoginAttempt.success == True, LoginAttempt.device_fingerprint.like("device%"),
+    ).order_by(LoginAttempt.timestamp.desc()).limit(args.events * 3).all()
+    picks = [recent[i] for i in rng.choice(len(recent), size=min(args.events, len(recent)), replace=False)]
+    usernames = dict(db.query(User.id, User.username).filter(User.id.in_({row.user_id for row in picks})).all())
+
+    events = {"legit": [], "new_device": [], "remote_attack": [], "local_attack": []}
+    for row in picks:
+        username = usernames[row.user_id]
+        week_later = as_utc(row.timestamp) + timedelta(days=7)
+        events["legit"].append((username, week_later, RiskEvent(
+            row.ip_address, row.device_fingerprint, row.location_lat, row.location_lon)))
+        events["new_device"].append((username, week_later, RiskEvent(
+            row.ip_address, "new-phone", row.location_lat, row.location_lon)))
+        when = week_later.replace(hour=int(rng.integers(24)))
+        city = CITIES[int(rng.integers(len(CITIES)))]
+        events["remote_attack"].append((username, when, RiskEvent("100.64.200.1", "attacker", city[0], city[1])))
+        events["local_attack"].append((username, when, RiskEvent(
+            "100.64.200.1", "attacker", row.location_lat + 0.05, row.location_lon + 0.05)))
+
+    def points_at(result: dict, per_bit: float) -> int:
+        total = 0
+        for name, signal in result["signals"].items():
+            cap = anomaly.COMPONENT_CAPS.get(name)
+            if cap is None or signal["surprise_bits"] is None:
+                total += signal["points"]
+            else:
+                total += min(int(round(signal["surprise_bits"] * per_bit)), cap)
+        return total
+
+    results = {}
+    for kind, batch in events.items():
+        challenged = {"rules": 0, "anomaly": 0}
+        seconds = {"rules": [], "anomaly": []}
+        sweep = dict.fromkeys(args.points_per_bit, 0)
+        learned_devices = dict.fromkeys(args.points_per_bit, 0)
+        for username, when, event in batch:
+            context = load_risk_context(db, username, event.device_fingerprint, now=when)
+            started = time.perf_counter()
+            rules = assess_risk(db, username, event.ip_address, event.device_fingerprint,
+                                event.location_lat, event.location_lon, context=context)
+            middle = time.perf_counter()
+            model = anomaly.assess_anomaly(event, context)
+            seconds["rules"].append(middle - started)
+            seconds["anomaly"].append(time.perf_counter() - middle)
+            challenged["rules"] += rules["risk_level"] == "high"
+            challenged["anomaly"] += model["risk_level"] == "high"
+            anomaly.ANOMALY_CHALLENGE_NEW_DEVICES = False
+            learned = anomaly.assess_anomaly(event, context)
+            anomaly.ANOMALY_CHALLENGE_NEW_DEVICES = True
+            for per_bit in sweep:
+                sweep[per_bit] += points_at(model, per_bit) >= RISK_THRESHOLD
+                learned_devices[per_bit] += points_at(learned, per_bit) >= RISK_THRESHOLD
+        results[kind] = {
+            scorer: {
+                "challenged": round(challenged[scorer] / len(batch), 3),
+                "p50_us": percentile_us(seconds[scorer], 0.5),
+                "p99_us": percentile_us(seconds[scorer], 0.99),
+            }
+            for scorer in challenged
+        }
+        results[kind]["anomaly"]["challenged_at_points_per_bit"] = {
+            per_bit: round(count / len(batch), 3) for per_bit, count in sweep.items()}
+        results[kind]["anomaly"]["learned_devices_challenged_at_points_per_bit"] = {
+            per_bit: round(count / len(batch), 3) for per_bit, count in learned_devices.items()}
+
+    two_windows = {}
+    home = RiskEvent("100.64.9.9", "two-windows-phone", 51.51, -0.13)
+    for hour in (8, 14, 20, 3):
+        when = (now + timedelta(days=7)).replace(hour=hour, minute=10)
+        context = load_risk_context(db, "two-windows", home.device_fingerprint, now=when)
+        model = anomaly.assess_anomaly(home, context)
+        two_windows[f"{hour:02d}:10"] = {
+            "rules_atypical_time": is_atypical_time(context),
+            "model_hour_points": model["signals"]["hour_of_week"]["points"],
+        }
+    db.close()
+
+    print(json.dumps({
+        "training": trained | {"path": None},
+        "record_bytes": anomaly.RECORD.itemsize,
+        "events": results,
+        "two_windows_user": two_windows,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
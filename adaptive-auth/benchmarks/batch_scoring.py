@@ -0,0 +1,118 @@
+"""
+Batch scoring versus one assess_risk call per event.
+
+Seeds a throwaway database with users, profiles and trusted devices, then
+scores the same random events both ways at the same instant. Every event's
+score, level and per-signal breakdown must match exactly; any difference is
+printed and the script exits non-zero.
+
+    python -m benchmarks.batch_scoring --users 2000 --events 20000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+
+def seed(users: int, rng: random.Random):
+    from datetime import datetime, timedelta, timezone
+    from app.database import SessionLocal
+    from app.migrate import upgrade_database
+    from app.models import TrustedDevice, User, UserProfile
+
+    upgrade_database()
+    now = datetime.now(timezone.utc)
+    db = SessionLocal()
+    db.add_all(User(id=i, username=f"user{i}", email=f"user{i}@bench.local", password_hash="x")
+               for i in range(1, users + 1))
+    db.flush()
+    for i in range(1, users + 1):
+        if rng.random() < 0.9:
+            located = rng.random() < 0.8
+            db.add(UserProfile(
+                user_id=i,
+                hour_histogram=[rng.choice([0.0, 0.0, rng.uniform(0, 3)]) for _ in range(24)],
+                histogram_updated_at=now - timedelta(days=rng.uniform(0, 60)),
+                last_lat=rng.uniform(-60, 60) if located else None,
+                last_lon=rng.uniform(-180, 180) if located else None,
+                last_location_at=now - timedelta(hours=rng.uniform(-1, 48)) if located else None,
+                trusted_device_count=2,
+            ))
+        db.add_all(TrustedDevice(user_id=i, device_fingerprint=f"device{i}-{n}") for n in range(2))
+    db.commit()
+    db.close()
+
+
+def random_events(count: int, users: int, rng: random.Random) -> list:
+    from app.schemas import ScoringEvent
+
+    events = []
+    for _ in range(count):
+        user = rng.randint(1, int(users * 1.1))  # ~10% unknown usernames
+        located = rng.random() < 0.8
+        events.append(ScoringEvent(
+            username=f"user{user}",
+            ip_address=rng.choice(["203.0.113.7", "192.168.99.14", "10.0.99.3", "2001:db8::1",
+                                   f"198.51.100.{rng.randint(0, 255)}"]),
+            device_fingerprint=rng.choice([f"device{user}-0", f"device{user}-1", "unknown-device", None]),
+            location_lat=rng.uniform(-60, 60) if located else None,
+            location_lon=rng.uniform(-180, 180) if located else None,
+        ))
+    return events
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp.name}/batch.db"
+    os.environ["CACHE_ENABLED"] = "false"  # Measure the database path for the single-event side too
+
+    from datetime import datetime, timezone
+    from app.batch_scoring import score_events
+    from app.database import SessionLocal
+    from app.risk_engine import assess_risk, load_risk_context
+
+    rng = random.Random(args.seed)
+    seed(args.users, rng)
+    events = random_events(args.events, args.users, rng)
+    now = datetime.now(timezone.utc)
+    db = SessionLocal()
+
+    started = time.perf_counter()
+    single = []
+    for event in events:
+        context = load_risk_context(db, event.username, event.device_fingerprint, now=now)
+        single.append(assess_risk(db, event.username, event.ip_address, event.device_fingerprint,
+                                  event.location_lat, event.location_lon, context=context, full=True))
+    single_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    batch = score_events(db, events, now=now)
+    batch_seconds = time.perf_counter() - started
+    db.close()
+
+    mismatches = [(event, one, many) for event, one, many in zip(events, single, batch) if one != many]
+    for event, one, many in mismatches[:10]:
+        print(f"MISMATCH {event.model_dump()}\n  single: {one}\n  batch:  {many}")
+
+    print(json.dumps({
+        "events": len(events),
+        "mismatches": len(mismatches),
+        "high_risk": sum(result["risk_level"] == "high" for result in batch),
+        "single_seconds": round(single_seconds, 3),
+        "batch_seconds": round(batch_seconds, 3),
+        "speedup": round(single_seconds / batch_seconds, 1),
+    }))
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Login latency with the bcrypt pool saturated.
+
+Fires a burst of concurrent /auth/login requests at the app in-process and
+reports latency percentiles, once with bcrypt running in Starlette's
+threadpool (HASH_POOL_SIZE=0, the old behavior) and once on the dedicated
+hashing pool. Each mode runs in its own interpreter because the pool is
+configured at import time.
+
+    pip install -r benchmarks/requirements.txt
+    python -m benchmarks.bcrypt_saturation --requests 400 --concurrency 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run_burst(total: int, concurrency: int) -> dict:
+    import httpx
+    from app.main import app
+    from app.migrate import upgrade_database
+
+    upgrade_database()  # ASGITransport doesn't run the app's lifespan
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await client.post("/auth/register", json={
+            "username": "bench", "email": "bench@bench.local", "password": "bench-password",
+        })
+
+        gate = asyncio.Semaphore(concurrency)
+        latencies = []
+        statuses = {}
+
+        async def one_login():
+            async with gate:
+                started = time.perf_counter()
+                response = await client.post("/auth/login", json={
+                    "username": "bench", "password": "bench-password", "device_fingerprint": "bench",
+                })
+                latencies.append((time.perf_counter() - started) * 1000)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one_login() for _ in range(total)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "statuses": statuses,
+        "throughput_rps": round(total / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+    }
+
+
+def run_mode(label: str, env: dict, args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        child_env = {**os.environ, **env, "DATABASE_URL": f"sqlite:///{tmp}/bench.db"}
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bcrypt_saturation", "--child",
+             "--requests", str(args.requests), "--concurrency", str(args.concurrency)],
+            env=child_env, capture_output=True, text=True, check=True,
+        ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result["mode"] = label
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--pool-size", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--queue-limit", type=int, default=64)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(asyncio.run(run_burst(args.requests, args.concurrency))))
+        return
+
+    results = [
+        run_mode("threadpool (before)", {"HASH_POOL_SIZE": "0"}, args),
+        run_mode("hashing pool (after)", {
+            "HASH_POOL_SIZE": str(args.pool_size),
+            "HASH_POOL_QUEUE_LIMIT": str(args.queue_limit),
+        }, args),
+    ]
+    for result in results:
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+Cold start: import time, time to ready and time to the first fast login.
+
+Reports:
+
+    import_seconds            median wall time of `import app.main` in a fresh
+                              interpreter, over --imports runs
+    per worker mode           a uvicorn worker started against a copy of a
+                              synthetic database, once with WARMUP_ENABLED=false
+                              ("cold") and once with the warm-up ("warm"), for
+                              each --hash-pool-kind:
+        live_seconds          process start to /health/live answering
+        ready_seconds         process start to /health/ready answering 200
+        first_login_ms        the first login's latency
+        first_page_ms         the first GET / afterwards; without the warm-up it
+                              reads (and unless precompressed, compresses) the
+                              frontend build
+        warmup_steps          seconds per warm-up step, as /health/ready reports
+        first_pass_p50/p99_ms logins for --logins distinct recently active
+                              users, sent one at a time as soon as the worker
+                              would get traffic (live when cold, ready when warm)
+        steady_p50_ms         the same logins repeated straight afterwards
+        first_fast_seconds    process start to the end of the first login no
+                              slower than twice steady_p50_ms
+
+Users share a cheap bcrypt hash (see benchmarks.synthetic_data), so the
+numbers show the application's start-up cost rather than bcrypt's.
+
+    python -m benchmarks.cold_start --users 20000 --logins 200
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = "bench-password"  # benchmarks.synthetic_data.PASSWORD, without importing NumPy here
+
+
+def percentile_ms(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2) if ordered else 0.0
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def import_seconds(env: dict) -> float:
+    code = "import time; started = time.perf_counter(); import app.main; print(time.perf_counter() - started)"
+    output = subprocess.run([sys.executable, "-c", code], env=env, cwd=ROOT, capture_output=True, text=True,
+                            check=True)
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+def run_worker(env: dict, usernames: list[str], warm: bool) -> dict:
+    import httpx
+
+    port = free_port()
+    env = env | {"WARMUP_ENABLED": "true" if warm else "false"}
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        env=env, cwd=ROOT,
+    )
+    client = httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=30)
+
+    def wait_for(path: str) -> tuple[float, dict]:
+        while True:
+            try:
+                response = client.get(path)
+                if response.status_code == 200:
+                    return time.perf_counter() - started, response.json()
+            except httpx.TransportError:
+                pass
+            if process.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with {process.returncode}")
+            time.sleep(0.005)
+
+    def login(username: str) -> tuple[float, float]:
+        begun = time.perf_counter()
+        response = client.post("/auth/login", json={
+            "username": username, "password": PASSWORD, "device_fingerprint": f"device{username[4:]}-0",
+        })
+        response.raise_for_status()
+        return time.perf_counter() - begun, time.perf_counter() - started
+
+    try:
+        live, _ = wait_for("/health/live")
+        ready, readiness = wait_for("/health/ready")  # Immediate when cold
+        first_pass = [login(username) for username in usernames]
+        begun = time.perf_counter()
+        client.get("/").raise_for_status()
+        first_page = time.perf_counter() - begun
+        steady = [login(username)[0] for username in usernames]
+    finally:
+        client.close()
+        process.terminate()
+        process.wait(timeout=30)
+
+    steady_p50 = statistics.median(steady)
+    first_fast = next(finished for seconds, finished in first_pass if seconds <= 2 * steady_p50)
+    latencies = [seconds for seconds, _ in first_pass]
+    return {
+        "live_seconds": round(live, 3),
+        "ready_seconds": round(ready, 3),
+        "first_login_ms": round(latencies[0] * 1000, 2),
+        "first_page_ms": round(first_page * 1000, 2),
+        "warmup_steps": {name: step["seconds"] for name, step in readiness.get("steps", {}).items()},
+        "first_pass_p50_ms": percentile_ms(latencies, 0.5),
+        "first_pass_p99_ms": percentile_ms(latencies, 0.99),
+        "steady_p50_ms": round(steady_p50 * 1000, 2),
+        "first_fast_seconds": round(first_fast, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--attempts-per-user", type=int, default=20)
+    parser.add_argument("--logins", type=int, default=200, help="distinct users logged in per worker")
+    parser.add_argument("--imports", type=int, default=5)
+    parser.add_argument("--hash-pool-kind", nargs="+", default=["thread", "process"])
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    template = f"{tmp.name}/template.db"
+    env = os.environ | {
+        "DATABASE_URL": f"sqlite:///{template}",
+        "THROTTLE_ENABLED": "false",  # Every login comes from 127.0.0.1
+        "MAINTENANCE_ENABLED": "false",
+        "AUTO_MIGRATE": "false",  # synthetic_data migrates the template, as a pre-deploy step would
+        "PYTHONPATH": ROOT,
+    }
+    subprocess.run([sys.executable, "-m", "benchmarks.synthetic_data", "--users", str(args.users),
+                    "--attempts-per-user", str(args.attempts_per_user)],
+                   env=env, cwd=ROOT, check=True, capture_output=True)
+
+    code = (
+        "from datetime import datetime, timedelta, timezone\n"
+        "from app.database import SessionLocal\n"
+        "from app.models import LoginAttempt, User\n"
+        "since = datetime.now(timezone.utc) - timedelta(hours=24)\n"
+        "db = SessionLocal()\n"
+        "rows = db.query(User.username).join(LoginAttempt, LoginAttempt.user_id == User.id).filter(\n"
+        "    LoginAttempt.timestamp >= since, LoginAttempt.success == True).distinct().limit(%d).all()\n"
+        "print('\\n'.join(username for (username,) in rows))\n" % args.logins
+    )
+    usernames = subprocess.run([sys.executable, "-c", code], env=env, cwd=ROOT, check=True,
+                               capture_output=True, text=True).stdout.split()
+
+    imports = [import_seconds(env) for _ in range(args.imports)]
+
+    workers = {}
+    for kind in args.hash_pool_kind:
+        for warm in (False, True):
+            database = f"{tmp.name}/{kind}-{warm}.db"
+            shutil.copy(template, database)
+            worker_env = env | {"DATABASE_URL": f"sqlite:///{database}", "HASH_POOL_KIND": kind}
+            workers[f"{kind}_{'warm' if warm else 'cold'}"] = run_worker(worker_env, usernames, warm)
+
+    print(json.dumps({
+        "users": args.users,
+        "logins": len(usernames),
+        "import_seconds": round(statistics.median(imports), 3),
+        "workers": workers,
+        "cpu_count": os.cpu_count(),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Login-attempt export: throughput, memory, resumability and writer impact.
+
+Generates a synthetic dataset (see benchmarks.synthetic_data), then streams
+the whole login_attempts table through app.export while a background
+thread keeps inserting attempts, as /auth/login would. Reports:
+
+    rows_per_second        export throughput, with the writer running
+    peak_traced_mb         peak Python allocations during the export (tracemalloc)
+    writer_max_ms          slowest single-row insert commit during the export
+    resumed_rows_match     export stopped half-way and resumed from the last
+                           cursor yields the same rows as one pass
+
+    python -m benchmarks.export_stream --users 20000 --attempts-per-user 20
+"""
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--attempts-per-user", type=int, default=20)
+    parser.add_argument("--format", choices=["ndjson", "csv"], default="ndjson")
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp.name}/export.db"
+
+    from datetime import datetime, timedelta, timezone
+    from app import export
+    from app.database import SessionLocal
+    from app.migrate import upgrade_database
+    from app.models import LoginAttempt
+    from benchmarks.synthetic_data import generate
+
+    upgrade_database()
+    dataset = generate(args.users, args.attempts_per_user)
+    until = datetime.now(timezone.utc) - timedelta(seconds=1)
+
+    stop = threading.Event()
+    write_ms = []
+
+    def writer():
+        db = SessionLocal()
+        while not stop.is_set():
+            started = time.perf_counter()
+            db.add(LoginAttempt(user_id=1, ip_address="100.64.0.1", device_fingerprint="device1-0"))
+            db.commit()
+            write_ms.append((time.perf_counter() - started) * 1000)
+            time.sleep(0.002)
+        db.close()
+
+    def run_export() -> int:
+        size = 0
+        for chunk in export.ENCODERS[args.format](export.iter_attempts(until=until)):
+            size += len(chunk)
+        return size
+
+    thread = threading.Thread(target=writer, daemon=True)
+    thread.start()
+    started = time.perf_counter()
+    size = run_export()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    thread.join()
+
+    # Separately, as tracing slows everything down
+    tracemalloc.start()
+    run_export()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    # Stop half-way, then resume from the last cursor seen
+    whole = [attempt["id"] for attempt in export.iter_attempts(until=until)]
+    first = []
+    for attempt in export.iter_attempts(until=until):
+        first.append(attempt)
+        if len(first) == len(whole) // 2:
+            break
+    rest = [attempt["id"] for attempt in export.iter_attempts(cursor=first[-1]["cursor"], until=until)]
+
+    write_ms.sort()
+    print(json.dumps({
+        "rows": len(whole),
+        "generated_rows": dataset["rows"]["login_attempts"],
+        "bytes": size,
+        "seconds": round(elapsed, 2),
+        "rows_per_second": round(len(whole) / elapsed),
+        "peak_traced_mb": round(peak / 2**20, 1),
+        "concurrent_writes": len(write_ms),
+        "writer_p50_ms": round(write_ms[len(write_ms) // 2], 2) if write_ms else None,
+        "writer_max_ms": round(write_ms[-1], 2) if write_ms else None,
+        "resumed_rows_match": [attempt["id"] for attempt in first] + rest == whole,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Bulk provisioning: import throughput, write-lock impact and hashing scale-out.
+
+Reports, against a fresh SQLite database:
+
+    per_user_rows_per_second   what /auth/register does per user minus bcrypt:
+                               an existence query, an insert and a commit
+    bulk_rows_per_second       app.provisioning with pre-hashed passwords
+    writer_*_ms                single-row login-attempt commits made by a
+                               background thread during the bulk import, once
+                               with the default batches and pauses and once as
+                               a single transaction, for comparison
+    hashes_per_second          plaintext rows with 1 worker and with
+                               --workers processes
+
+    python -m benchmarks.provisioning --users 50000 --plaintext 64
+"""
+import argparse
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 2) if ordered else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=50000)
+    parser.add_argument("--per-user", type=int, default=2000, help="users for the per-user baseline")
+    parser.add_argument("--plaintext", type=int, default=64, help="users with plaintext passwords to hash")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp.name}/provision.db"
+
+    import bcrypt
+    from app import provisioning
+    from app.database import SessionLocal
+    from app.migrate import upgrade_database
+    from app.models import LoginAttempt, User
+
+    upgrade_database()
+    password_hash = bcrypt.hashpw(b"benchmark", bcrypt.gensalt(4)).decode()
+
+    def ndjson(prefix: str, count: int, **fields) -> io.StringIO:
+        lines = (json.dumps({"username": f"{prefix}{n}", "email": f"{prefix}{n}@example.com", **fields})
+                 for n in range(count))
+        return io.StringIO("\n".join(lines))
+
+    # Baseline: one user per transaction, as /auth/register does
+    db = SessionLocal()
+    started = time.perf_counter()
+    for n in range(args.per_user):
+        username = f"single{n}"
+        db.query(User.id).filter((User.username == username) | (User.email == f"{username}@example.com")).first()
+        db.add(User(username=username, email=f"{username}@example.com", password_hash=password_hash))
+        db.commit()
+    per_user = args.per_user / (time.perf_counter() - started)
+    db.close()
+
+    def import_with_writer(prefix: str, **options) -> tuple[dict, list[float]]:
+        stop = threading.Event()
+        write_ms = []
+
+        def writer():
+            session = SessionLocal()
+            while not stop.is_set():
+                begun = time.perf_counter()
+                session.add(LoginAttempt(user_id=1, ip_address="100.64.0.1", device_fingerprint="device1-0"))
+                session.commit()
+                write_ms.append((time.perf_counter() - begun) * 1000)
+                time.sleep(0.005)
+            session.close()
+
+        thread = threading.Thread(target=writer, daemon=True)
+        thread.start()
+        report = provisioning.provision(ndjson(prefix, args.users, password_hash=password_hash), "ndjson",
+                                        workers=1, **options)
+        stop.set()
+        thread.join()
+        return report, write_ms
+
+    batched, batched_ms = import_with_writer("bulk")
+    single, single_ms = import_with_writer("whole", chunk_size=args.users, insert_batch=args.users,
+                                         pause_seconds=0)
+
+    hashing = {}
+    for workers in sorted({1, args.workers}):
+        report = provisioning.provision(ndjson(f"plain{workers}-", args.plaintext, password="correct horse"),
+                                        "ndjson", workers=workers)
+        hashing[workers] = round(report["hashed"] / report["seconds"], 2)
+
+    print(json.dumps({
+        "users": args.users,
+        "per_user_rows_per_second": round(per_user),
+        "bulk_rows_per_second": round(batched["created"] / batched["seconds"]),
+        "bulk_failed": batched["failed"],
+        "writer_batched_p50_ms": percentile(batched_ms, 0.5),
+        "writer_batched_p99_ms": percentile(batched_ms, 0.99),
+        "writer_batched_max_ms": percentile(batched_ms, 1.0),
+        "single_transaction_rows_per_second": round(single["created"] / single["seconds"]),
+        "writer_single_transaction_max_ms": percentile(single_ms, 1.0),
+        "hashes_per_second": hashing,
+        "cpu_count": os.cpu_count(),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
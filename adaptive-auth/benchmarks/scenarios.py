@@ -0,0 +1,267 @@
+"""
+Load scenarios against the app in-process, compared with a JSON baseline.
+
+Generates a synthetic dataset (see benchmarks.synthetic_data) in a
+throwaway database, then drives the ASGI app through httpx without a
+network. Four scenarios run:
+
+    assess_risk          load_risk_context + assess_risk called directly
+    low_risk             password logins from a trusted device
+    high_risk            logins from a new device, each followed by verify-otp
+    credential_stuffing  wrong passwords for many usernames from one IP
+
+Each endpoint in each scenario reports throughput and p50/p95/p99
+latency, each the median over --rounds runs to damp noise. With --compare, any p95 that grew or throughput that fell by
+more than --tolerance against the baseline is listed and the exit status
+is 1. Numbers are only comparable on the same machine: refresh the
+baseline there with --update-baseline.
+
+    pip install -r benchmarks/requirements.txt
+    python -m benchmarks.scenarios --compare benchmarks/baseline.json
+    python -m benchmarks.scenarios --users 1000000 --requests 5000 --output results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+ATTACKER_NETWORK = "203.0.113."  # One address per round, so earlier rounds' throttling doesn't carry over
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Recorder:
+    """Latencies and outcomes for one endpoint within a scenario."""
+
+    def __init__(self):
+        self.latencies = []
+        self.outcomes = {}
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def add(self, seconds: float, outcome: str = "ok"):
+        self.latencies.append(seconds * 1000)
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.started
+
+    def report(self) -> dict:
+        return {
+            "requests": len(self.latencies),
+            "outcomes": dict(sorted(self.outcomes.items())),
+            "throughput_rps": round(len(self.latencies) / self.elapsed, 1) if self.elapsed else None,
+            "p50_ms": round(percentile(self.latencies, 50), 3),
+            "p95_ms": round(percentile(self.latencies, 95), 3),
+            "p99_ms": round(percentile(self.latencies, 99), 3),
+        }
+
+
+def bench_assess_risk(user_ids: list[int], calls: int, rng: random.Random) -> dict:
+    from app.database import SessionLocal
+    from app.risk_engine import assess_risk, load_risk_context
+    from benchmarks.synthetic_data import device, username
+
+    recorder = Recorder()
+    db = SessionLocal()
+    try:
+        for _ in range(calls):
+            user_id = rng.choice(user_ids)
+            fingerprint = device(user_id) if rng.random() < 0.8 else "unknown-device"
+            started = time.perf_counter()
+            context = load_risk_context(db, username(user_id), fingerprint)
+            assess_risk(db, username(user_id), "100.64.0.1", fingerprint, 40.7, -74.0, context=context)
+            recorder.add(time.perf_counter() - started)
+    finally:
+        db.close()
+    recorder.finish()
+    return recorder.report()
+
+
+async def run_concurrently(count: int, concurrency: int, one):
+    gate = asyncio.Semaphore(concurrency)
+
+    async def limited(n: int):
+        async with gate:
+            await one(n)
+
+    await asyncio.gather(*(limited(n) for n in range(count)))
+
+
+async def bench_http(user_ids: list[int], requests: int, concurrency: int, rng: random.Random,
+                     round_number: int = 0) -> dict:
+    import httpx
+    from app.main import app
+    from benchmarks.synthetic_data import PASSWORD, device, username
+
+    async def timed(client, recorder: Recorder, path: str, body: dict) -> dict:
+        started = time.perf_counter()
+        response = await client.post(path, json=body)
+        elapsed = time.perf_counter() - started
+        body = response.json()
+        if response.status_code != 200:
+            outcome = str(response.status_code)  # 429 throttled, 503 hashing pool full
+        elif body.get("require_otp"):
+            outcome = "otp_required"
+        else:
+            outcome = "success" if body.get("success") else "failed"
+        recorder.add(elapsed, outcome)
+        return body
+
+    results = {}
+    user_transport = httpx.ASGITransport(app=app, client=("100.64.0.1", 40000))
+    attacker_transport = httpx.ASGITransport(app=app, client=(f"{ATTACKER_NETWORK}{50 + round_number}", 40000))
+    async with httpx.AsyncClient(transport=user_transport, base_url="http://bench") as client, \
+            httpx.AsyncClient(transport=attacker_transport, base_url="http://bench") as attacker:
+
+        login = Recorder()
+
+        async def low_risk(n: int):
+            user_id = rng.choice(user_ids)
+            await timed(client, login, "/auth/login", {
+                "username": username(user_id), "password": PASSWORD, "device_fingerprint": device(user_id),
+            })
+
+        await run_concurrently(requests, concurrency, low_risk)
+        login.finish()
+        results["low_risk/login"] = login.report()
+
+        login, verify = Recorder(), Recorder()
+
+        async def high_risk(n: int):
+            user_id = rng.choice(user_ids)
+            body = await timed(client, login, "/auth/login", {
+                "username": username(user_id), "password": PASSWORD, "device_fingerprint": f"bench-new-{round_number}-{n}",
+            })
+            if body.get("require_otp"):
+                await timed(client, verify, "/auth/verify-otp", {
+                    "pending_auth_id": body["pending_auth_id"], "otp_code": body["otp_code"],
+                })
+
+        await run_concurrently(requests, concurrency, high_risk)
+        login.finish()
+        verify.finish()
+        results["high_risk/login"] = login.report()
+        results["high_risk/verify_otp"] = verify.report()
+
+        login = Recorder()
+        top = max(user_ids)
+
+        async def credential_stuffing(n: int):
+            # Mostly real usernames, some that don't exist
+            await timed(attacker, login, "/auth/login", {
+                "username": username(rng.randint(1, int(top * 1.2))), "password": f"guess-{n}",
+            })
+
+        await run_concurrently(requests, concurrency, credential_stuffing)
+        login.finish()
+        results["credential_stuffing/login"] = login.report()
+    return results
+
+
+def median_of(rounds: list[dict]) -> dict:
+    """Per endpoint, the median of each number across rounds."""
+    merged = {}
+    for name, first in rounds[0].items():
+        merged[name] = dict(first)
+        for field in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms"):
+            values = sorted(result[name][field] for result in rounds)
+            merged[name][field] = values[len(values) // 2]
+    return merged
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Human-readable regressions of results against baseline."""
+    regressions = []
+    for name, base in baseline.get("results", {}).items():
+        current = results.get(name)
+        if current is None:
+            regressions.append(f"{name}: missing from this run")
+            continue
+        if base["p95_ms"] and current["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {base['p95_ms']}ms -> {current['p95_ms']}ms")
+        if base["throughput_rps"] and current["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {base['throughput_rps']}/s -> {current['throughput_rps']}/s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--attempts-per-user", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=400, help="requests per HTTP scenario")
+    parser.add_argument("--assess-calls", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--output", help="write the results JSON here")
+    parser.add_argument("--compare", nargs="?", const=BASELINE_PATH, help="baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.3)
+    parser.add_argument("--update-baseline", action="store_true", help=f"overwrite {BASELINE_PATH}")
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp.name}/scenarios.db"
+    os.environ.setdefault("DEMO_MODE", "true")        # verify-otp needs the code echoed back
+    os.environ.setdefault("OTP_TRANSPORT", "memory")  # Don't print thousands of codes
+
+    from app.migrate import upgrade_database
+    from benchmarks.synthetic_data import generate
+
+    upgrade_database()  # ASGITransport doesn't run the app's lifespan
+    dataset = generate(args.users, args.attempts_per_user, seed=args.seed)
+    user_ids = list(range(dataset["first_user_id"], dataset["last_user_id"] + 1))
+    rng = random.Random(args.seed)
+
+    rounds = []
+    for round_number in range(args.rounds):
+        results = {"assess_risk": bench_assess_risk(user_ids, args.assess_calls, rng)}
+        results.update(asyncio.run(bench_http(user_ids, args.requests, args.concurrency, rng, round_number)))
+        rounds.append(results)
+    results = median_of(rounds)
+
+    from app import otp_delivery
+    otp_delivery.dispatcher.stop()
+
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "dataset": {"users": args.users, "attempts_per_user": args.attempts_per_user, **dataset["rows"]},
+        "settings": {"requests": args.requests, "assess_calls": args.assess_calls,
+                     "concurrency": args.concurrency, "rounds": args.rounds, "seed": args.seed},
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    if args.update_baseline:
+        with open(BASELINE_PATH, "w") as f:
+            f.write(output + "\n")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Frontend serving: the in-memory StaticSite against StaticFiles/FileResponse.
+
+Drives a bare Starlette app in-process for each approach and reports
+requests per second and bytes on the wire for an SPA navigation (index.html), a
+hashed asset fetched fresh with gzip accepted, and the same asset
+revalidated with If-None-Match.
+
+    python -m benchmarks.static_serving --requests 2000
+"""
+import argparse
+import asyncio
+import json
+import time
+from pathlib import Path
+
+FRONTEND_DIST = Path(__file__).parent.parent / "frontend" / "dist"
+
+
+def disk_app():
+    """The previous setup: StaticFiles for /assets, FileResponse(index.html) for everything else."""
+    from starlette.applications import Starlette
+    from starlette.responses import FileResponse
+    from starlette.routing import Mount, Route
+    from starlette.staticfiles import StaticFiles
+
+    async def index(request):
+        return FileResponse(FRONTEND_DIST / "index.html")
+
+    return Starlette(routes=[
+        Mount("/assets", StaticFiles(directory=FRONTEND_DIST / "assets")),
+        Route("/{path:path}", index),
+    ])
+
+
+def memory_app():
+    from starlette.applications import Starlette
+    from starlette.routing import Route
+    from app.static_assets import StaticSite
+
+    site = StaticSite(FRONTEND_DIST)
+
+    async def asset(request):
+        return site.respond(f"assets/{request.path_params['path']}", request.headers)
+
+    async def index(request):
+        return site.respond(request.path_params["path"], request.headers, fallback=True)
+
+    return Starlette(routes=[Route("/assets/{path:path}", asset), Route("/{path:path}", index)])
+
+
+async def measure(app, path: str, headers: dict, requests: int) -> dict:
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        first = await client.get(path, headers=headers)
+        if headers.pop("if-none-match", None) is not None:
+            headers["if-none-match"] = first.headers["etag"]
+        sent = 0
+        started = time.perf_counter()
+        for _ in range(requests):
+            # Raw bytes, so the client doesn't spend the benchmark decompressing
+            async with client.stream("GET", path, headers=headers) as response:
+                async for chunk in response.aiter_raw():
+                    sent += len(chunk)
+        elapsed = time.perf_counter() - started
+    return {"status": response.status_code, "requests_per_second": round(requests / elapsed),
+            "bytes_per_response": sent // requests}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    asset = "/assets/" + next(path.name for path in (FRONTEND_DIST / "assets").glob("*.js"))
+    cases = {
+        "spa_navigation": ("/login", {}),
+        "asset": (asset, {"accept-encoding": "gzip, deflate, br"}),
+        "asset_revalidated": (asset, {"accept-encoding": "gzip, deflate, br", "if-none-match": ""}),
+    }
+    apps = {"disk": disk_app(), "memory": memory_app()}
+    results = {}
+    for case, (path, headers) in cases.items():
+        results[case] = {name: asyncio.run(measure(app, path, dict(headers), args.requests))
+                         for name, app in apps.items()}
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+Bulk synthetic dataset: users, trusted devices, login history and profiles.
+
+Every user gets a home city, a habitual login hour, one to three trusted
+devices and a history of attempts spread over the last --days days. Most
+attempts are successful logins from home at around the habitual local hour.
+Some are failed passwords, and a small share are trips: another city and an
+unrecognised device. Profiles are computed from the generated history with
+the same decayed-histogram arithmetic as profiles.apply_login, so the risk
+signals see consistent state.
+
+Rows are produced with NumPy a chunk of users at a time and written with
+executemany inserts, one transaction per chunk, so memory stays flat.
+
+All users share one password, hashed once with --bcrypt-rounds (4 by
+default). The benchmarks then measure the application rather than bcrypt.
+Usernames are user<N> and trusted devices device<N>-<k>; device<N>-0
+always exists.
+
+    python -m benchmarks.synthetic_data --users 1000000 --attempts-per-user 20
+"""
+import argparse
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+PASSWORD = "bench-password"
+
+# (latitude, longitude, UTC offset in hours)
+CITIES = [
+    (40.71, -74.01, -5), (41.88, -87.63, -6), (43.04, -87.91, -6), (34.05, -118.24, -8),
+    (47.61, -122.33, -8), (29.76, -95.37, -6), (25.76, -80.19, -5), (43.65, -79.38, -5),
+    (19.43, -99.13, -6), (-23.55, -46.63, -3), (51.51, -0.13, 0), (48.86, 2.35, 1),
+    (52.52, 13.40, 1), (40.42, -3.70, 1), (41.90, 12.50, 1), (55.76, 37.62, 3),
+    (28.61, 77.21, 5), (19.08, 72.88, 5), (1.35, 103.82, 8), (35.68, 139.69, 9),
+    (37.57, 126.98, 9), (31.23, 121.47, 8), (-33.87, 151.21, 10), (-26.20, 28.05, 2),
+]
+CITY_WEIGHTS = np.array([8, 5, 2, 6, 3, 3, 3, 3, 4, 4, 6, 4, 3, 3, 2, 2, 4, 4, 2, 5, 2, 4, 2, 2], dtype=float)
+CITY_WEIGHTS /= CITY_WEIGHTS.sum()
+
+FAILURE_RATE = 0.06
+TRAVEL_RATE = 0.03
+HALF_LIFE_SECONDS = 14 * 86400  # profiles.PROFILE_HALF_LIFE_DAYS
+
+
+def username(user_id: int) -> str:
+    return f"user{user_id}"
+
+
+def device(user_id: int, index: int = 0) -> str:
+    return f"device{user_id}-{index}"
+
+
+def home_ip(user_id: int) -> str:
+    # Shared address space (100.64.0.0/10), so no blocklist entry matches
+    return f"100.{64 + (user_id >> 16) % 64}.{(user_id >> 8) & 255}.{user_id & 255}"
+
+
+def _habitual_hours(rng: np.random.Generator, count: int) -> np.ndarray:
+    """Local hour each user usually logs in: mostly office hours, some evenings, a few night owls."""
+    kind = rng.choice(3, size=count, p=[0.7, 0.22, 0.08])
+    return np.select([kind == 0, kind == 1], [rng.normal(12.5, 2.0, count), rng.normal(21.0, 1.5, count)],
+                     rng.normal(2.0, 1.5, count))
+
+
+def generate_chunk(rng: np.random.Generator, first_id: int, count: int, attempts_per_user: int,
+                   days: int, now: datetime, password_hash: str) -> dict:
+    """Rows for users first_id .. first_id + count - 1, keyed by table name."""
+    ids = np.arange(first_id, first_id + count)
+    city = rng.choice(len(CITIES), size=count, p=CITY_WEIGHTS)
+    lat0 = np.array([CITIES[c][0] for c in city]) + rng.normal(0, 0.1, count)
+    lon0 = np.array([CITIES[c][1] for c in city]) + rng.normal(0, 0.1, count)
+    offset = np.array([CITIES[c][2] for c in city])
+    habit = _habitual_hours(rng, count)
+    device_count = rng.integers(1, 4, count)
+    start_ts = now.timestamp() - days * 86400
+
+    # Attempts: per-user counts vary around the mean
+    per_user = np.maximum(1, rng.poisson(attempts_per_user, count))
+    owner = np.repeat(np.arange(count), per_user)
+    total = len(owner)
+    day = rng.integers(0, days, total)
+    local_hour = np.mod(np.round(habit[owner] + rng.normal(0, 1.5, total)), 24)
+    utc_hour = np.mod(local_hour - offset[owner], 24)
+    ts = start_ts + day * 86400 + utc_hour * 3600 + rng.uniform(0, 3600, total)
+    ts = np.minimum(ts, now.timestamp() - 60)
+
+    travel = rng.random(total) < TRAVEL_RATE
+    trip_city = rng.choice(len(CITIES), size=total, p=CITY_WEIGHTS)
+    lat = np.where(travel, [CITIES[c][0] for c in trip_city], lat0[owner] + rng.normal(0, 0.02, total))
+    lon = np.where(travel, [CITIES[c][1] for c in trip_city], lon0[owner] + rng.normal(0, 0.02, total))
+    lat, lon = np.round(lat, 4), np.round(lon, 4)
+    success = rng.random(total) >= FAILURE_RATE
+    device_index = rng.integers(0, 3, total) % device_count[owner]
+
+    # Profiles, folded exactly as apply_login would in timestamp order
+    last_success = np.full(count, -np.inf)
+    np.maximum.at(last_success, owner[success], ts[success])
+    weights = np.where(success, 0.5 ** ((last_success[owner] - ts) / HALF_LIFE_SECONDS), 0.0)
+    histograms = np.zeros((count, 24))
+    np.add.at(histograms, (owner, (ts // 3600 % 24).astype(int)), weights)
+    order = np.lexsort((ts, owner))  # Per user, oldest first
+    successful = order[success[order]]
+    is_last = np.append(owner[successful][1:] != owner[successful][:-1], True)
+    last_index = np.full(count, -1)
+    last_index[owner[successful][is_last]] = successful[is_last]
+
+    def when(seconds: float) -> datetime:
+        return datetime.fromtimestamp(seconds, timezone.utc)
+
+    users, devices, profiles = [], [], []
+    first_seen = when(start_ts - 86400)
+    for n, user_id in enumerate(ids.tolist()):
+        latest = last_index[n]
+        users.append({"id": user_id, "username": username(user_id), "email": f"{username(user_id)}@bench.local",
+                      "password_hash": password_hash, "created_at": first_seen,
+                      "last_login": when(ts[latest]) if latest >= 0 else None})
+        devices.extend({"user_id": user_id, "device_fingerprint": device(user_id, k), "first_seen": first_seen,
+                        "last_seen": first_seen, "trust_level": "verified"} for k in range(device_count[n]))
+        profiles.append({
+            "user_id": user_id,
+            "hour_histogram": [round(weight, 6) for weight in histograms[n].tolist()],
+            "histogram_updated_at": when(ts[latest]) if latest >= 0 else None,
+            "last_lat": float(lat[latest]) if latest >= 0 else None,
+            "last_lon": float(lon[latest]) if latest >= 0 else None,
+            "last_location_at": when(ts[latest]) if latest >= 0 else None,
+            "last_login_at": when(ts[latest]) if latest >= 0 else None,
+            "trusted_device_count": int(device_count[n]),
+        })
+
+    attempts = []
+    for i in order.tolist():
+        user_id = int(ids[owner[i]])
+        ok = bool(success[i])
+        trip = bool(travel[i])
+        attempts.append({
+            "user_id": user_id,
+            "timestamp": when(ts[i]),
+            "ip_address": f"198.51.100.{i % 256}" if trip else home_ip(user_id),
+            "device_fingerprint": f"travel{user_id}-{i}" if trip else device(user_id, int(device_index[i])),
+            "location_lat": float(lat[i]),
+            "location_lon": float(lon[i]),
+            "risk_score": 255 if trip else 0,
+            "risk_level": "high" if trip else "low",
+            "success": ok,
+            "failure_reason": None if ok else "invalid_credentials",
+        })
+    return {"users": users, "trusted_devices": devices, "user_profiles": profiles, "login_attempts": attempts}
+
+
+def generate(users: int, attempts_per_user: int = 20, days: int = 90, seed: int = 7,
+             chunk_users: int = 5000, bcrypt_rounds: int = 4) -> dict:
+    """Append `users` synthetic users after the current highest user id. Returns row counts and timing."""
+    import bcrypt
+    from sqlalchemy import func, insert, select
+    from app.database import engine
+    from app.models import LoginAttempt, TrustedDevice, User, UserProfile
+
+    tables = {"users": User.__table__, "trusted_devices": TrustedDevice.__table__,
+              "user_profiles": UserProfile.__table__, "login_attempts": LoginAttempt.__table__}
+    password_hash = bcrypt.hashpw(PASSWORD.encode(), bcrypt.gensalt(rounds=bcrypt_rounds)).decode()
+    rng = np.random.default_rng(seed)
+    now = datetime.now(timezone.utc)
+    counts = dict.fromkeys(tables, 0)
+
+    with engine.connect() as conn:
+        first_id = (conn.execute(select(func.max(User.id))).scalar() or 0) + 1
+
+    started = time.perf_counter()
+    for offset in range(0, users, chunk_users):
+        rows = generate_chunk(rng, first_id + offset, min(chunk_users, users - offset),
+                              attempts_per_user, days, now, password_hash)
+        with engine.begin() as conn:
+            for name, table in tables.items():  # Parents before children
+                if rows[name]:
+                    conn.execute(insert(table), rows[name])
+                    counts[name] += len(rows[name])
+    elapsed = time.perf_counter() - started
+
+    return {
+        "first_user_id": first_id,
+        "last_user_id": first_id + users - 1,
+        "rows": counts,
+        "seconds": round(elapsed, 1),
+        "rows_per_second": round(sum(counts.values()) / elapsed) if elapsed else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--attempts-per-user", type=int, default=20)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--chunk-users", type=int, default=5000)
+    parser.add_argument("--bcrypt-rounds", type=int, default=4)
+    parser.add_argument("--database-url", help="defaults to DATABASE_URL")
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+
+    from app.migrate import upgrade_database
+    upgrade_database()
+    print(json.dumps(generate(args.users, args.attempts_per_user, args.days, args.seed,
+                              args.chunk_users, args.bcrypt_rounds)))
+
+
+if __name__ == "__main__":
+    main()
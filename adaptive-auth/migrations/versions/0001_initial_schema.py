@@ -0,0 +1,111 @@
+"""Initial schema
+
+Matches what Base.metadata.create_all produced before migrations existed.
+Tables that already exist are left alone, so databases created by
+create_all can be upgraded in place without stamping.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if "users" not in existing:
+        op.create_table(
+            "users",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("username", sa.String(), nullable=False),
+            sa.Column("email", sa.String(), nullable=False),
+            sa.Column("password_hash", sa.String(), nullable=False),
+            sa.Column("totp_secret", sa.String(), nullable=True),
+            sa.Column("created_at", sa.DateTime(), nullable=True),
+            sa.Column("last_login", sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint("id"),
+            sa.UniqueConstraint("email"),
+        )
+        op.create_index("ix_users_id", "users", ["id"])
+        op.create_index("ix_users_username", "users", ["username"], unique=True)
+
+    if "login_attempts" not in existing:
+        op.create_table(
+            "login_attempts",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("user_id", sa.Integer(), nullable=True),
+            sa.Column("timestamp", sa.DateTime(), nullable=True),
+            sa.Column("ip_address", sa.String(), nullable=False),
+            sa.Column("device_fingerprint", sa.String(), nullable=True),
+            sa.Column("location_lat", sa.Float(), nullable=True),
+            sa.Column("location_lon", sa.Float(), nullable=True),
+            sa.Column("risk_score", sa.Integer(), nullable=True),
+            sa.Column("risk_level", sa.String(), nullable=True),
+            sa.Column("success", sa.Boolean(), nullable=True),
+            sa.Column("failure_reason", sa.String(), nullable=True),
+            sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.create_index("ix_login_attempts_id", "login_attempts", ["id"])
+
+    if "trusted_devices" not in existing:
+        op.create_table(
+            "trusted_devices",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("user_id", sa.Integer(), nullable=False),
+            sa.Column("device_fingerprint", sa.String(), nullable=False),
+            sa.Column("first_seen", sa.DateTime(), nullable=True),
+            sa.Column("last_seen", sa.DateTime(), nullable=True),
+            sa.Column("trust_level", sa.String(), nullable=True),
+            sa.Column("device_name", sa.String(), nullable=True),
+            sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.create_index("ix_trusted_devices_id", "trusted_devices", ["id"])
+
+    if "pending_auth" not in existing:
+        op.create_table(
+            "pending_auth",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("user_id", sa.Integer(), nullable=False),
+            sa.Column("otp_hash", sa.String(), nullable=False),
+            sa.Column("expires_at", sa.DateTime(), nullable=False),
+            sa.Column("attempts", sa.Integer(), nullable=True),
+            sa.Column("ip_address", sa.String(), nullable=True),
+            sa.Column("device_fingerprint", sa.String(), nullable=True),
+            sa.Column("created_at", sa.DateTime(), nullable=True),
+            sa.Column("is_used", sa.Boolean(), nullable=True),
+            sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.create_index("ix_pending_auth_id", "pending_auth", ["id"])
+
+    if "user_profiles" not in existing:
+        op.create_table(
+            "user_profiles",
+            sa.Column("user_id", sa.Integer(), nullable=False),
+            sa.Column("hour_histogram", sa.JSON(), nullable=False),
+            sa.Column("histogram_updated_at", sa.DateTime(), nullable=True),
+            sa.Column("last_lat", sa.Float(), nullable=True),
+            sa.Column("last_lon", sa.Float(), nullable=True),
+            sa.Column("last_location_at", sa.DateTime(), nullable=True),
+            sa.Column("last_login_at", sa.DateTime(), nullable=True),
+            sa.Column("trusted_device_count", sa.Integer(), nullable=True),
+            sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+            sa.PrimaryKeyConstraint("user_id"),
+        )
+
+
+def downgrade():
+    op.drop_table("user_profiles")
+    op.drop_table("pending_auth")
+    op.drop_table("trusted_devices")
+    op.drop_table("login_attempts")
+    op.drop_table("users")
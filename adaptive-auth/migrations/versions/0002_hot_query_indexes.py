@@ -0,0 +1,42 @@
+"""Composite indexes for the hot query shapes
+
+- login_attempts (user_id, success, timestamp, location_lat, location_lon)
+  covers the per-user successful-login scans (profile rebuilds) without
+  touching the table.
+- trusted_devices (user_id, device_fingerprint) is unique, which both serves
+  the per-user device lookups and stops the same device being trusted twice.
+  Existing duplicates are removed first, keeping the oldest row.
+
+pending_auth is looked up by (id, is_used), but id is the primary key, so
+that lookup already resolves to a single row without another index.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+"""
+from alembic import op
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        "DELETE FROM trusted_devices WHERE id NOT IN ("
+        "SELECT MIN(id) FROM trusted_devices GROUP BY user_id, device_fingerprint)"
+    )
+    op.create_index(
+        "uq_trusted_devices_user_device", "trusted_devices",
+        ["user_id", "device_fingerprint"], unique=True,
+    )
+    op.create_index(
+        "ix_login_attempts_user_success_time", "login_attempts",
+        ["user_id", "success", "timestamp", "location_lat", "location_lon"],
+    )
+
+
+def downgrade():
+    op.drop_index("ix_login_attempts_user_success_time", table_name="login_attempts")
+    op.drop_index("uq_trusted_devices_user_device", table_name="trusted_devices")
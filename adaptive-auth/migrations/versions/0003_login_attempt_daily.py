@@ -0,0 +1,40 @@
+"""Daily per-user rollups for compacted login attempts
+
+Also indexes login_attempts (timestamp, id), so each compaction batch is a
+range scan over the oldest rows rather than a walk of the whole table.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "login_attempt_daily",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("successes", sa.Integer(), nullable=False),
+        sa.Column("failures", sa.Integer(), nullable=False),
+        sa.Column("high_risk", sa.Integer(), nullable=False),
+        sa.Column("risk_score_total", sa.Integer(), nullable=False),
+        sa.Column("max_risk_score", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("uq_login_attempt_daily_user_day", "login_attempt_daily", ["user_id", "day"], unique=True)
+    op.create_index("ix_login_attempts_time", "login_attempts", ["timestamp", "id"])
+
+
+def downgrade():
+    op.drop_index("ix_login_attempts_time", table_name="login_attempts")
+    op.drop_index("uq_login_attempt_daily_user_day", table_name="login_attempt_daily")
+    op.drop_table("login_attempt_daily")
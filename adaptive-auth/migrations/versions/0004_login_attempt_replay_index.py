@@ -0,0 +1,23 @@
+"""Keyset index for replaying login history per user
+
+login_attempts (user_id, timestamp, id) lets app.replay page through each
+user's attempts in time order without sorting.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17
+"""
+from alembic import op
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index("ix_login_attempts_user_time", "login_attempts", ["user_id", "timestamp", "id"])
+
+
+def downgrade():
+    op.drop_index("ix_login_attempts_user_time", table_name="login_attempts")
@@ -0,0 +1,31 @@
+"""Keyset index for exporting login history
+
+login_attempts (timestamp, id) lets app.export page through every attempt
+in time order without sorting. Revision 0003 now creates the index, for
+compaction; this only adds it to databases that ran 0003 before it did.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def _has_index() -> bool:
+    indexes = sa.inspect(op.get_bind()).get_indexes("login_attempts")
+    return any(index["name"] == "ix_login_attempts_time" for index in indexes)
+
+
+def upgrade():
+    if not _has_index():
+        op.create_index("ix_login_attempts_time", "login_attempts", ["timestamp", "id"])
+
+
+def downgrade():
+    pass  # Owned by 0003
@@ -0,0 +1,37 @@
+"""Hourly risk analytics rollups
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "risk_rollups",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("hour", sa.DateTime(), nullable=False),
+        sa.Column("event", sa.String(), nullable=False),
+        sa.Column("risk_level", sa.String(), nullable=False),
+        sa.Column("signal", sa.String(), nullable=False),
+        sa.Column("outcome", sa.String(), nullable=False),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.Column("risk_score_total", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "uq_risk_rollups_key", "risk_rollups",
+        ["hour", "event", "risk_level", "signal", "outcome"], unique=True,
+    )
+
+
+def downgrade():
+    op.drop_index("uq_risk_rollups_key", table_name="risk_rollups")
+    op.drop_table("risk_rollups")
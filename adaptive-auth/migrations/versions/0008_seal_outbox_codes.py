@@ -0,0 +1,50 @@
+"""Encrypt queued OTP codes
+
+otp_outbox.code held the plaintext code until the message was sent. It is
+replaced by sealed_code, encrypted with app.otp_delivery's key; codes still
+waiting are sealed on the way.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+outbox = sa.table(
+    "otp_outbox",
+    sa.column("id", sa.Integer()),
+    sa.column("code", sa.String()),
+    sa.column("sealed_code", sa.String()),
+)
+
+
+def upgrade():
+    from app.otp_delivery import seal_code
+
+    with op.batch_alter_table("otp_outbox") as batch:
+        batch.add_column(sa.Column("sealed_code", sa.String(), nullable=True))
+    connection = op.get_bind()
+    for outbox_id, code in connection.execute(sa.select(outbox.c.id, outbox.c.code).where(outbox.c.code.isnot(None))):
+        connection.execute(outbox.update().where(outbox.c.id == outbox_id).values(sealed_code=seal_code(code)))
+    with op.batch_alter_table("otp_outbox") as batch:
+        batch.drop_column("code")
+
+
+def downgrade():
+    from app.otp_delivery import open_code
+
+    with op.batch_alter_table("otp_outbox") as batch:
+        batch.add_column(sa.Column("code", sa.String(), nullable=True))
+    connection = op.get_bind()
+    for outbox_id, sealed in connection.execute(
+        sa.select(outbox.c.id, outbox.c.sealed_code).where(outbox.c.sealed_code.isnot(None)),
+    ):
+        connection.execute(outbox.update().where(outbox.c.id == outbox_id).values(code=open_code(sealed)))
+    with op.batch_alter_table("otp_outbox") as batch:
+        batch.drop_column("sealed_code")
@@ -0,0 +1,77 @@
+"""
+Shared fixtures. The app reads its configuration at import time, so the
+environment is pointed at a scratch directory before anything from app/ is
+imported: a fresh SQLite database, and index and throttle files that stay
+out of data/.
+"""
+import os
+import tempfile
+
+_scratch = tempfile.mkdtemp(prefix="adaptive-auth-tests-")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{_scratch}/test.db",
+    "IP_BLOCKLIST_PATHS": f"{_scratch}/ip_blocklist.txt",
+    "IP_REPUTATION_INDEX_PATH": f"{_scratch}/ip_reputation.idx",
+    "GEOIP_DB_PATHS": f"{_scratch}/geoip.csv",
+    "GEOIP_INDEX_PATH": f"{_scratch}/geoip.idx",
+    "THROTTLE_STORE_PATH": f"{_scratch}/throttle.db",
+    "OTP_TRANSPORT": "memory",
+    "AUDIT_MODE": "sync",
+})
+
+import uuid  # noqa: E402
+
+import bcrypt  # noqa: E402
+import pytest  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app import cache  # noqa: E402
+from app.database import SessionLocal  # noqa: E402
+from app.migrate import upgrade_database  # noqa: E402
+from app.models import TrustedDevice, User  # noqa: E402
+
+PASSWORD = "correct horse battery"
+PASSWORD_HASH = bcrypt.hashpw(PASSWORD.encode(), bcrypt.gensalt(4)).decode()  # Cheap rounds keep tests fast
+
+upgrade_database()
+
+
+@pytest.fixture(scope="session")
+def scratch_dir() -> str:
+    return _scratch
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def client():
+    # Without the lifespan: no background workers, and the schema is already migrated
+    from app.main import app
+    return TestClient(app)
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    for entry in cache.ALL_CACHES:
+        entry.clear()
+    yield
+
+
+@pytest.fixture
+def make_user(db):
+    """Create a user, optionally with trusted devices, and return it."""
+    def make(devices: tuple[str, ...] = ()) -> User:
+        name = f"user-{uuid.uuid4().hex[:12]}"
+        user = User(username=name, email=f"{name}@example.com", password_hash=PASSWORD_HASH)
+        db.add(user)
+        db.flush()
+        for fingerprint in devices:
+            db.add(TrustedDevice(user_id=user.id, device_fingerprint=fingerprint))
+        db.commit()
+        return user
+    return make
@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta, timezone
+
+from app.analytics import RollupRecorder, backfill
+from app.database import SessionLocal
+from app.models import LoginAttempt, RiskRollup
+from app.profiles import as_utc
+
+# Hours no other test writes to
+LIVE_HOUR = datetime(2001, 1, 1, 9, tzinfo=timezone.utc)
+HISTORY_HOUR = datetime(2003, 3, 3, 10, tzinfo=timezone.utc)
+
+
+def rollups(db, hour: datetime) -> dict:
+    db.expire_all()
+    rows = db.query(RiskRollup).filter(RiskRollup.hour >= hour.replace(tzinfo=None),
+                                       RiskRollup.hour < (hour + timedelta(hours=1)).replace(tzinfo=None))
+    return {(row.event, row.risk_level, row.signal, row.outcome): (row.count, row.risk_score_total)
+            for row in rows if as_utc(row.hour) == hour}
+
+
+def test_flushes_add_to_the_hourly_rows(db):
+    recorder = RollupRecorder(enabled=True, interval=0, session_factory=SessionLocal)
+    minute = LIVE_HOUR + timedelta(minutes=30)
+
+    recorder.record("login", "otp_required", "high", ["new_device"], 105, at=minute)
+    recorder.record("login", "success", "low", [], 0, at=minute)
+    recorder.flush()
+    recorder.record("login", "otp_required", "high", ["new_device", "atypical_time"], 135, at=minute)
+    recorder.flush()
+
+    assert rollups(db, LIVE_HOUR) == {
+        ("login", "high", "*", "otp_required"): (2, 240),
+        ("login", "high", "new_device", "otp_required"): (2, 240),
+        ("login", "high", "atypical_time", "otp_required"): (1, 135),
+        ("login", "low", "*", "success"): (1, 0),
+    }
+    assert recorder.stats()["pending_rows"] == 0
+
+
+def test_backfill_rebuilds_hours_from_history(db, make_user):
+    user = make_user()
+    at = HISTORY_HOUR + timedelta(minutes=15)
+    db.add_all([
+        LoginAttempt(user_id=user.id, timestamp=at, ip_address="203.0.113.7", device_fingerprint="phone",
+                     risk_score=105, risk_level="high", success=True),
+        LoginAttempt(user_id=user.id, timestamp=at, ip_address="203.0.113.7", device_fingerprint="phone",
+                     risk_score=105, risk_level="high", success=False, failure_reason="invalid_credentials"),
+        LoginAttempt(user_id=user.id, timestamp=at, ip_address="203.0.113.7", risk_level="low",
+                     success=False, failure_reason="throttled"),
+    ])
+    db.commit()
+    expected = {
+        ("login", "high", "*", "otp_required"): (1, 105),
+        ("login", "high", "new_device", "otp_required"): (1, 105),
+        ("otp", "high", "*", "success"): (1, 0),
+        ("login", "high", "*", "invalid_credentials"): (1, 105),
+        ("login", "high", "new_device", "invalid_credentials"): (1, 105),
+        ("login", "none", "*", "throttled"): (1, 0),
+    }
+
+    backfill(since=HISTORY_HOUR, rebuild=True)
+    assert rollups(db, HISTORY_HOUR) == expected
+
+    backfill(since=HISTORY_HOUR, rebuild=True)  # Replaces the hours rather than adding to them
+    assert rollups(db, HISTORY_HOUR) == expected
@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app import anomaly
+from app.anomaly import COMPONENT_CAPS, AnomalyModel, ModelFile, ModelFormatError, assess_anomaly, train
+from app.models import LoginAttempt
+from app.risk_engine import RISK_THRESHOLD, RiskEvent, load_risk_context
+
+LONDON = (51.5, -0.1)
+TOKYO = (35.7, 139.7)
+
+
+def monday_at(hour: int, weeks_ago: int = 0) -> datetime:
+    today = datetime.now(timezone.utc).replace(hour=hour, minute=0, second=0, microsecond=0)
+    return today - timedelta(days=today.weekday(), weeks=weeks_ago)
+
+
+@pytest.fixture
+def trained(db, make_user, tmp_path, monkeypatch):
+    """A user who logs in from London on their laptop at 09:00 every weekday, and a model trained on them."""
+    user = make_user(devices=("laptop",))
+    for weeks_ago in range(1, 9):
+        for weekday in range(5):
+            db.add(LoginAttempt(user_id=user.id, timestamp=monday_at(9, weeks_ago) + timedelta(days=weekday),
+                                ip_address="203.0.113.7", device_fingerprint="laptop",
+                                location_lat=LONDON[0], location_lon=LONDON[1], success=True))
+    db.commit()
+
+    path = str(tmp_path / "anomaly.bin")
+    result = train(path, days=90)
+    monkeypatch.setattr(anomaly, "model", AnomalyModel(path, check_interval=0))
+    return user, path, result
+
+
+def score(db, user, device: str, location: tuple[float, float], now: datetime) -> dict:
+    context = load_risk_context(db, user.username, device, now=now)
+    return assess_anomaly(RiskEvent("203.0.113.7", device, *location), context)
+
+
+def test_trained_model_round_trips_through_the_file(trained):
+    user, path, result = trained
+    model = ModelFile(path)
+
+    assert result["users"] == model.users >= 1
+    assert model.lookup(user.id)["user_id"] == user.id
+    assert model.lookup(10 ** 9)["user_id"] == -1  # Untrained users get the global record
+
+
+def test_usual_login_scores_low_and_unusual_one_higher(db, trained):
+    user, _, _ = trained
+
+    usual = score(db, user, "laptop", LONDON, monday_at(9))
+    unusual = score(db, user, "laptop", TOKYO, monday_at(3) + timedelta(days=6))
+
+    assert usual["scorer"] == "anomaly"
+    assert usual["risk_level"] == "low" and usual["risk_score"] < RISK_THRESHOLD
+    assert unusual["signals"]["location"]["flagged"]
+    assert unusual["signals"]["hour_of_week"]["points"] > usual["signals"]["hour_of_week"]["points"]
+    assert unusual["risk_score"] > usual["risk_score"]
+
+
+def test_untrusted_device_scores_the_cap(db, trained):
+    user, _, _ = trained
+
+    result = score(db, user, "phone", LONDON, monday_at(9))
+
+    assert result["signals"]["device"] == {"flagged": True, "points": COMPONENT_CAPS["device"], "surprise_bits": None}
+    assert result["risk_level"] == "high"
+
+
+@pytest.mark.parametrize("damage, message", [
+    (lambda data: data[:-10], "truncated"),
+    (lambda data: data[:4] + (99).to_bytes(2, "little") + data[6:], "not a version"),
+    (lambda data: data[:20], "too small"),
+])
+def test_damaged_files_are_refused(trained, tmp_path, damage, message):
+    _, path, _ = trained
+    damaged = tmp_path / "damaged.bin"
+    damaged.write_bytes(damage(open(path, "rb").read()))
+
+    with pytest.raises(ModelFormatError, match=message):
+        ModelFile(str(damaged))
+
+    model = AnomalyModel(str(damaged), check_interval=0)
+    assert model.get() is None
+    assert "ModelFormatError" in model.last_error
+
+
+def test_training_past_the_retention_window_warns(tmp_path, capsys):
+    train(str(tmp_path / "anomaly.bin"), days=anomaly.LOGIN_ATTEMPT_RETENTION_DAYS + 1)
+
+    assert "LOGIN_ATTEMPT_RETENTION_DAYS" in capsys.readouterr().out
@@ -0,0 +1,102 @@
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.audit import AuditSink
+from app.database import SessionLocal
+from app.models import LoginAttempt
+
+
+def sink(mode: str = "async", overflow: str = "sync", queue_size: int = 100) -> AuditSink:
+    return AuditSink(mode=mode, queue_size=queue_size, batch_size=10, flush_interval=0.05, overflow=overflow,
+                     session_factory=SessionLocal)
+
+
+@pytest.fixture
+def marker() -> str:
+    """An ip_address that tags this test's attempts."""
+    return f"audit-{uuid.uuid4().hex[:12]}"
+
+
+def written(db, marker: str) -> int:
+    return db.query(LoginAttempt).filter(LoginAttempt.ip_address == marker).count()
+
+
+def stalled(audit: AuditSink) -> AuditSink:
+    """Keep the writer from starting, so the queue only drains on flush()."""
+    audit._ensure_started = lambda: None
+    return audit
+
+
+def test_sync_mode_writes_in_the_callers_transaction(db, marker):
+    audit = sink(mode="sync")
+
+    assert audit.record(db, ip_address=marker) is True
+    db.commit()
+
+    assert written(db, marker) == 1
+
+
+def test_stop_writes_everything_still_queued(db, marker):
+    audit = sink()
+    audit.start()
+
+    assert not any(audit.record(db, ip_address=marker) for _ in range(25))
+    audit.stop()
+
+    assert written(db, marker) == 25
+    assert audit.stats()["written"] == 25 and audit.stats()["queued"] == 0
+
+
+def test_flushed_through_holds_until_the_queue_is_written(db, marker):
+    audit = stalled(sink())
+    audit.record(db, ip_address=marker, timestamp=datetime.now(timezone.utc) - timedelta(seconds=1))
+    queued = audit.flushed_through()
+
+    time.sleep(0.01)
+    assert audit.flushed_through() == queued
+    flushing = datetime.now(timezone.utc)
+    audit.flush()
+    assert audit.flushed_through() >= flushing
+
+
+def test_full_queue_falls_back_to_a_synchronous_write(db, marker):
+    audit = stalled(sink(overflow="sync", queue_size=1))
+
+    assert audit.record(db, ip_address=marker) is False
+    assert audit.record(db, ip_address=marker) is True  # The caller commits this one
+    db.commit()
+    audit.flush()
+
+    assert written(db, marker) == 2
+    assert (audit.overflowed, audit.dropped) == (1, 0)
+
+
+def test_full_queue_drops_in_drop_mode(db, marker):
+    audit = stalled(sink(overflow="drop", queue_size=1))
+
+    assert [audit.record(db, ip_address=marker) for _ in range(3)] == [False, False, False]
+    audit.flush()
+
+    assert written(db, marker) == 1
+    assert (audit.overflowed, audit.dropped) == (2, 2)
+
+
+def test_full_queue_waits_for_room_in_block_mode(db, marker):
+    audit = stalled(sink(overflow="block", queue_size=1))
+    audit.record(db, ip_address=marker)
+    second = threading.Thread(target=audit.record, args=(db,), kwargs={"ip_address": marker})
+    second.start()
+
+    second.join(0.2)
+    assert second.is_alive()  # Blocked on the full queue
+    audit.flush()
+    second.join(5)
+    audit.flush()
+
+    assert not second.is_alive()
+    assert written(db, marker) == 2
+    assert (audit.overflowed, audit.dropped) == (1, 0)
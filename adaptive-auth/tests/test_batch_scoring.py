@@ -0,0 +1,49 @@
+"""
+score_events must agree with assess_risk(full=True) event for event. A
+handful of users covers each signal's branches; benchmarks.batch_scoring
+runs the same comparison over thousands of random events.
+"""
+import random
+from datetime import datetime, timedelta, timezone
+
+from app.batch_scoring import score_events
+from app.models import UserProfile
+from app.risk_engine import assess_risk, load_risk_context
+from app.schemas import ScoringEvent
+
+
+def test_batch_scores_match_assess_risk(db, make_user):
+    now = datetime.now(timezone.utc)
+    rng = random.Random(7)
+
+    users = [make_user(devices=("laptop",)) for _ in range(4)]
+    profiled, located, recent, _ = users
+    db.add(UserProfile(user_id=profiled.id, hour_histogram=[rng.uniform(0, 3) for _ in range(24)],
+                       histogram_updated_at=now - timedelta(days=10), trusted_device_count=1))
+    db.add(UserProfile(user_id=located.id, hour_histogram=[0.0] * 24, last_lat=51.5, last_lon=-0.1,
+                       last_location_at=now - timedelta(days=2), trusted_device_count=1))
+    db.add(UserProfile(user_id=recent.id, hour_histogram=[0.0] * 12 + [4.0] * 12, last_lat=40.7, last_lon=-74.0,
+                       histogram_updated_at=now - timedelta(hours=1), last_location_at=now - timedelta(minutes=30),
+                       trusted_device_count=1))
+    db.commit()
+
+    events = [
+        ScoringEvent(
+            username=username,
+            ip_address=rng.choice(["203.0.113.7", "10.0.0.3", "2001:db8::1"]),
+            device_fingerprint=rng.choice(["laptop", "phone", None]),
+            location_lat=lat,
+            location_lon=lon,
+        )
+        for username in [user.username for user in users] + ["nobody"]
+        for lat, lon in [(None, None), (51.5, -0.1), (35.7, 139.7), (-33.9, 151.2)]
+    ]
+
+    single = []
+    for event in events:
+        context = load_risk_context(db, event.username, event.device_fingerprint, now=now)
+        single.append(assess_risk(db, event.username, event.ip_address, event.device_fingerprint,
+                                  event.location_lat, event.location_lon, context=context, full=True))
+
+    assert score_events(db, events, now=now) == single
+    assert any(result["risk_level"] == "high" for result in single)
@@ -0,0 +1,40 @@
+from app import cache
+from app.cache import MISSING, TTLCache
+
+
+def test_set_after_invalidation_is_dropped():
+    entries = TTLCache("test", 10, 60)
+    since = cache.generation()  # A reader starts loading the old row
+    entries.invalidate("alice")  # A writer commits and invalidates
+    entries.set("alice", "old", since)
+
+    assert entries.get("alice") is MISSING
+    assert entries.stats()["stale_sets"] == 1
+
+
+def test_set_after_a_fresh_load_is_kept():
+    entries = TTLCache("test", 10, 60)
+    entries.invalidate("alice")
+    since = cache.generation()
+    entries.set("alice", "new", since)
+
+    assert entries.get("alice") == "new"
+
+
+def test_invalidating_another_key_does_not_drop_the_set():
+    entries = TTLCache("test", 10, 60)
+    since = cache.generation()
+    entries.invalidate("bob")
+    entries.set("alice", "value", since)
+
+    assert entries.get("alice") == "value"
+
+
+def test_forgotten_invalidations_refuse_older_loads():
+    entries = TTLCache("test", 1, 60)
+    since = cache.generation()
+    for n in range(1100):  # Past the 1024 invalidations remembered
+        entries.invalidate(f"user{n}")
+    entries.set("user0", "old", since)
+
+    assert entries.get("user0") is MISSING
@@ -0,0 +1,24 @@
+from starlette.requests import Request
+
+from app.client_ip import client_ip
+
+
+def request(peer: str = "10.0.0.2", forwarded: str | None = None) -> Request:
+    headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded is not None else []
+    return Request({"type": "http", "client": (peer, 50000), "headers": headers})
+
+
+def test_without_proxies_the_peer_is_the_client():
+    assert client_ip(request(forwarded="198.51.100.7"), hops=0) == "10.0.0.2"
+
+
+def test_the_address_appended_by_the_outermost_proxy_wins():
+    # The client forged the first entry; the proxy appended the real address
+    assert client_ip(request(forwarded="203.0.113.9, 198.51.100.7"), hops=1) == "198.51.100.7"
+    assert client_ip(request(forwarded="203.0.113.9, 198.51.100.7, 10.1.0.1"), hops=2) == "198.51.100.7"
+
+
+def test_falls_back_to_the_peer_without_a_usable_header():
+    assert client_ip(request(), hops=1) == "10.0.0.2"
+    assert client_ip(request(forwarded="198.51.100.7"), hops=2) == "10.0.0.2"
+    assert client_ip(request(forwarded="not-an-address"), hops=1) == "10.0.0.2"
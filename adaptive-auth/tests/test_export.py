@@ -0,0 +1,86 @@
+import itertools
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+from app import audit, export
+from app.export import decode_cursor, iter_attempts
+from app.models import LoginAttempt
+from app.tokens import require_static_token
+
+_days = itertools.count()
+
+
+@pytest.fixture
+def moment() -> datetime:
+    """A time in 2004 that no other test writes attempts at."""
+    return datetime(2004, 4, 4, 4, 4, 4, tzinfo=timezone.utc) + timedelta(days=next(_days))
+
+
+@pytest.fixture
+def same_moment(db, moment):
+    """Seven attempts sharing one timestamp, and one a second later."""
+    rows = [LoginAttempt(timestamp=moment, ip_address=f"192.0.2.{n}") for n in range(7)]
+    rows.append(LoginAttempt(timestamp=moment + timedelta(seconds=1), ip_address="192.0.2.99"))
+    db.add_all(rows)
+    db.commit()
+    return [row.id for row in rows]
+
+
+def export_ids(moment: datetime, **kwargs) -> list[int]:
+    until = moment + timedelta(seconds=2)
+    return [attempt["id"] for attempt in iter_attempts(since=moment, until=until, **kwargs)]
+
+
+def test_pages_split_equal_timestamps_without_gaps_or_repeats(moment, same_moment):
+    assert export_ids(moment, page_size=3) == export_ids(moment, page_size=100) == same_moment
+
+
+def test_cursor_resumes_inside_a_run_of_equal_timestamps(moment, same_moment):
+    first = list(iter_attempts(since=moment, until=moment + timedelta(seconds=2), page_size=2))[:4]
+
+    resumed = export_ids(moment, cursor=first[-1]["cursor"], page_size=2)
+
+    assert decode_cursor(first[-1]["cursor"]) == (moment, same_moment[3])
+    assert resumed == same_moment[4:]
+
+
+def test_run_stops_where_the_audit_writer_has_flushed(moment, same_moment, monkeypatch):
+    monkeypatch.setattr(export, "EXPORT_SETTLE_SECONDS", 0)
+    monkeypatch.setattr(audit.sink, "flushed_through", lambda: moment + timedelta(microseconds=1))
+
+    assert [attempt["id"] for attempt in iter_attempts(since=moment)] == same_moment[:7]
+
+
+def test_export_is_disabled_without_a_token(client):
+    response = client.get("/export/login-attempts")
+
+    assert response.status_code == 404
+    assert "EXPORT_TOKEN" in response.json()["detail"]
+
+
+def test_static_token_is_checked():
+    app = FastAPI()
+
+    @app.get("/guarded", dependencies=[Depends(require_static_token("s3cret", "EXPORT_TOKEN"))])
+    def guarded():
+        return {"ok": True}
+
+    client = TestClient(app)
+    assert client.get("/guarded").status_code == 401
+    assert client.get("/guarded", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    assert client.get("/guarded", headers={"Authorization": "Bearer s3cret"}).json() == {"ok": True}
+
+
+def test_settle_time_shorter_than_the_writer_lag_refuses_to_start(monkeypatch):
+    monkeypatch.setattr(export, "EXPORT_TOKEN", "s3cret")
+    monkeypatch.setattr(export, "AUDIT_MODE", "async")
+    monkeypatch.setattr(export, "AUDIT_FLUSH_INTERVAL_SECONDS", 3)
+    monkeypatch.setattr(export, "EXPORT_SETTLE_SECONDS", 5)
+
+    with pytest.raises(RuntimeError, match="EXPORT_SETTLE_SECONDS"):
+        export.check_settle_window()
+    monkeypatch.setattr(export, "EXPORT_SETTLE_SECONDS", 7)
+    export.check_settle_window()
@@ -0,0 +1,52 @@
+import os
+import shutil
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.config import GEOIP_DB_PATHS
+from app.database import SessionLocal
+from app.geoip import geoip, resolve_location
+from app.main import app
+from app.models import LoginAttempt
+from tests.conftest import PASSWORD
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "geoip.csv")
+
+
+@pytest.fixture
+def geoip_ranges():
+    shutil.copy(FIXTURE, GEOIP_DB_PATHS[0])
+    geoip.refresh()
+    yield
+    os.remove(GEOIP_DB_PATHS[0])
+    geoip.refresh()
+
+
+def test_resolves_fixture_ranges(geoip_ranges):
+    assert resolve_location("198.51.100.5") == (51.5074, -0.1278)
+    assert resolve_location("198.51.100.100") == (48.8566, 2.3522)  # The nested, inner range wins
+    assert resolve_location("203.0.113.15") == (35.6762, 139.6503)
+    assert resolve_location("203.0.113.21") is None
+    assert resolve_location("2001:db8::1") == (40.7128, -74.006)
+    assert resolve_location("::ffff:198.51.100.5") == (51.5074, -0.1278)
+
+
+def test_rows_without_coordinates_and_bad_addresses_resolve_to_nothing(geoip_ranges):
+    assert resolve_location("192.0.2.1") is None
+    assert resolve_location("testclient") is None
+
+
+def test_login_records_the_client_location(geoip_ranges, make_user):
+    user = make_user(devices=("laptop",))
+    client = TestClient(app, client=("198.51.100.5", 50000))
+
+    response = client.post("/auth/login", json={
+        "username": user.username, "password": PASSWORD, "device_fingerprint": "laptop",
+    })
+
+    assert response.json()["success"] is True
+    db = SessionLocal()
+    attempt = db.query(LoginAttempt).filter(LoginAttempt.user_id == user.id).one()
+    db.close()
+    assert (attempt.location_lat, attempt.location_lon) == (51.5074, -0.1278)
@@ -0,0 +1,38 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.hashing import HashingPool, HashingPoolSaturated, verify_password, verify_password_async
+from tests.conftest import PASSWORD, PASSWORD_HASH
+
+
+def test_verify_password_async():
+    assert asyncio.run(verify_password_async(PASSWORD, PASSWORD_HASH)) is True
+    assert asyncio.run(verify_password_async("wrong", PASSWORD_HASH)) is False
+
+
+def test_full_pool_sheds_instead_of_queueing():
+    pool = HashingPool("thread", 1, 1)
+    release = threading.Event()
+
+    def blocked():
+        release.wait(5)
+        return verify_password(PASSWORD, PASSWORD_HASH)
+
+    async def run():
+        busy = asyncio.ensure_future(pool.run(blocked))
+        queued = asyncio.ensure_future(pool.run(blocked))
+        await asyncio.sleep(0)
+        with pytest.raises(HashingPoolSaturated):
+            await pool.run(blocked)
+        release.set()
+        return await asyncio.gather(busy, queued)
+
+    try:
+        assert asyncio.run(run()) == [True, True]
+    finally:
+        release.set()
+        pool.shutdown()
+    assert pool.stats()["rejected"] == 1
+    assert pool.stats()["in_flight"] == 0
@@ -0,0 +1,53 @@
+import os
+
+from app.ip_index import ReloadingIndex
+from app.ip_reputation import read_blocklist
+
+
+def blocklist_index(tmp_path, sources: list[str]) -> ReloadingIndex:
+    return ReloadingIndex(
+        name="test", sources=sources, index_path=str(tmp_path / "test.idx"), payload_format="<H",
+        read_source=read_blocklist, priority=lambda payload: payload[0], check_interval=0,
+    )
+
+
+def test_lookup_and_nested_ranges(tmp_path):
+    source = tmp_path / "blocklist.txt"
+    source.write_text("203.0.113.0/24 40\n203.0.113.128/25 90\n2001:db8::/32 70\n")
+    index = blocklist_index(tmp_path, [str(source)])
+
+    assert index.lookup("203.0.113.5") == (40,)
+    assert index.lookup("203.0.113.200") == (90,)  # The higher severity wins where ranges overlap
+    assert index.lookup("2001:db8::1") == (70,)
+    assert index.lookup("198.51.100.1") is None
+
+
+def test_replacement_with_an_older_mtime_is_recompiled(tmp_path):
+    source = tmp_path / "blocklist.txt"
+    source.write_text("203.0.113.0/24 40\n")
+    index = blocklist_index(tmp_path, [str(source)])
+    assert index.lookup("203.0.113.5") == (40,)
+
+    # As cp -p or an unpacked archive would leave it: new content, older timestamp
+    replacement = tmp_path / "replacement.txt"
+    replacement.write_text("198.51.100.0/24 60\n")
+    os.utime(replacement, ns=(1_000_000_000, 1_000_000_000))
+    os.replace(replacement, source)
+    index.refresh()
+
+    assert index.lookup("203.0.113.5") is None
+    assert index.lookup("198.51.100.1") == (60,)
+
+
+def test_removed_source_is_recompiled(tmp_path):
+    first, second = tmp_path / "a.txt", tmp_path / "b.txt"
+    first.write_text("203.0.113.0/24 40\n")
+    second.write_text("198.51.100.0/24 60\n")
+    index = blocklist_index(tmp_path, [str(first), str(second)])
+    assert index.lookup("198.51.100.1") == (60,)
+
+    second.unlink()
+    index.refresh()
+
+    assert index.lookup("198.51.100.1") is None
+    assert index.lookup("203.0.113.5") == (40,)
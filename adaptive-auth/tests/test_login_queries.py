@@ -0,0 +1,54 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from app import cache
+from app.database import engine
+from tests.conftest import PASSWORD
+
+
+@contextmanager
+def count_statements():
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement.split(None, 1)[0].upper())
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+
+def login(client, username: str, device: str):
+    return client.post("/auth/login", json={"username": username, "password": PASSWORD, "device_fingerprint": device})
+
+
+def test_low_risk_login_query_count(client, make_user):
+    user = make_user(devices=("laptop",))
+    login(client, user.username, "laptop")  # Creates the profile; later logins update it
+    for entry in cache.ALL_CACHES:
+        entry.clear()
+
+    with count_statements() as statements:
+        response = login(client, user.username, "laptop")
+
+    assert response.json()["success"] is True
+    assert response.json()["risk_level"] == "low"
+    # User, profile and trusted devices in one SELECT, then the profile row
+    # for update, the audit insert and the two updates
+    assert statements == ["SELECT", "UPDATE", "SELECT", "INSERT", "UPDATE"]
+
+
+def test_warm_login_reads_only_the_profile(client, make_user):
+    user = make_user(devices=("laptop",))
+    login(client, user.username, "laptop")
+
+    with count_statements() as statements:
+        response = login(client, user.username, "laptop")
+
+    assert response.json()["risk_level"] == "low"
+    # The user and devices come from the cache; the profile the last login
+    # invalidated is read for risk and again for the update
+    assert statements.count("SELECT") == 2
@@ -0,0 +1,97 @@
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+
+from app import maintenance
+from app.maintenance import UNKNOWN_USER_ID, compact_login_attempts, purge_pending_auth
+from app.models import LoginAttempt, LoginAttemptDaily, OtpOutbox, PendingAuth
+
+# Nothing else in the suite writes attempts before 1999, so compaction up
+# to CUTOFF only touches this module's rows
+DAY = date(1998, 8, 8)
+CUTOFF = datetime(1999, 1, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def pauses(monkeypatch) -> list:
+    """The sleeps taken between batches."""
+    taken = []
+    monkeypatch.setattr(maintenance.time, "sleep", taken.append)
+    return taken
+
+
+def attempt(user_id: int | None, hour: int, success: bool, score: int = 0) -> LoginAttempt:
+    return LoginAttempt(
+        user_id=user_id, timestamp=datetime(DAY.year, DAY.month, DAY.day, hour, tzinfo=timezone.utc),
+        ip_address="198.51.100.8", success=success, risk_score=score,
+        risk_level="high" if score >= 100 else "low",
+    )
+
+
+def daily(db, user_id: int) -> dict | None:
+    db.expire_all()
+    row = db.query(LoginAttemptDaily).filter_by(user_id=user_id, day=DAY).one_or_none()
+    return row and {column: getattr(row, column) for column in (
+        "attempts", "successes", "failures", "high_risk", "risk_score_total", "max_risk_score",
+    )}
+
+
+def test_old_attempts_roll_up_into_daily_rows(db, make_user, pauses):
+    user_id = make_user().id
+    db.add_all([attempt(user_id, 8, True), attempt(user_id, 9, False, 135), attempt(user_id, 10, True, 40),
+                attempt(user_id, 11, False, 105), attempt(user_id, 12, True), attempt(None, 13, False, 60)])
+    db.commit()
+
+    assert compact_login_attempts(db, CUTOFF, batch_size=2, pause=0.5) == 6
+
+    assert pauses == [0.5, 0.5, 0.5]  # After each of three full batches; an empty read ends the run
+    assert daily(db, user_id) == {
+        "attempts": 5, "successes": 3, "failures": 2, "high_risk": 2, "risk_score_total": 280, "max_risk_score": 135,
+    }
+    assert daily(db, UNKNOWN_USER_ID)["attempts"] >= 1
+    assert db.query(LoginAttempt).filter(LoginAttempt.timestamp < CUTOFF).count() == 0
+
+
+def test_running_twice_counts_each_attempt_once(db, make_user, pauses):
+    user_id = make_user().id  # Compaction expunges the session
+    db.add_all([attempt(user_id, 8, True, 20), attempt(user_id, 9, False, 110)])
+    db.commit()
+    compact_login_attempts(db, CUTOFF, pause=0)
+    once = daily(db, user_id)
+
+    assert compact_login_attempts(db, CUTOFF, pause=0) == 0
+    assert daily(db, user_id) == once == {
+        "attempts": 2, "successes": 1, "failures": 1, "high_risk": 1, "risk_score_total": 130, "max_risk_score": 110,
+    }
+
+    db.add(attempt(user_id, 20, True, 150))  # A late arrival for a day already compacted
+    db.commit()
+    assert compact_login_attempts(db, CUTOFF, pause=0) == 1
+    assert daily(db, user_id) == {
+        "attempts": 3, "successes": 2, "failures": 1, "high_risk": 2, "risk_score_total": 280, "max_risk_score": 150,
+    }
+
+
+def test_purge_deletes_used_and_expired_pending_auth_with_their_outbox(db, make_user, pauses):
+    user = make_user()
+    now = datetime.now(timezone.utc)
+    pending = {
+        "used": PendingAuth(user_id=user.id, otp_hash="x", expires_at=now + timedelta(minutes=5), is_used=True),
+        "expired": PendingAuth(user_id=user.id, otp_hash="x", expires_at=now - timedelta(minutes=5)),
+        "live": PendingAuth(user_id=user.id, otp_hash="x", expires_at=now + timedelta(minutes=5)),
+    }
+    db.add_all(pending.values())
+    db.flush()
+    db.add_all(OtpOutbox(pending_auth_id=row.id, user_id=user.id, channel="email", destination="a@example.com",
+                         status="sent") for row in pending.values())
+    db.commit()
+    ids = {name: row.id for name, row in pending.items()}
+
+    assert purge_pending_auth(db, now, batch_size=1, pause=0) >= 2
+
+    db.expire_all()
+    assert {row.id for row in db.query(PendingAuth).filter(PendingAuth.id.in_(ids.values()))} == {ids["live"]}
+    assert [row.pending_auth_id for row in db.query(OtpOutbox).filter(
+        OtpOutbox.pending_auth_id.in_(ids.values()))] == [ids["live"]]
+    assert len(pauses) >= 2  # One batch per row
+    assert purge_pending_auth(db, now, pause=0) == 0
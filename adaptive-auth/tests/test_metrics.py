@@ -0,0 +1,37 @@
+from datetime import datetime, timezone
+
+from app import metrics
+from app.cache import CachedUser
+from app.risk_engine import SIGNALS, assess_risk, build_risk_context
+from tests.conftest import PASSWORD
+
+
+def assess():
+    user = CachedUser(id=1, username="metrics", email="metrics@example.com", password_hash="x")
+    context = build_risk_context(user, None, frozenset({"laptop"}), "laptop", datetime.now(timezone.utc))
+    assess_risk(None, "metrics", "203.0.113.7", "laptop", 40.7, -74.0, context=context, full=True)
+
+
+def signal_count() -> int:
+    return sum(sum(metrics.signal_seconds.labels(signal.name).counts) for signal in SIGNALS)
+
+
+def test_signals_are_timed_for_a_sample_of_assessments(monkeypatch):
+    monkeypatch.setattr(metrics, "ENABLED", True)
+    monkeypatch.setattr(metrics, "SIGNAL_SAMPLE_EVERY", 4)
+    before = signal_count()
+
+    for _ in range(8):
+        assess()
+
+    assert signal_count() - before == 2 * len(SIGNALS)
+
+
+def test_requested_breakdown_times_every_signal(client, make_user, monkeypatch):
+    monkeypatch.setattr(metrics, "SIGNAL_SAMPLE_EVERY", 1_000_000)
+    user = make_user()
+
+    response = client.post("/auth/debug/risk-assessment?timings=true",
+                           json={"username": user.username, "password": PASSWORD})
+
+    assert set(response.json()["timings"]["signals_ms"]) == {signal.name for signal in SIGNALS}
@@ -0,0 +1,23 @@
+import threading
+
+from app.migrate import migration_lock, upgrade_database
+
+
+def test_migrations_of_one_sqlite_file_take_turns():
+    entered = threading.Event()
+
+    def second():
+        with migration_lock():
+            entered.set()
+
+    with migration_lock():
+        thread = threading.Thread(target=second)
+        thread.start()
+        assert not entered.wait(0.2)
+    assert entered.wait(5)
+    thread.join()
+
+
+def test_upgrading_an_up_to_date_database_is_a_no_op():
+    upgrade_database()
+    upgrade_database()
@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from cryptography.fernet import Fernet
+from sqlalchemy import delete
+
+from app import otp_delivery
+from app.config import DEFAULT_SECRET_KEY
+from app.database import SessionLocal
+from app.models import OtpOutbox, PendingAuth
+from app.otp_delivery import MemoryTransport, OtpDispatcher, enqueue_otp, outbox_cipher
+
+
+def queue(db, user, code: str) -> OtpOutbox:
+    pending = PendingAuth(user_id=user.id, otp_hash="x", expires_at=datetime.now(timezone.utc) + timedelta(minutes=5))
+    db.add(pending)
+    enqueue_otp(db, pending, user, code)
+    db.commit()
+    return db.query(OtpOutbox).filter(OtpOutbox.pending_auth_id == pending.id).one()
+
+
+def dispatch() -> MemoryTransport:
+    transport = MemoryTransport()
+    OtpDispatcher(transport, batch_size=50, interval=1, max_attempts=3, retry_base=1, claim_timeout=30,
+                  session_factory=SessionLocal).dispatch_once()
+    return transport
+
+
+def test_codes_are_encrypted_until_sent(db, make_user):
+    user = make_user()
+    row = queue(db, user, "314159")
+    assert "314159" not in row.sealed_code
+
+    sent = [message for message in dispatch().sent if message.id == row.id]
+
+    assert [message.code for message in sent] == ["314159"]
+    db.refresh(row)
+    assert (row.status, row.sealed_code) == ("sent", None)
+
+
+def test_code_sealed_under_another_key_fails_its_message(db, make_user):
+    user = make_user()
+    row = queue(db, user, "271828")
+    row.sealed_code = outbox_cipher(secret="some other secret").encrypt(b"271828").decode()
+    db.commit()
+
+    assert not [message for message in dispatch().sent if message.id == row.id]
+    db.refresh(row)
+    assert (row.status, row.sealed_code) == ("failed", None)
+
+
+def test_rows_without_a_live_challenge_are_expired_not_reclaimed(db, make_user):
+    user = make_user()
+    purged, used = queue(db, user, "111111"), queue(db, user, "222222")
+    db.execute(delete(PendingAuth).where(PendingAuth.id == purged.pending_auth_id))
+    db.get(PendingAuth, used.pending_auth_id).is_used = True
+    db.commit()
+
+    sent = {message.id for message in dispatch().sent}
+
+    assert not sent & {purged.id, used.id}
+    for row in (purged, used):
+        db.refresh(row)
+        assert (row.status, row.sealed_code) == ("expired", None)
+
+
+def test_public_default_secret_refuses_to_start_outside_the_demo(monkeypatch):
+    monkeypatch.setattr(otp_delivery, "SECRET_KEY", DEFAULT_SECRET_KEY)
+    monkeypatch.setattr(otp_delivery, "OTP_OUTBOX_KEY", "")
+    monkeypatch.setattr(otp_delivery, "DEMO_MODE", True)
+    otp_delivery.check_outbox_key()
+
+    monkeypatch.setattr(otp_delivery, "DEMO_MODE", False)
+    with pytest.raises(RuntimeError, match="OTP_OUTBOX_KEY"):
+        otp_delivery.check_outbox_key()
+
+    monkeypatch.setattr(otp_delivery, "OTP_OUTBOX_KEY", Fernet.generate_key().decode())
+    otp_delivery.check_outbox_key()
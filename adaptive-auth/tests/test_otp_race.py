@@ -0,0 +1,61 @@
+"""
+Concurrent /auth/verify-otp submissions for one pending session, each on its
+own thread and database session. benchmarks.otp_race runs the same storms
+over many sessions, or against PostgreSQL.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from fastapi.testclient import TestClient
+
+from app.auth import OTP_ATTEMPT_LIMIT, generate_otp, hash_otp
+from app.main import app
+from app.models import PendingAuth, TrustedDevice
+
+CONCURRENCY = 8
+
+
+def pending_session(db, user) -> tuple[int, str]:
+    code = generate_otp()
+    pending = PendingAuth(user_id=user.id, otp_hash=hash_otp(code), ip_address="100.64.0.1",
+                          device_fingerprint=f"race-{user.id}",
+                          expires_at=datetime.now(timezone.utc) + timedelta(minutes=5))
+    db.add(pending)
+    db.commit()
+    return pending.id, code
+
+
+def storm(address: str, pending_auth_id: int, code: str) -> list[str]:
+    client = TestClient(app, client=(address, 40000))
+    start = threading.Barrier(CONCURRENCY)
+
+    def one(_) -> str:
+        start.wait()
+        response = client.post("/auth/verify-otp", json={"pending_auth_id": pending_auth_id, "otp_code": code})
+        return response.json()["message"] if response.status_code == 200 else f"HTTP {response.status_code}"
+
+    with ThreadPoolExecutor(CONCURRENCY) as executor:
+        return list(executor.map(one, range(CONCURRENCY)))
+
+
+def test_correct_code_logs_in_exactly_once(db, make_user):
+    user = make_user()
+    pending_auth_id, code = pending_session(db, user)
+
+    messages = storm("100.64.0.1", pending_auth_id, code)
+
+    assert messages.count("Login successful") == 1, messages
+    assert not [message for message in messages if message.startswith("HTTP")], messages
+    assert db.query(TrustedDevice).filter(TrustedDevice.user_id == user.id).count() == 1
+
+
+def test_wrong_codes_stop_at_the_attempt_limit(db, make_user):
+    user = make_user()
+    pending_auth_id, code = pending_session(db, user)
+    wrong = "000000" if code != "000000" else "111111"
+
+    messages = storm("100.64.0.2", pending_auth_id, wrong)
+
+    assert sum(message.startswith("Invalid OTP") for message in messages) == OTP_ATTEMPT_LIMIT, messages
+    assert db.get(PendingAuth, pending_auth_id).attempts == OTP_ATTEMPT_LIMIT
@@ -0,0 +1,38 @@
+from datetime import datetime, timezone
+
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models import UserProfile
+from app.profiles import get_or_create_profile, record_successful_login
+
+
+def test_creates_a_missing_profile(db, make_user):
+    user = make_user()
+    profile = get_or_create_profile(db, user.id)
+    db.commit()
+
+    assert profile.user_id == user.id
+    assert db.get(UserProfile, user.id) is profile
+
+
+def test_concurrent_first_logins_share_one_profile(db, make_user):
+    user = make_user()
+    record_successful_login(db, user.id, datetime.now(timezone.utc))
+    db.commit()
+
+    # The other login read "no profile" before the first one committed its row
+    other = SessionLocal()
+    reads = []
+
+    def stale_get(*args, **kwargs):
+        reads.append(args)
+        return None if len(reads) == 1 else Session.get(other, *args, **kwargs)
+
+    other.get = stale_get
+    record_successful_login(other, user.id, datetime.now(timezone.utc))
+    other.commit()
+    other.close()
+
+    db.expire_all()
+    assert round(sum(db.get(UserProfile, user.id).hour_histogram), 3) == 2.0  # Both logins counted
@@ -0,0 +1,35 @@
+import io
+
+import bcrypt
+
+from app.database import SessionLocal
+from app.models import User
+from app.provisioning import provision, text_stream
+from tests.conftest import PASSWORD_HASH
+
+
+def test_invalid_utf8_fails_only_its_row():
+    body = (
+        "username,email,password_hash\n"
+        f"utf8-ok,utf8-ok@example.com,{PASSWORD_HASH}\n"
+        f"utf8-bad\xff,utf8-bad@example.com,{PASSWORD_HASH}\n"
+    ).encode("latin-1")
+
+    report = provision(text_stream(io.BytesIO(body)), "csv", workers=1)
+
+    assert report["created"] == 1
+    assert report["errors"] == [{"line": 3, "username": "utf8-bad�", "error": "invalid UTF-8"}]
+
+
+def test_plaintext_passwords_hash_on_spawned_workers():
+    body = "\n".join(
+        f'{{"username": "spawned{n}", "email": "spawned{n}@example.com", "password": "password {n}"}}'
+        for n in range(2)
+    )
+
+    report = provision(text_stream(io.BytesIO(body.encode())), "ndjson", workers=2)
+
+    assert (report["created"], report["hashed"]) == (2, 2)
+    with SessionLocal() as db:
+        user = db.query(User).filter(User.username == "spawned1").one()
+        assert bcrypt.checkpw(b"password 1", user.password_hash.encode())
@@ -0,0 +1,24 @@
+"""
+Every hot query shape must be served by an index. This seeds a modest
+table; benchmarks.explain_hot_queries runs the same check on millions of
+rows, or on PostgreSQL.
+"""
+import pytest
+from sqlalchemy import text
+
+from app.database import engine
+from benchmarks.explain_hot_queries import explain, hot_queries, seed, uses_index
+
+
+@pytest.fixture(scope="module")
+def seeded():
+    seed(rows=50_000, users=1_000)
+    with engine.connect() as connection:
+        connection.execute(text("ANALYZE"))
+
+
+@pytest.mark.parametrize("name, statement", hot_queries(), ids=[name for name, _ in hot_queries()])
+def test_hot_query_uses_an_index(seeded, name, statement):
+    with engine.connect() as connection:
+        plan = explain(connection, statement)
+    assert uses_index(connection.dialect.name, plan), plan
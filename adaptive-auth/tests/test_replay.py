@@ -0,0 +1,53 @@
+import pytest
+
+from app import throttle
+from app.database import SessionLocal
+from app.models import LoginAttempt
+from app.replay import ReplayConfig, replay_attempts, replay_shard, score
+from tests.conftest import PASSWORD
+
+CURRENT = ReplayConfig(name="current")
+
+
+@pytest.fixture
+def history(client, db, make_user, monkeypatch):
+    """A user's logins through the API: two devices trusted by OTP, then a mix of outcomes."""
+    monkeypatch.setattr(throttle.logins, "enabled", False)
+    monkeypatch.setattr(throttle.otp, "enabled", False)
+    user = make_user()
+
+    def login(device: str, password: str = PASSWORD):
+        response = client.post("/auth/login", json={
+            "username": user.username, "password": password, "device_fingerprint": device,
+        }).json()
+        if response.get("require_otp"):
+            client.post("/auth/verify-otp", json={
+                "pending_auth_id": response["pending_auth_id"], "otp_code": response["otp_code"],
+            })
+
+    for device, password in [("laptop", PASSWORD), ("laptop", PASSWORD), ("laptop", "wrong"),
+                             ("phone", "wrong"), ("phone", PASSWORD), ("phone", PASSWORD),
+                             ("laptop", PASSWORD), ("tablet", "wrong")]:
+        login(device, password)
+    return user
+
+
+def test_current_config_reproduces_stored_risk_levels(db, history):
+    rows = list(replay_attempts(db, history.id, history.id + 1))
+
+    replayed = [("high" if score(results, CURRENT)[0] >= CURRENT.threshold else "low") for _, results in rows]
+
+    assert len(rows) == 8
+    assert replayed == [row.risk_level for row, _ in rows]
+    assert replayed.count("high") == 4  # Each device's first login, and the wrong password from a new one
+
+
+def test_attempts_before_score_from_only_build_state(db, history):
+    rows = db.query(LoginAttempt).filter(LoginAttempt.user_id == history.id).order_by(LoginAttempt.id).all()
+    score_from = rows[4].timestamp
+
+    everything, = replay_shard(history.id, history.id + 1, [CURRENT])
+    later, = replay_shard(history.id, history.id + 1, [CURRENT], score_from=score_from)
+
+    assert everything.scored == 8
+    assert later.scored == sum(row.timestamp >= score_from for row in rows)
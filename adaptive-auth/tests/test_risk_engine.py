@@ -0,0 +1,64 @@
+import itertools
+from dataclasses import replace
+
+import pytest
+
+from app import risk_engine
+from app.risk_engine import RISK_THRESHOLD, RiskContext, assess_risk
+
+# Points each signal returns, in registration order: every combination of
+# off, partial and full that the weights allow
+OUTCOMES = {
+    "ip_reputation": (0, 40, 99, 150),
+    "new_device": (False, True),
+    "impossible_travel": (False, True),
+    "atypical_time": (False, True),
+}
+
+
+@pytest.fixture
+def stub_signals(monkeypatch):
+    """Make every signal return a fixed outcome, keeping its weight and cost."""
+    def stub(outcomes: dict):
+        signals = [replace(signal, evaluate=lambda event, context, value=outcomes[signal.name]: value)
+                   for signal in risk_engine.SIGNALS]
+        monkeypatch.setattr(risk_engine, "SIGNALS", signals)
+        monkeypatch.setattr(risk_engine, "_SIGNALS_BY_COST", sorted(signals, key=lambda signal: signal.cost))
+    return stub
+
+
+def assess(full: bool) -> dict:
+    return assess_risk(None, "alice", "192.0.2.1", "laptop", None, None, context=RiskContext(user=None), full=full)
+
+
+def test_every_signal_has_outcomes():
+    assert set(OUTCOMES) == {signal.name for signal in risk_engine.SIGNALS}
+
+
+@pytest.mark.parametrize("values", list(itertools.product(*OUTCOMES.values())))
+def test_short_circuit_reaches_the_full_decision(stub_signals, values):
+    stub_signals(dict(zip(OUTCOMES, values)))
+
+    short, full = assess(full=False), assess(full=True)
+
+    assert short["risk_level"] == full["risk_level"]
+    assert list(short["signals"]) == list(full["signals"]) == list(OUTCOMES)
+    assert not any(result.get("skipped") for result in full["signals"].values())
+    for name, result in short["signals"].items():
+        if result.get("skipped"):
+            assert result == {"flagged": None, "points": 0, "skipped": True}
+        else:
+            assert result == full["signals"][name]
+    assert short["risk_score"] == sum(result["points"] for result in short["signals"].values())
+    assert (short["risk_score"] >= RISK_THRESHOLD) == (short["risk_level"] == "high")
+
+
+def test_cheap_signals_decide_without_the_expensive_ones(stub_signals):
+    stub_signals({"ip_reputation": 150, "new_device": True, "impossible_travel": True, "atypical_time": True})
+
+    result = assess(full=False)
+
+    assert result["risk_score"] == 150
+    assert [name for name, signal in result["signals"].items() if signal.get("skipped")] == [
+        "new_device", "impossible_travel", "atypical_time",
+    ]
@@ -0,0 +1,19 @@
+from app.static_assets import IMMUTABLE, REVALIDATE, StaticSite
+
+
+def test_only_vite_hashed_assets_are_immutable(tmp_path):
+    (tmp_path / "assets").mkdir()
+    for name in ("index.html", "apple-touch-icon.png", "site-webmanifest.json", "assets/index-BGpSfsPs.js",
+                 "assets/logo-large-brand.svg"):
+        (tmp_path / name).write_text("x")
+
+    site = StaticSite(tmp_path)
+    cache_control = {name: f.representations[None].headers["cache-control"] for name, f in site.files.items()}
+
+    assert cache_control == {
+        "index.html": REVALIDATE,
+        "apple-touch-icon.png": REVALIDATE,
+        "site-webmanifest.json": REVALIDATE,
+        "assets/index-BGpSfsPs.js": IMMUTABLE,
+        "assets/logo-large-brand.svg": REVALIDATE,
+    }
@@ -0,0 +1,152 @@
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app import throttle
+from app.auth import generate_otp, hash_otp
+from app.models import LoginAttempt, PendingAuth
+from app.throttle import FileStore, MemoryStore, SlidingWindowLimiter, _retry_after
+from tests.conftest import PASSWORD
+
+WINDOW = 100
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Pins throttle's clock; set clock.now to move it."""
+    class Clock:
+        now = 1000.0  # The start of window 10
+
+    monkeypatch.setattr(throttle.time, "time", lambda: Clock.now)
+    return Clock
+
+
+@pytest.fixture
+def fresh_limiters(monkeypatch):
+    """Empty login and OTP limiters, so earlier tests' hits don't count."""
+    store = MemoryStore(1000)
+    monkeypatch.setattr(throttle, "logins", SlidingWindowLimiter("login", store, 300))
+    monkeypatch.setattr(throttle, "otp", SlidingWindowLimiter("otp", store, 300))
+
+
+def test_sliding_window_counts_and_retry_after(clock):
+    limiter = SlidingWindowLimiter("test", MemoryStore(10), WINDOW)
+    limits = {"key": 4}
+
+    assert [limiter.hit(limits) for _ in range(4)] == [None] * 4
+    assert limiter.hit(limits) == 100  # The whole next window, as this one is full on its own
+
+    clock.now = 1050
+    assert limiter.hit(limits) == 50
+
+    # Halfway through the next window the previous 4 weigh 2, leaving room for 2
+    clock.now = 1150
+    assert [limiter.hit(limits) for _ in range(2)] == [None, None]
+    assert limiter.hit(limits) == 1
+    clock.now = 1151
+    assert limiter.hit(limits) is None
+
+    # Two windows on, nothing is left
+    clock.now = 1300
+    assert limiter.hit(limits) is None
+    assert (limiter.allowed, limiter.rejected) == (8, 3)
+
+
+@pytest.mark.parametrize("state, now, expected", [
+    ((10, 0, 4), 1000, 100),   # Full window: wait it out
+    ((10, 0, 8), 1000, 150),   # Double the limit: its weight has to fall to half
+    ((11, 4, 2), 1125, 25),    # Previous window has to fade from 0.75 to 0.5
+    ((11, 4, 3), 1199, 1),     # Never less than a second
+])
+def test_retry_after(state, now, expected):
+    assert _retry_after(state, 4, now, WINDOW) == expected
+
+
+def test_refund_takes_back_a_hit(clock):
+    limiter = SlidingWindowLimiter("test", MemoryStore(10), WINDOW)
+    limits = {"key": 2}
+
+    limiter.hit(limits)
+    limiter.refund(["key"])
+    assert [limiter.hit(limits) for _ in range(2)] == [None, None]
+    assert limiter.hit(limits) is not None
+
+    # Refunds reach back into the previous window once this one is empty
+    clock.now = 1100
+    limiter.refund(["key"])
+    limiter.refund(["key"])
+    assert [limiter.hit(limits) for _ in range(2)] == [None, None]
+
+
+def test_zero_limit_disables_a_key(clock):
+    limiter = SlidingWindowLimiter("test", MemoryStore(10), WINDOW)
+
+    assert all(limiter.hit({"key": 0}) is None for _ in range(10))
+
+
+def test_file_store_is_shared_between_connections(scratch_dir):
+    path = f"{scratch_dir}/shared-throttle.db"
+    workers = [SlidingWindowLimiter("test", FileStore(path, 300), 300) for _ in range(2)]
+    results = []
+    start = threading.Barrier(4)
+
+    def run(limiter):
+        start.wait()
+        for _ in range(25):
+            results.append(limiter.hit({"shared": 60}))
+
+    # Two stores, two threads each: four connections to one file
+    threads = [threading.Thread(target=run, args=(workers[n % 2],)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results.count(None) == 60
+    assert workers[0].store.size() == workers[1].store.size() == 1
+
+
+def test_throttled_login_is_a_429_with_retry_after(client, db, make_user, fresh_limiters, monkeypatch):
+    monkeypatch.setattr(throttle, "THROTTLE_PAIR_LIMIT", 2)
+    user = make_user()
+    body = {"username": user.username, "password": "wrong", "device_fingerprint": "laptop"}
+
+    statuses = [client.post("/auth/login", json=body).status_code for _ in range(2)]
+    response = client.post("/auth/login", json=body)
+
+    assert statuses == [200, 200]
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    assert response.json()["success"] is False
+    assert db.query(LoginAttempt).filter(LoginAttempt.user_id == user.id,
+                                         LoginAttempt.failure_reason == "throttled").count() == 1
+
+
+def test_successful_logins_are_refunded(client, make_user, fresh_limiters, monkeypatch):
+    monkeypatch.setattr(throttle, "THROTTLE_PAIR_LIMIT", 2)
+    user = make_user(devices=("laptop",))
+    body = {"username": user.username, "password": PASSWORD, "device_fingerprint": "laptop"}
+
+    assert [client.post("/auth/login", json=body).status_code for _ in range(5)] == [200] * 5
+
+
+def test_throttled_otp_submission_does_not_spend_an_attempt(client, db, make_user, fresh_limiters, monkeypatch):
+    monkeypatch.setattr(throttle, "THROTTLE_OTP_IP_LIMIT", 1)
+    user = make_user()
+    code = generate_otp()
+    pending = PendingAuth(user_id=user.id, otp_hash=hash_otp(code), device_fingerprint="laptop",
+                          expires_at=datetime.now(timezone.utc) + timedelta(minutes=5))
+    db.add(pending)
+    db.commit()
+    wrong = "000000" if code != "000000" else "111111"
+
+    first = client.post("/auth/verify-otp", json={"pending_auth_id": pending.id, "otp_code": wrong})
+    second = client.post("/auth/verify-otp", json={"pending_auth_id": pending.id, "otp_code": code})
+
+    assert first.json()["message"].startswith("Invalid OTP")
+    assert second.status_code == 429
+    db.refresh(pending)
+    assert (pending.attempts, pending.is_used) == (1, False)  # The claim was rolled back
+    assert db.query(LoginAttempt).filter(LoginAttempt.user_id == user.id,
+                                         LoginAttempt.failure_reason == "otp_throttled").count() == 1
@@ -0,0 +1,111 @@
+import time
+
+import pytest
+from jose import jwk, jwt
+
+from app import tokens
+from app.config import DEFAULT_SECRET_KEY, JWT_ALGORITHM, JWT_ISSUER
+from app.tokens import InvalidToken, issue_access_token, verify_access_token
+
+
+def signed(kid: str, secret: str, **claims) -> str:
+    now = int(time.time())
+    claims = {"iss": JWT_ISSUER, "sub": "1", "username": "alice", "iat": now, "exp": now + 60,
+              "risk_level": "low", "mfa": False, **claims}
+    return jwt.encode(claims, secret, algorithm=JWT_ALGORITHM, headers={"kid": kid})
+
+
+@pytest.fixture
+def rotated(monkeypatch):
+    """Keys as after step 1 of a rotation: "new" signs, "old" still verifies."""
+    keys = {"new": "new-secret", "old": "old-secret"}
+    monkeypatch.setattr(tokens, "KEYS", {kid: jwk.construct(secret, JWT_ALGORITHM) for kid, secret in keys.items()})
+    monkeypatch.setattr(tokens, "SIGNING_KID", "new")
+    return keys
+
+
+def test_issued_tokens_verify(client):
+    token = issue_access_token(7, "alice", "medium", mfa=True)
+
+    claims = verify_access_token(token)
+
+    assert (claims["sub"], claims["username"], claims["risk_level"], claims["mfa"]) == ("7", "alice", "medium", True)
+    assert claims["amr"] == ["pwd", "otp"]
+    assert claims["kid"] == tokens.SIGNING_KID
+    assert client.post("/auth/introspect", json={"token": token}).json()["active"] is True
+
+
+def test_tampered_and_foreign_tokens_are_rejected(client):
+    token = issue_access_token(7, "alice", "low", mfa=False)
+    header, payload, signature = token.split(".")
+    forged = signed(tokens.SIGNING_KID, "not-the-key")
+
+    for bad in [f"{header}.{payload}.{signature[::-1]}", forged, "not a token"]:
+        with pytest.raises(InvalidToken):
+            verify_access_token(bad)
+        assert client.post("/auth/introspect", json={"token": bad}).json() == {"active": False}
+
+
+def test_unknown_kid_is_rejected():
+    token = signed("retired", "whatever")
+
+    with pytest.raises(InvalidToken, match="unknown key id 'retired'"):
+        verify_access_token(token)
+
+
+def test_expired_tokens_are_rejected():
+    token = signed(tokens.SIGNING_KID, "ignored", exp=int(time.time()) - 1)
+
+    with pytest.raises(InvalidToken):
+        verify_access_token(token)
+
+
+def test_cached_tokens_still_expire(monkeypatch):
+    tokens.verified.clear()
+    token = issue_access_token(7, "alice", "low", mfa=False)
+    expires = verify_access_token(token)["exp"]
+
+    monkeypatch.setattr(tokens.time, "time", lambda: expires)
+    with pytest.raises(InvalidToken, match="expired"):
+        verify_access_token(token)
+    assert not tokens.verified._entries
+
+
+def test_rotation_signs_with_the_new_key_and_accepts_the_old(rotated):
+    old = signed("old", rotated["old"])
+    new = issue_access_token(7, "alice", "low", mfa=False)
+
+    assert jwt.get_unverified_header(new)["kid"] == "new"
+    assert verify_access_token(new)["kid"] == "new"
+    assert verify_access_token(old)["kid"] == "old"
+    with pytest.raises(InvalidToken):
+        verify_access_token(signed("old", rotated["new"]))  # Right kid, wrong key
+
+
+def test_verified_tokens_are_cached_by_digest(monkeypatch):
+    tokens.verified.clear()
+    token = issue_access_token(7, "alice", "low", mfa=False)
+    first = verify_access_token(token)
+
+    def decode(*args, **kwargs):
+        raise AssertionError("cached token was decoded again")
+
+    monkeypatch.setattr(tokens.jwt, "decode", decode)
+    again = verify_access_token(token)
+    again["username"] = "mallory"  # Callers get a copy, not the cached claims
+
+    assert verify_access_token(token) == first
+    assert all(isinstance(key, bytes) and token.encode() != key for key in tokens.verified._entries)
+
+
+def test_public_default_secret_refuses_to_start_outside_the_demo(monkeypatch):
+    monkeypatch.setattr(tokens, "_secrets", {"default": DEFAULT_SECRET_KEY})
+    monkeypatch.setattr(tokens, "DEMO_MODE", True)
+    tokens.check_signing_keys()
+
+    monkeypatch.setattr(tokens, "DEMO_MODE", False)
+    with pytest.raises(RuntimeError, match="SECRET_KEY"):
+        tokens.check_signing_keys()
+
+    monkeypatch.setattr(tokens, "_secrets", {"default": "a real secret"})
+    tokens.check_signing_keys()
@@ -0,0 +1,58 @@
+import threading
+
+from fastapi.testclient import TestClient
+
+from app import main
+from app.warmup import Warmer
+
+
+def test_ready_answers_503_until_the_warm_up_finishes(monkeypatch):
+    release = threading.Event()
+
+    def slow():
+        release.wait(5)
+        return {}
+
+    monkeypatch.setattr(main, "warmer", Warmer(enabled=True, steps={"database": lambda: {}, "slow": slow}))
+
+    with TestClient(main.app) as client:
+        warming = client.get("/health/ready")
+        assert client.get("/health/live").status_code == 200
+        release.set()
+        assert main.warmer.wait(5)
+        ready = client.get("/health/ready")
+
+    assert (warming.status_code, warming.json()["status"]) == (503, "warming")
+    assert (ready.status_code, ready.json()["status"]) == (200, "ready")
+    assert set(ready.json()["steps"]) == {"database", "slow"}
+
+
+def test_failed_steps_other_than_the_database_do_not_hold_back_readiness():
+    def broken():
+        raise OSError("no frontend build")
+
+    warmer = Warmer(enabled=True, steps={"database": lambda: {}, "static": broken})
+    warmer.start()
+
+    assert warmer.wait(5)
+    assert warmer.last_error == "static: OSError: no frontend build"
+    assert set(warmer.results) == {"database"}
+    warmer.stop()
+
+
+def test_database_step_is_retried_until_it_succeeds(monkeypatch):
+    monkeypatch.setattr("app.warmup.DB_RETRY_SECONDS", 0.01)
+    calls = []
+
+    def flaky():
+        calls.append(None)
+        if len(calls) < 3:
+            raise ConnectionError("database is starting")
+        return {}
+
+    warmer = Warmer(enabled=True, steps={"database": flaky})
+    warmer.start()
+
+    assert warmer.wait(5)
+    assert len(calls) == 3
+    warmer.stop()